@@ -0,0 +1,251 @@
+from __future__ import annotations
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser, Namespace
+from contextlib import contextmanager, redirect_stdout
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Callable, Tuple
+
+from cluster import ClusterSpec
+from constants import HasConstants
+from component import ComponentFactory, FileDiscoverable, DecompressRequired, DownloadRequired, TemplateRequired
+from docker_compose import build_components, generate_yaml
+from main import parse_arg
+from utils import DictUtil, DownloadUtil, TemplateUtil
+
+# Benchmarks of generator hot paths. Run from repository root
+#   python -m benchmarks.run --output bench.json
+#   python -m benchmarks.run --baseline bench.json   # compare, exits 1 if any median regressed over tolerance
+
+
+class Benchmark:
+    def __init__(self, name: str, func: Callable[[object], None], setup: Callable[[], object] = None,
+                 teardown: Callable[[object], None] = None, repeat: int = 10, params: dict = None):
+        self.name = name
+        self.func = func
+        self.setup = setup or (lambda: None)
+        self.teardown = teardown or (lambda _: None)
+        self.repeat = repeat
+        self.params = params or {}
+
+    def run(self, repeat: int = None) -> dict:
+        timings = []
+        for _ in range(repeat or self.repeat):
+            state = self.setup()
+            start = time.perf_counter()
+            self.func(state)
+            timings.append(time.perf_counter() - start)
+            self.teardown(state)
+        return {
+            "params": self.params, "repeat": len(timings), "min_s": min(timings), "max_s": max(timings),
+            "mean_s": statistics.mean(timings), "median_s": statistics.median(timings),
+            "stdev_s": statistics.stdev(timings) if len(timings) > 1 else 0.0
+        }
+
+
+@contextmanager
+def temporary_target():
+    original = HasConstants.TARGET_BASE_PATH
+    HasConstants.TARGET_BASE_PATH = tempfile.mkdtemp(prefix="spawningpool-bench-")
+    try:
+        yield HasConstants.TARGET_BASE_PATH
+    finally:
+        shutil.rmtree(HasConstants.TARGET_BASE_PATH, ignore_errors=True)
+        HasConstants.TARGET_BASE_PATH = original
+
+
+def quiet(func: Callable) -> Callable:
+    def wrapped(*args, **kwargs):
+        with redirect_stdout(io.StringIO()):
+            return func(*args, **kwargs)
+    return wrapped
+
+
+def compose_benchmarks() -> list[Benchmark]:
+    benchmarks = []
+    for num_datanode in [1, 10, 100, 500]:
+        args = parse_arg(["--all", "--num-datanode", str(num_datanode), "--num-presto-worker", str(num_datanode)])
+        benchmarks.append(Benchmark("compose[{}]".format(num_datanode),
+                                    lambda _, a=args: generate_yaml(build_components(ClusterSpec.from_args(a))),
+                                    repeat=5 if num_datanode > 100 else 10, params={"num_datanode": num_datanode}))
+    return benchmarks
+
+
+def template_benchmark() -> Benchmark:
+    args = parse_arg(["--all", "--num-datanode", "3"])
+    spec = ClusterSpec.from_args(args)
+    templatables = list(filter(lambda c: isinstance(c, TemplateRequired), ComponentFactory.get_components(args, spec)))
+    return Benchmark("template[all]", quiet(lambda _: TemplateUtil.do_template(templatables, spec.template_data)),
+                     repeat=5,
+                     params={"components": len(templatables)})
+
+
+def discover_benchmark() -> Benchmark:
+    pattern = ".*\\.{EXTENSION}$".format(EXTENSION=HasConstants.TEMPLATE_EXTENSION)
+    return Benchmark("discover", lambda _: FileDiscoverable.discover(HasConstants.BASE_PATH, pattern), repeat=20)
+
+
+def dict_merge_benchmark() -> Benchmark:
+    def nested(width: int, depth: int, prefix: str) -> dict:
+        if depth == 0:
+            return {"{}{}".format(prefix, i): i for i in range(width)}
+        return {"{}{}".format(prefix, i): nested(width, depth - 1, prefix) for i in range(width)}
+
+    merge = nested(8, 4, "k")
+    return Benchmark("dict_merge", lambda base: DictUtil.dict_merge(base, merge),
+                     setup=lambda: nested(8, 4, "k"), repeat=20, params={"width": 8, "depth": 4})
+
+
+def decompress_benchmark(workdir: str) -> Benchmark:
+    num_files, file_size = 2000, 8 * 1024
+    tarball = Path(workdir, "synthetic.tar.gz")
+    with tarfile.open(tarball, "w:gz") as f:
+        payload = os.urandom(file_size)
+        for i in range(num_files):
+            info = tarfile.TarInfo("share/lib{}/file{}.jar".format(i % 20, i))
+            info.size = file_size
+            f.addfile(info, io.BytesIO(payload))
+    dest = Path(workdir, "extracted")
+    return Benchmark("decompress", lambda _: DecompressRequired._decompress(tarball, dest),
+                     teardown=lambda _: shutil.rmtree(dest), repeat=5,
+                     params={"files": num_files, "file_size": file_size})
+
+
+class ThrottledHandler(BaseHTTPRequestHandler):
+    size = 0
+    bytes_per_second = 0
+    chunk = 64 * 1024
+
+    def do_GET(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Length", str(self.size))
+        self.end_headers()
+        payload = b"\0" * self.chunk
+        sent = 0
+        while sent < self.size:
+            to_send = min(self.chunk, self.size - sent)
+            self.wfile.write(payload[:to_send])
+            sent += to_send
+            time.sleep(to_send / self.bytes_per_second)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class LocalDownload(DownloadRequired):
+    def __init__(self, url: str, output_dir: str):
+        DownloadRequired.__init__(self, force_download=True)
+        self.url = url
+        self.output_dir = output_dir
+
+    @property
+    def component_base_dir(self) -> str:
+        return self.output_dir
+
+    @property
+    def links_to_download(self) -> list[Tuple[str, Path]]:
+        return [(self.url, Path(self.output_dir, "artifact.tar.gz"))]
+
+
+def download_benchmark(workdir: str) -> Tuple[Benchmark, ThreadingHTTPServer]:
+    num_artifacts, size, bytes_per_second = 4, 4 * 1024 * 1024, 32 * 1024 * 1024
+    ThrottledHandler.size = size
+    ThrottledHandler.bytes_per_second = bytes_per_second
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottledHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}/artifact.tar.gz".format(server.server_address[1])
+    downloadables = [LocalDownload(url, os.path.join(workdir, "download{}".format(i))) for i in range(num_artifacts)]
+    return Benchmark("download", quiet(lambda _: DownloadUtil.download_all(downloadables)), repeat=3,
+                     params={"artifacts": num_artifacts, "size": size, "bytes_per_second": bytes_per_second}), server
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    # Report is on stdout without --output, the table goes to stderr
+    print("{:<16} {:>12} {:>12} {:>8}".format("BENCHMARK", "BASE(ms)", "NOW(ms)", "RATIO"), file=sys.stderr)
+    for name, result in results.items():
+        if name not in baseline:
+            print("{:<16} {:>12} {:>12.3f} {:>8}".format(name, "-", result["median_s"] * 1000, "new"),
+                  file=sys.stderr)
+            continue
+        if baseline[name]["median_s"] <= 0:
+            # Below timer resolution, no ratio to compare with
+            print("{:<16} {:>12.3f} {:>12.3f} {:>8}".format(name, baseline[name]["median_s"] * 1000,
+                                                         result["median_s"] * 1000, "n/a"), file=sys.stderr)
+            continue
+        ratio = result["median_s"] / baseline[name]["median_s"]
+        mark = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            mark = " REGRESSED"
+        print("{:<16} {:>12.3f} {:>12.3f} {:>8.2f}{}".format(name, baseline[name]["median_s"] * 1000,
+                                                          result["median_s"] * 1000, ratio, mark), file=sys.stderr)
+    return regressions
+
+
+def parse_bench_arg() -> Namespace:
+    parser = ArgumentParser(description="Benchmark generator hot paths")
+    parser.add_argument("--output", help="Write results as JSON to this path. Default stdout")
+    parser.add_argument("--baseline", help="Results JSON of previous run to compare with")
+    parser.add_argument("--tolerance", default=0.1, type=float,
+                        help="Allowed slowdown of median against baseline before failing. Default 0.1(10%%)")
+    parser.add_argument("--filter", default=".*", help="Regex of benchmark names to run")
+    parser.add_argument("--repeat", type=int, help="Override repetitions of every benchmark")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_bench_arg()
+    workdir = tempfile.mkdtemp(prefix="spawningpool-bench-")
+    server = None
+    try:
+        with temporary_target():
+            benchmarks = compose_benchmarks() + [template_benchmark(), discover_benchmark(), dict_merge_benchmark(),
+                                                 decompress_benchmark(workdir)]
+            download, server = download_benchmark(workdir)
+            benchmarks.append(download)
+            results = {}
+            for benchmark in benchmarks:
+                if not re.search(args.filter, benchmark.name):
+                    continue
+                results[benchmark.name] = benchmark.run(args.repeat)
+                print("{}: median {:.3f}ms".format(benchmark.name, results[benchmark.name]["median_s"] * 1000),
+                      file=sys.stderr)
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "timestamp": time.time()},
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressed: {}".format(", ".join(regressions)), file=sys.stderr)
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,461 @@
+from __future__ import annotations
+import json
+import os
+import platform
+import re
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from argparse import ArgumentParser, Namespace
+from typing import Iterator, List
+
+from constants import HasConstants
+
+# Workload benchmarks against a running cluster generated by main.py. Commands run through the agent of each
+# instance(POST /bench), results are tagged with target/topology.json. Run from repository root once cluster is up
+#   python -m benchmarks.workload --output workload.json
+#   python -m benchmarks.workload --suite dfsio,terasort --transport http   # from a container in hadoop.net
+
+
+class WorkloadError(Exception):
+    pass
+
+
+# How commands and HTTP requests reach the cluster. Replace it(see run()/presto()) to run the suite against stubs
+class ClusterClient:
+    # -> {"returncode", "stdout", "stderr", "elapsed_s"} of command run on the instance serving host
+    def run(self, host: str, command: str, timeout: float) -> dict:
+        raise NotImplementedError
+
+    # Base URL of a service port reachable from where the benchmark runs
+    def url(self, endpoint: dict, port_name: str) -> str:
+        raise NotImplementedError
+
+    # -> {"rows", "elapsed_s", "stats"} of a query through presto REST API
+    def presto(self, endpoint: dict, sql: str, catalog: str, schema: str, timeout: float) -> dict:
+        start = time.monotonic()
+        request = urllib.request.Request(self.url(endpoint, "port") + "/v1/statement", data=sql.encode("UTF-8"),
+                                         headers={"X-Presto-User": "bench", "X-Presto-Catalog": catalog,
+                                                  "X-Presto-Schema": schema})
+        rows = 0
+        while request:
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    result = json.load(response)
+            except urllib.error.URLError as e:
+                raise WorkloadError("Presto is unreachable: {}".format(e))
+            if "error" in result:
+                raise WorkloadError("Presto query failed: {}".format(result["error"].get("message")))
+            rows += len(result.get("data", []))
+            request = urllib.request.Request(result["nextUri"]) if "nextUri" in result else None
+        return {"rows": rows, "elapsed_s": time.monotonic() - start, "stats": result.get("stats", {})}
+
+
+# From docker host. Agent port isn't published, so it is called by curl inside the container
+class DockerClient(ClusterClient):
+    def __init__(self, topology: dict):
+        self.containers = topology["containers"]
+        self.agent_port = topology["agent_port"]
+
+    def run(self, host: str, command: str, timeout: float) -> dict:
+        process = subprocess.run(
+            ["docker", "exec", "-i", self.containers[host], "curl", "-sS", "-XPOST", "--data-binary", "@-",
+             "-H", "Content-Type: application/json", "http://localhost:{}/bench".format(self.agent_port)],
+            input=json.dumps({"command": command, "timeout": timeout}), stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, universal_newlines=True)
+        if process.returncode != 0:
+            raise WorkloadError("Agent of {} is unreachable: {}".format(host, process.stderr.strip()))
+        return json.loads(process.stdout)
+
+    def url(self, endpoint: dict, port_name: str) -> str:
+        port = endpoint["ports"][port_name]
+        published = [host_port for host_port, container_port in endpoint["published"] if container_port == port]
+        if not published:
+            raise WorkloadError("Port {} of {} is not published".format(port_name, endpoint["host"]))
+        return "http://localhost:{}".format(published[0])
+
+
+# From a container attached to hadoop.net, where every alias and the agent port are reachable
+class HttpClient(ClusterClient):
+    def __init__(self, topology: dict):
+        self.agent_port = topology["agent_port"]
+
+    def run(self, host: str, command: str, timeout: float) -> dict:
+        request = urllib.request.Request("http://{}:{}/bench".format(host, self.agent_port),
+                                         data=json.dumps({"command": command, "timeout": timeout}).encode("UTF-8"),
+                                         headers={"Content-Type": "application/json"})
+        try:
+            # Agent gives up on command after timeout, wait a bit longer for its answer
+            with urllib.request.urlopen(request, timeout=timeout + 60) as response:
+                return json.load(response)
+        except urllib.error.URLError as e:
+            raise WorkloadError("Agent of {} is unreachable: {}".format(host, e))
+
+    def url(self, endpoint: dict, port_name: str) -> str:
+        return "http://{}:{}".format(endpoint["host"], endpoint["ports"][port_name])
+
+
+def run_checked(client: ClusterClient, host: str, command: str, timeout: float) -> dict:
+    result = client.run(host, command, timeout)
+    if result["returncode"] != 0:
+        output = (result["stderr"] or result["stdout"]).strip().splitlines()
+        raise WorkloadError("`{}` on {} exited with {}: {}".format(command, host, result["returncode"],
+                                                                  "\n".join(output[-5:])))
+    return result
+
+
+def timings(runs: List[float]) -> dict:
+    return {"runs_s": runs, "min_s": min(runs), "median_s": statistics.median(runs), "max_s": max(runs)}
+
+
+# Results are yielded step by step, so steps done before a failure are still reported
+class Workload:
+    name = ""
+    # Components(keys of topology["components"]) the workload needs
+    requires = ()
+
+    def run(self, client: ClusterClient, topology: dict) -> Iterator[dict]:
+        raise NotImplementedError
+
+
+class DfsIo(Workload):
+    name = "dfsio"
+    JAR = "$HADOOP_HOME/share/hadoop/mapreduce/hadoop-mapreduce-client-jobclient-*-tests.jar"
+    # Labels of the summary TestDFSIO logs
+    METRICS = {
+        "throughput_mb_s": "Throughput mb/sec", "average_io_rate_mb_s": "Average IO rate mb/sec",
+        "io_rate_stddev": "IO rate std deviation", "exec_time_s": "Test exec time sec"
+    }
+
+    def __init__(self, files: int, size: str, timeout: float):
+        self.files = files
+        self.size = size
+        self.timeout = timeout
+
+    @classmethod
+    def parse(cls, output: str) -> dict:
+        metrics = {}
+        for key, label in cls.METRICS.items():
+            found = re.findall(re.escape(label) + r":\s*([\d.]+)", output)
+            if found:
+                metrics[key] = float(found[-1])
+        return metrics
+
+    def run(self, client: ClusterClient, topology: dict) -> Iterator[dict]:
+        host = topology["datanodes"][0]["host"]
+        command = "hadoop jar {} TestDFSIO -{{}} -nrFiles {} -size {} -resFile /tmp/TestDFSIO_results.log".format(
+            self.JAR, self.files, self.size)
+        try:
+            # Read reads what write has written
+            for mode in ["write", "read"]:
+                result = run_checked(client, host, command.format(mode), self.timeout)
+                yield dict(self.parse(result["stdout"] + result["stderr"]), name=mode, elapsed_s=result["elapsed_s"],
+                           files=self.files, size=self.size)
+        finally:
+            client.run(host, "hadoop jar {} TestDFSIO -clean".format(self.JAR), self.timeout)
+
+
+class TeraSort(Workload):
+    name = "terasort"
+    JAR = "$HADOOP_HOME/share/hadoop/mapreduce/hadoop-mapreduce-examples-*.jar"
+    BASE_DIR = "/bench/terasort"
+    ROW_BYTES = 100
+
+    def __init__(self, rows: int, timeout: float):
+        self.rows = rows
+        self.timeout = timeout
+
+    def run(self, client: ClusterClient, topology: dict) -> Iterator[dict]:
+        host = topology["datanodes"][0]["host"]
+        data_dir, sorted_dir, report_dir = (self.BASE_DIR + "/" + d for d in ["input", "output", "report"])
+        steps = [
+            ("teragen", "teragen {} {}".format(self.rows, data_dir)),
+            ("terasort", "terasort {} {}".format(data_dir, sorted_dir)),
+            ("teravalidate", "teravalidate {} {}".format(sorted_dir, report_dir))
+        ]
+        clean = "hdfs dfs -rm -r -f -skipTrash " + self.BASE_DIR
+        mb = self.rows * self.ROW_BYTES / (1024 * 1024)
+        client.run(host, clean, self.timeout)
+        try:
+            for name, step in steps:
+                result = run_checked(client, host, "hadoop jar {} {}".format(self.JAR, step), self.timeout)
+                yield {"name": name, "elapsed_s": result["elapsed_s"], "rows": self.rows,
+                       "throughput_mb_s": mb / result["elapsed_s"]}
+        finally:
+            client.run(host, clean, self.timeout)
+
+
+# Star schema shaped after TPC-DS store_sales/date_dim/item, generated in hive so nothing has to be uploaded.
+# Shared by hive and presto workloads, created once per run
+class TpcdsDataset:
+    DATABASE = "bench"
+    DAYS = 5 * 365
+    ITEMS = 18000
+    QUERIES = {
+        # TPC-DS q3, q42, q52 and q55 with fixed substitutions, plus a full scan
+        "q3": "SELECT d.d_year, i.i_brand_id, i.i_brand, sum(ss.ss_ext_sales_price) AS sum_agg "
+              "FROM {db}.date_dim d JOIN {db}.store_sales ss ON d.d_date_sk = ss.ss_sold_date_sk "
+              "JOIN {db}.item i ON ss.ss_item_sk = i.i_item_sk WHERE i.i_manufact_id = 28 AND d.d_moy = 11 "
+              "GROUP BY d.d_year, i.i_brand, i.i_brand_id ORDER BY d.d_year, sum_agg DESC, i.i_brand_id LIMIT 100",
+        "q42": "SELECT d.d_year, i.i_category_id, i.i_category, sum(ss.ss_ext_sales_price) AS total "
+               "FROM {db}.date_dim d JOIN {db}.store_sales ss ON d.d_date_sk = ss.ss_sold_date_sk "
+               "JOIN {db}.item i ON ss.ss_item_sk = i.i_item_sk "
+               "WHERE i.i_manager_id = 1 AND d.d_moy = 11 AND d.d_year = 2000 "
+               "GROUP BY d.d_year, i.i_category_id, i.i_category "
+               "ORDER BY total DESC, d.d_year, i.i_category_id, i.i_category LIMIT 100",
+        "q52": "SELECT d.d_year, i.i_brand_id, i.i_brand, sum(ss.ss_ext_sales_price) AS ext_price "
+               "FROM {db}.date_dim d JOIN {db}.store_sales ss ON d.d_date_sk = ss.ss_sold_date_sk "
+               "JOIN {db}.item i ON ss.ss_item_sk = i.i_item_sk "
+               "WHERE i.i_manager_id = 1 AND d.d_moy = 11 AND d.d_year = 2000 "
+               "GROUP BY d.d_year, i.i_brand, i.i_brand_id ORDER BY d.d_year, ext_price DESC, i.i_brand_id LIMIT 100",
+        "q55": "SELECT i.i_brand_id, i.i_brand, sum(ss.ss_ext_sales_price) AS ext_price "
+               "FROM {db}.date_dim d JOIN {db}.store_sales ss ON d.d_date_sk = ss.ss_sold_date_sk "
+               "JOIN {db}.item i ON ss.ss_item_sk = i.i_item_sk "
+               "WHERE i.i_manager_id = 13 AND d.d_moy = 11 AND d.d_year = 1999 "
+               "GROUP BY i.i_brand, i.i_brand_id ORDER BY ext_price DESC, i.i_brand_id LIMIT 100",
+        "scan": "SELECT count(*), sum(ss.ss_quantity), sum(ss.ss_ext_sales_price) FROM {db}.store_sales ss"
+    }
+
+    def __init__(self, rows: int, timeout: float):
+        self.rows = rows
+        self.timeout = timeout
+        self.prepared = None
+
+    @staticmethod
+    def _sequence(count: int) -> str:
+        return "(SELECT posexplode(split(space({}), ' ')) AS (pos, val)) t".format(count - 1)
+
+    @property
+    def ddl(self) -> str:
+        db = self.DATABASE
+        return ";\n".join([
+            "CREATE DATABASE IF NOT EXISTS " + db,
+            "DROP TABLE IF EXISTS {}.date_dim".format(db),
+            "DROP TABLE IF EXISTS {}.item".format(db),
+            "DROP TABLE IF EXISTS {}.store_sales".format(db),
+            "CREATE TABLE {}.date_dim STORED AS ORC AS SELECT pos AS d_date_sk, 1998 + pos DIV 365 AS d_year, "
+            "1 + (pos % 365) DIV 31 AS d_moy FROM {}".format(db, self._sequence(self.DAYS)),
+            "CREATE TABLE {}.item STORED AS ORC AS SELECT pos AS i_item_sk, pos % 1000 AS i_brand_id, "
+            "concat('brand#', pos % 1000) AS i_brand, pos % 10 AS i_category_id, "
+            "concat('category#', pos % 10) AS i_category, pos % 100 AS i_manufact_id, pos % 20 AS i_manager_id "
+            "FROM {}".format(db, self._sequence(self.ITEMS)),
+            "CREATE TABLE {}.store_sales STORED AS ORC AS SELECT pmod(hash(pos, 1), {}) AS ss_sold_date_sk, "
+            "pmod(hash(pos, 2), {}) AS ss_item_sk, 1 + pmod(hash(pos, 3), 100) AS ss_quantity, "
+            "CAST(pmod(hash(pos, 4), 20000) / 100 AS DECIMAL(7,2)) AS ss_ext_sales_price "
+            "FROM {}".format(db, self.DAYS, self.ITEMS, self._sequence(self.rows)),
+            ""
+        ])
+
+    def prepare(self, client: ClusterClient, topology: dict) -> dict:
+        if self.prepared is None:
+            result = run_checked(client, topology["endpoints"]["hive_server"]["host"], Hive.beeline(topology, self.ddl),
+                                 self.timeout)
+            self.prepared = {"name": "load", "elapsed_s": result["elapsed_s"], "rows": self.rows}
+        return self.prepared
+
+
+class Hive(Workload):
+    name = "hive"
+    requires = ("hive",)
+
+    def __init__(self, dataset: TpcdsDataset, repeat: int, timeout: float):
+        self.dataset = dataset
+        self.repeat = repeat
+        self.timeout = timeout
+
+    @staticmethod
+    def beeline(topology: dict, sql: str) -> str:
+        server = topology["endpoints"]["hive_server"]
+        url = "jdbc:hive2://{}:{}/default;auth=noSasl".format(server["host"], server["ports"]["thrift-port"])
+        return "$HIVE_HOME/bin/beeline -u {} --outputformat=csv2 -e {}".format(shlex.quote(url), shlex.quote(sql))
+
+    def run(self, client: ClusterClient, topology: dict) -> Iterator[dict]:
+        yield self.dataset.prepare(client, topology)
+        host = topology["endpoints"]["hive_server"]["host"]
+        for name, query in self.dataset.QUERIES.items():
+            runs, query_runs = [], []
+            for _ in range(self.repeat):
+                result = run_checked(client, host, self.beeline(topology, query.format(db=self.dataset.DATABASE)),
+                                     self.timeout)
+                runs.append(result["elapsed_s"])
+                # Time HiveServer2 reports, without beeline JVM start up
+                reported = re.findall(r"rows? selected \(([\d.]+) seconds\)", result["stderr"] + result["stdout"])
+                if reported:
+                    query_runs.append(float(reported[-1]))
+            yield dict(timings(runs), name=name,
+                       query_median_s=statistics.median(query_runs) if query_runs else None)
+
+
+class Presto(Workload):
+    name = "presto"
+    # Queries hive tables through the hive catalog
+    requires = ("presto", "hive")
+
+    def __init__(self, dataset: TpcdsDataset, repeat: int, timeout: float):
+        self.dataset = dataset
+        self.repeat = repeat
+        self.timeout = timeout
+
+    def run(self, client: ClusterClient, topology: dict) -> Iterator[dict]:
+        self.dataset.prepare(client, topology)
+        endpoint = topology["endpoints"]["presto_server"]
+        for name, query in self.dataset.QUERIES.items():
+            runs = []
+            for _ in range(self.repeat):
+                result = client.presto(endpoint, query.format(db=self.dataset.DATABASE), "hive",
+                                       self.dataset.DATABASE, self.timeout)
+                runs.append(result["elapsed_s"])
+            stats = result["stats"]
+            yield dict(timings(runs), name=name, rows=result["rows"], processed_rows=stats.get("processedRows"),
+                       processed_bytes=stats.get("processedBytes"), cpu_time_ms=stats.get("cpuTimeMillis"))
+
+
+# Start up latency of JVMs with and without class data sharing: the JDK archive of the hadoop image(HADOOP_OPTS) and
+# archives of daemons(java 11, templates/hadoop/scripts/cds.sh). A CLI call is timed as a whole. Daemons of the last
+# datanode are actually restarted, timed from launch until their web server answers, and left running. Runs with and
+# without are interleaved, so load of the host affects both alike
+class JvmStartup(Workload):
+    name = "jvm"
+    CLI = {"hdfs-ls": "hdfs dfs -ls /"}
+    # name -> (launcher, options variable of the daemon, port it answers on once up)
+    DAEMONS = {
+        "datanode": ("hdfs", "HDFS_DATANODE_OPTS", 9864),
+        "nodemanager": ("yarn", "YARN_NODEMANAGER_OPTS", 8042)
+    }
+    WITHOUT_CDS = "HADOOP_OPTS=-Xshare:off "
+
+    def __init__(self, repeat: int, timeout: float):
+        self.repeat = repeat
+        self.timeout = timeout
+
+    @classmethod
+    def restart(cls, name: str, with_cds: bool) -> str:
+        launcher, opts, port = cls.DAEMONS[name]
+        env = '{}="$(/scripts/cds.sh {})" '.format(opts, name) if with_cds else cls.WITHOUT_CDS + opts + "=-Xshare:off "
+        # Bracketed, so the pattern doesn't match the shell running this command
+        process = "-Dproc_[{}]{}".format(name[0], name[1:])
+        return ("pkill -f -- '{process}'; while pgrep -f -- '{process}' > /dev/null; do sleep 0.1; done; "
+                "start=$(date +%s%N); {env}$HADOOP_HOME/bin/{launcher} --daemon start {name} && "
+                "until curl -s -o /dev/null http://localhost:{port}/; do sleep 0.05; done; "
+                "echo $(( $(date +%s%N) - start ))").format(process=process, name=name, env=env, launcher=launcher,
+                                                            port=port)
+
+    def command(self, name: str, with_cds: bool) -> str:
+        if name in self.CLI:
+            return ("" if with_cds else self.WITHOUT_CDS) + self.CLI[name]
+        return self.restart(name, with_cds)
+
+    # Restarts print nanoseconds from launch until up, stopping the daemon before isn't timed
+    def elapsed(self, name: str, result: dict) -> float:
+        if name in self.CLI:
+            return result["elapsed_s"]
+        return int(result["stdout"].strip().splitlines()[-1]) / 1e9
+
+    def run(self, client: ClusterClient, topology: dict) -> Iterator[dict]:
+        host = topology["datanodes"][-1]["host"]
+        for name in list(self.CLI) + list(self.DAEMONS):
+            with_cds, without_cds = [], []
+            for _ in range(self.repeat):
+                with_cds.append(self.elapsed(name, run_checked(client, host, self.command(name, True), self.timeout)))
+                without_cds.append(self.elapsed(name, run_checked(client, host, self.command(name, False),
+                                                                  self.timeout)))
+            with_cds, without_cds = timings(with_cds), timings(without_cds)
+            yield dict(with_cds, name=name, without_cds=without_cds,
+                       speedup=without_cds["median_s"] / with_cds["median_s"])
+
+
+class WorkloadRunner:
+    def __init__(self, topology: dict, client: ClusterClient, workloads: List[Workload]):
+        self.topology = topology
+        self.client = client
+        self.workloads = workloads
+
+    def run(self) -> List[dict]:
+        results = []
+        for workload in self.workloads:
+            missing = [c for c in workload.requires if not self.topology["components"].get(c)]
+            if missing:
+                print("{}: skipped, {} not enabled".format(workload.name, ", ".join(missing)), file=sys.stderr)
+                results.append({"workload": workload.name, "skipped": "{} not enabled".format(", ".join(missing))})
+                continue
+            try:
+                for result in workload.run(self.client, self.topology):
+                    print("{}[{}]: {:.3f}s".format(workload.name, result["name"],
+                                                  result.get("median_s", result.get("elapsed_s"))), file=sys.stderr)
+                    results.append(dict(result, workload=workload.name))
+            except WorkloadError as e:
+                # One failing workload shouldn't throw away results of the others
+                print("{}: failed, {}".format(workload.name, e), file=sys.stderr)
+                results.append({"workload": workload.name, "error": str(e)})
+        return results
+
+
+def build_workloads(args: Namespace) -> List[Workload]:
+    dataset = TpcdsDataset(args.hive_rows, args.timeout)
+    workloads = {
+        "dfsio": lambda: DfsIo(args.dfsio_files, args.dfsio_size, args.timeout),
+        "terasort": lambda: TeraSort(args.terasort_rows, args.timeout),
+        "hive": lambda: Hive(dataset, args.repeat, args.timeout),
+        "presto": lambda: Presto(dataset, args.repeat, args.timeout),
+        "jvm": lambda: JvmStartup(args.repeat, args.timeout)
+    }
+    suite = [name.strip() for name in args.suite.split(",")]
+    unknown = [name for name in suite if name not in workloads]
+    if unknown:
+        raise ValueError("Unknown workload {}, choose from {}".format(", ".join(unknown), ", ".join(workloads)))
+    return [workloads[name]() for name in suite]
+
+
+def parse_workload_arg(argv: list[str] = None) -> Namespace:
+    parser = ArgumentParser(description="Benchmark workloads on a running cluster")
+    parser.add_argument("--suite", default="dfsio,terasort,hive,presto",
+                        help="Comma separated workloads to run in order(dfsio, terasort, hive, presto, jvm). Workloads "
+                             + "of components not enabled are skipped. Default dfsio,terasort,hive,presto")
+    parser.add_argument("--output", help="Write report as JSON to this path. Default stdout")
+    parser.add_argument("--topology", default=os.path.join(HasConstants.TARGET_BASE_PATH, "topology.json"),
+                        help="Topology written by main.py. Default target/topology.json")
+    parser.add_argument("--transport", default="docker", choices=["docker", "http"],
+                        help="docker: run commands with docker exec from docker host, http: call agents directly "
+                             + "from a container in hadoop.net. Default docker")
+    parser.add_argument("--timeout", default=3600, type=float, help="Timeout of each command in seconds")
+    parser.add_argument("--repeat", default=3, type=int,
+                        help="Repetitions of each hive/presto query and jvm command. Default 3")
+    parser.add_argument("--dfsio-files", default=4, type=int, help="Number of TestDFSIO files. Default 4")
+    parser.add_argument("--dfsio-size", default="128MB", help="Size of each TestDFSIO file. Default 128MB")
+    parser.add_argument("--terasort-rows", default=1000000, type=int,
+                        help="Rows(100 bytes each) teragen generates. Default 1000000")
+    parser.add_argument("--hive-rows", default=1000000, type=int,
+                        help="Rows of store_sales table hive/presto queries run on. Default 1000000")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_workload_arg()
+    with open(args.topology) as f:
+        topology = json.load(f)
+    client = DockerClient(topology) if args.transport == "docker" else HttpClient(topology)
+    results = WorkloadRunner(topology, client, build_workloads(args)).run()
+
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "timestamp": time.time(),
+                 "transport": args.transport},
+        "topology": topology,
+        "params": {k: v for k, v in vars(args).items() if k not in ["output", "topology"]},
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if any("error" in result for result in results):
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
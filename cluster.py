@@ -0,0 +1,633 @@
+from __future__ import annotations
+import functools
+import os
+from argparse import Namespace
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Set, Tuple
+from constants import HasConstants
+from tuning import HostResources, PrestoTuning, Tuning
+
+
+def memoized(func):
+    name = func.__name__
+
+    @property
+    @functools.wraps(func)
+    def wrapper(self):
+        memo = self._memo
+        if name not in memo:
+            memo[name] = func(self)
+        return memo[name]
+    return wrapper
+
+
+# Deep merge into a new dict, sections are memoized and shared so neither side is modified
+def merged(base: dict, other: dict) -> dict:
+    result = dict(base)
+    for key, value in other.items():
+        if isinstance(result.get(key), dict) and isinstance(value, dict):
+            result[key] = merged(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+
+class Frozen:
+    __slots__ = ()
+
+    def __setattr__(self, key, value):
+        raise AttributeError("{} is immutable".format(type(self).__name__))
+
+    def _init(self, **kwargs) -> None:
+        for key, value in kwargs.items():
+            object.__setattr__(self, key, value)
+
+
+class Endpoint(Frozen):
+    __slots__ = ("host", "ports", "published")
+
+    def __init__(self, host: str, ports: Dict[str, int] = None, published: Tuple[Tuple[int, int], ...] = ()):
+        # ports: name -> container port, published: (host port, container port)
+        self._init(host=host, ports=MappingProxyType(dict(ports or {})), published=tuple(tuple(p) for p in published))
+
+    @property
+    def port_mappings(self) -> set[str]:
+        return {"{}:{}".format(host_port, port) for host_port, port in self.published}
+
+    def data(self, **extra) -> dict:
+        data = {"host": self.host}
+        data.update({k: str(v) for k, v in self.ports.items()})
+        data.update(extra)
+        return data
+
+    def describe(self) -> dict:
+        return {"host": self.host, "ports": dict(self.ports), "published": [list(p) for p in self.published]}
+
+
+# HA pair of namenodes serving a namespace, and observer namenodes serving its reads
+class Nameservice(Frozen):
+    __slots__ = ("name", "active", "standby", "observers")
+
+    def __init__(self, name: str, active: Endpoint, standby: Endpoint, observers: Tuple[Endpoint, ...] = ()):
+        self._init(name=name, active=active, standby=standby, observers=tuple(observers))
+
+    # Namenode id in dfs.ha.namenodes, active and standby are nn1 and nn2
+    @staticmethod
+    def observer_id(index: int) -> str:
+        return "nn" + str(index + 3)
+
+    def data(self) -> dict:
+        return {
+            "name": self.name, "active": self.active.data(), "standby": self.standby.data(),
+            "observer": [observer.data(id=self.observer_id(i)) for i, observer in enumerate(self.observers)]
+        }
+
+
+# Single source of hosts, ports, enabled components and versions of the cluster. Built once from args, both template
+# data(component.py) and docker compose services(instance.py) are derived from it
+class ClusterSpec(Frozen):
+    __slots__ = ("cluster_name", "num_datanode", "num_presto_worker", "hive", "spark", "spark_history",
+                 "spark_thrift", "presto", "hue", "versions", "hadoop_image", "cluster_starter_image", "agent_port",
+                 "tuning_profile", "host", "short_circuit", "presto_memory_mb", "cluster_id", "port_offset",
+                 "dedup_binaries", "ec_policy", "ec_dirs", "num_nameservice", "num_observer",
+                 "netem", "netem_runtime", "num_rack", "_memo")
+    PREDEF_GROUPS = {
+        "admin": 150, "hadoop": 151, "hadoopsvc": 152, "usersvc": 154, "dataplatform_user": 155, "hadoopUser":156,
+        "bi_user_group": 157, "ml_user_group": 158, "de_user_group": 159
+    }
+
+    PREDEF_USERS = {
+        "hdfs": {"uid": 180, "groups": ["admin"], "isSvc": True, "proxyGroup": "*"},
+        "webhdfs": {"uid": 181, "groups": ["admin"], "isSvc": True, "proxyGroup": "*"},
+        "hive": {"uid": 182, "groups": ["hadoopsvc", "hadoopUser"], "isSvc": True, "proxyGroup": "hadoopUser"},
+        "hue": {"uid": 183, "groups": ["hadoopsvc", "hadoopUser"], "isSvc": True, "proxyGroup": "hadoopUser"},
+        "spark": {"uid": 184, "groups": ["hadoopsvc", "hadoopUser"], "isSvc": True, "proxyGroup": "hadoopUser"},
+        "bi_user": {"uid": 185, "groups": ["dataplatform_user", "hadoopUser", "bi_user_group"], "isSvc": False},
+        "bi_svc": {"uid": 186, "groups": ["usersvc", "hadoopUser"], "isSvc": True, "proxyGroup": "bi_user_group"},
+        "ml_user": {"uid": 187, "groups": ["dataplatform_user", "hadoopUser", "ml_user_group"], "isSvc": False},
+        "ml_svc": {"uid": 188, "groups": ["usersvc", "hadoopUser"], "isSvc": True, "proxyGroup": "ml_user_group"},
+        "de_user": {"uid": 189, "groups": ["dataplatform_user", "hadoopUser", "de_user_group"], "isSvc": False},
+        "de_svc": {"uid": 190, "groups": ["usersvc", "hadoopUser"], "isSvc": True, "proxyGroup": "de_user_group"}
+    }
+
+    # Directory of datanode domain socket, shared with clients in the same container(presto worker)
+    DOMAIN_SOCKET_DIR = "/var/lib/hadoop-hdfs"
+    DEFAULT_VERSIONS = {
+        "hadoop": "3.3.0", "hive": "3.1.2", "spark": "3.1.1", "scala": "2.13", "java": "8", "zookeeper": "3.6.2",
+        "hue": "4.9.0", "presto": "0.252"
+    }
+    # Extracted binary tree of each component, and config dirs in it each cluster renders on its own
+    BINARY_DIRS = {"hadoop": "hadoop-bin", "hive": "hive-bin", "spark": "spark-bin", "presto": "presto-bin"}
+    CONFIG_DIRS = {"hadoop": ["etc/hadoop"], "hive": ["conf"], "spark": ["conf"], "presto": []}
+    # Erasure coding policy -> (data, parity) units. Each block group is spread over data + parity datanodes
+    EC_POLICIES = {
+        "RS-3-2-1024k": (3, 2), "RS-6-3-1024k": (6, 3), "RS-10-4-1024k": (10, 4), "RS-LEGACY-6-3-1024k": (6, 3),
+        "XOR-2-1-1024k": (2, 1)
+    }
+    # User homes(hive warehouse included) and benchmark data. Files written with hflush/hsync(spark event logs) can't
+    # be erasure coded
+    DEFAULT_EC_DIRS = ("/user", "/bench", "/benchmarks")
+    # Federation(--nameservices), first nameservice is the one of an unfederated cluster. Clients reach every namespace
+    # through routers, as one file system with a mount table
+    NAMESERVICE_NAME = "local-nameservice{}"
+    ROUTER_NAMESERVICE = "local-router"
+    NUM_ROUTER = 2
+    # Web UI of namenodes of a nameservice are published on 10 ports, active, standby and observers
+    MAX_OBSERVER = 8
+    # Web UI of datanodes below the namenode blocks(9864~9869). The rest are published DATANODE_PORT_SHIFT higher, clear
+    # of namenode blocks however many nameservices and observers there are, e.g. datanode7 on 19870
+    NUM_DATANODE_BELOW_NAMENODE = 6
+    DATANODE_PORT_SHIFT = 10000
+    # tc netem settings of network profiles, applied to egress of chosen containers(--netem) by their agent
+    NETEM_PROFILES = {
+        "lan": {"delay": "0.2ms", "jitter": "0.05ms"},
+        "rack": {"delay": "0.5ms", "jitter": "0.1ms", "rate": "10gbit"},
+        "cross-rack": {"delay": "2ms", "jitter": "0.5ms", "rate": "1gbit"},
+        "wan": {"delay": "40ms", "jitter": "10ms", "loss": "0.1%", "rate": "100mbit"},
+        "lossy": {"delay": "5ms", "jitter": "2ms", "loss": "2%"}
+    }
+
+    def __init__(self, num_datanode: int = 1, num_presto_worker: int = 1, hive: bool = False, spark: bool = False,
+                 spark_history: bool = False, spark_thrift: bool = False, presto: bool = False, hue: bool = False,
+                 versions: Dict[str, str] = None, hadoop_image: str = HasConstants.HADOOP_IMAGE_NAME,
+                 tuning_profile: str = Tuning.DEFAULT_PROFILE, host: HostResources = None, short_circuit: bool = False,
+                 presto_memory_mb: int = None, cluster_id: str = None, port_offset: int = 0,
+                 dedup_binaries: bool = False, ec_policy: str = None, ec_dirs: Tuple[str, ...] = DEFAULT_EC_DIRS,
+                 num_nameservice: int = 1, num_observer: int = 0, netem: Dict[str, str] = None,
+                 netem_runtime: bool = False, num_rack: int = 0):
+        # Presto workers run in datanode containers, at most one in each(see build_components)
+        self._init(cluster_name=HasConstants.CLUSTER_NAME, num_datanode=num_datanode,
+                   num_presto_worker=min(num_presto_worker, num_datanode), hive=hive,
+                   spark=spark or spark_history or spark_thrift, spark_history=spark_history, spark_thrift=spark_thrift,
+                   presto=presto, hue=hue,
+                   versions=MappingProxyType(dict(self.DEFAULT_VERSIONS, **(versions or {}))), hadoop_image=hadoop_image,
+                   cluster_starter_image=HasConstants.CLUSTER_STARTER_IMAGE_NAME, agent_port=3333,
+                   tuning_profile=tuning_profile, host=host or HostResources.detect(), short_circuit=short_circuit,
+                   presto_memory_mb=presto_memory_mb, cluster_id=cluster_id, port_offset=port_offset,
+                   dedup_binaries=dedup_binaries, ec_policy=ec_policy, ec_dirs=tuple(ec_dirs),
+                   num_nameservice=num_nameservice, num_observer=num_observer,
+                   netem=MappingProxyType(dict(netem or {})), netem_runtime=netem_runtime, num_rack=num_rack,
+                   _memo={})
+
+    @classmethod
+    def from_args(cls, args: Namespace, port_offset: int = 0) -> ClusterSpec:
+        return cls(
+            num_datanode=args.num_datanode, num_presto_worker=args.num_presto_worker,
+            hive=args.hive or args.all, spark=args.spark or args.all, spark_history=args.spark_history or args.all,
+            spark_thrift=args.spark_thrift or args.all, presto=args.presto or args.all, hue=args.hue or args.all,
+            versions={
+                "hadoop": args.hadoop_version, "hive": args.hive_version, "spark": args.spark_version,
+                "scala": args.scala_version, "java": args.java_version, "zookeeper": args.zookeeper_version,
+                "hue": args.hue_version, "presto": args.presto_version
+            },
+            hadoop_image=args.image_name_hadoop, tuning_profile=args.tuning_profile,
+            host=HostResources.detect(args.host_memory_mb, args.host_cpus), short_circuit=args.short_circuit,
+            presto_memory_mb=args.presto_memory_mb, cluster_id=args.cluster_id, port_offset=port_offset,
+            dedup_binaries=args.dedup_binaries, ec_policy=args.ec_policy,
+            ec_dirs=args.ec_dirs or cls.DEFAULT_EC_DIRS, num_nameservice=args.nameservices,
+            num_observer=args.observers, netem=dict(args.netem or []), netem_runtime=args.netem_runtime,
+            num_rack=args.racks)
+
+    # Clusters with an id are isolated from each other on the same host, by container names, network and host ports.
+    # Host names(network aliases) stay the same, each cluster has its own network
+    @property
+    def container_prefix(self) -> str:
+        return self.cluster_id + "-" if self.cluster_id else ""
+
+    def container_name(self, host: str) -> str:
+        return self.container_prefix + host
+
+    @property
+    def network(self) -> str:
+        return self.container_prefix + HasConstants.NETWORK_NAME
+
+    # Clusters with an id mount binaries extracted once under target/shared, read-only
+    @property
+    def shared_binaries(self) -> bool:
+        return self.cluster_id is not None
+
+    # Shared trees and trees hardlinked to store objects(--dedup-binaries) are mounted read-only, a write through would
+    # change the binaries of other clusters or releases
+    @property
+    def read_only_binaries(self) -> bool:
+        return self.shared_binaries or self.dedup_binaries
+
+    # Per daemon class data sharing archives(templates/hadoop/scripts/cds.sh), java 8 has only the JDK archive
+    @property
+    def app_cds(self) -> bool:
+        return self.versions["java"] != "8"
+
+    def _published(self, ports: list) -> list:
+        return [(host_port + self.port_offset, port) for host_port, port in ports]
+
+    @memoized
+    def binary_releases(self) -> dict:
+        versions = self.versions
+        return {
+            "hadoop": "hadoop-" + versions["hadoop"], "hive": "hive-" + versions["hive"],
+            "spark": "spark-{}-{}-{}".format(versions["spark"], versions["scala"], versions["hadoop"]),
+            "presto": "presto-" + versions["presto"]
+        }
+
+    # Directory of extracted binaries relative to target, as compose volumes are
+    def binary_dir(self, component: str) -> str:
+        if not self.shared_binaries:
+            return "./{}/{}".format(component, self.BINARY_DIRS[component])
+        shared = os.path.join(HasConstants.SHARED_BINARY_PATH, self.binary_releases[component],
+                              self.BINARY_DIRS[component])
+        return os.path.relpath(shared, HasConstants.TARGET_BASE_PATH)
+
+    def binary_volumes(self, component: str, container_path: str, sub_dir: str = None) -> Set[str]:
+        source = self.binary_dir(component) + ("/" + sub_dir if sub_dir else "")
+        if not self.read_only_binaries:
+            return {"{}:{}".format(source, container_path)}
+        volumes = {"{}:{}:ro".format(source, container_path)}
+        if sub_dir is None:
+            # Config of this cluster over the read-only tree
+            for config_dir in self.CONFIG_DIRS[component]:
+                volumes.add("./{}/{}/{}:{}/{}".format(component, self.BINARY_DIRS[component], config_dir,
+                                                      container_path, config_dir))
+        return volumes
+
+    # Endpoints
+    @memoized
+    def primary_namenode(self) -> Endpoint:
+        return Endpoint("primary-namenode", {"rpc-port": 9000, "http-port": 9870}, self._published([(9870, 9870)]))
+
+    @memoized
+    def secondary_namenode(self) -> Endpoint:
+        return Endpoint("secondary-namenode", {"rpc-port": 9000, "http-port": 9870},
+                        self._published([(9871, 9870)]))
+
+    @property
+    def federated(self) -> bool:
+        return self.num_nameservice > 1
+
+    # Namenodes of the other nameservices run in containers of their own, web UI published from 9880, 9890, ...
+    # Observers of each nameservice come after its standby, e.g. 9872, 9873, ... for the first one
+    @memoized
+    def nameservices(self) -> Tuple[Nameservice, ...]:
+        nameservices = []
+        for i in range(1, self.num_nameservice + 1):
+            suffix = str(i) if i > 1 else ""
+            http_port = 9870 + 10 * (i - 1)
+            ports = {"rpc-port": 9000, "http-port": 9870}
+            if i == 1:
+                active, standby = self.primary_namenode, self.secondary_namenode
+            else:
+                active = Endpoint("primary-namenode" + suffix, ports, self._published([(http_port, 9870)]))
+                standby = Endpoint("secondary-namenode" + suffix, ports, self._published([(http_port + 1, 9870)]))
+            observers = [Endpoint("observer-namenode{}-{}".format(suffix, j), ports,
+                                  self._published([(http_port + 1 + j, 9870)]))
+                         for j in range(1, self.num_observer + 1)]
+            nameservices.append(Nameservice(self.NAMESERVICE_NAME.format(i), active, standby, observers))
+        return tuple(nameservices)
+
+    @memoized
+    def routers(self) -> Tuple[Endpoint, ...]:
+        return tuple(Endpoint("router" + str(i), {"rpc-port": 8888, "http-port": 50071, "admin-port": 8111},
+                              self._published([(50071 + i - 1, 50071)])) for i in range(1, self.NUM_ROUTER + 1))
+
+    # Paths not in the mount table resolve to the first nameservice, others are mounted under /{nameservice}
+    @memoized
+    def mount_table(self) -> Tuple[Tuple[str, str, str], ...]:
+        return tuple(("/" + nameservice.name, nameservice.name, "/") for nameservice in self.nameservices[1:])
+
+    # What --netem is applied to: link class -> host of each container it shapes -> peers its traffic is shaped to(None
+    # for all), or a single service whose whole container is shaped. Only hadoop containers run an agent
+    @memoized
+    def netem_targets(self) -> dict:
+        namenodes = [namenode.host for nameservice in self.nameservices
+                     for namenode in (nameservice.active, nameservice.standby) + nameservice.observers]
+        datanodes = [datanode.host for datanode in self.datanodes]
+        services = namenodes + datanodes + [self.resource_manager.host, self.yarn_history.host]
+        if self.federated:
+            services += [router.host for router in self.routers]
+        if self.hive:
+            services += [self.hive_server.host, self.hive_metastore.host]
+        if self.spark_history:
+            services.append(self.spark_history_server.host)
+        if self.spark_thrift:
+            services.append(self.spark_thrift_server.host)
+        # Clients in containers without a namenode. Services sharing a container with a namenode(journalnode,
+        # zookeeper, yarn history, ...) are left out, shaping traffic to them would shape namenode to namenode traffic
+        clients = datanodes + ([router.host for router in self.routers] if self.federated else [])
+        targets = {service: {service: None} for service in services}
+        targets.update({
+            "datanode-datanode": {host: [peer for peer in datanodes if peer != host] for host in datanodes},
+            # Replies of namenodes to clients, netem shapes egress only. Only what leaves namenode ports(netem_ports)
+            # is shaped, journalnode3 and zookeeper3 share a container with datanode1
+            "client-namenode": {host: clients for host in namenodes}
+        })
+        if self.num_rack:
+            targets["cross-rack"] = {host: [peer for peer in datanodes if self.racks[peer] != self.racks[host]]
+                                     for host in datanodes}
+        return targets
+
+    # Containers given NET_ADMIN for their agent to run tc, those of chosen targets(--netem), or every one a target
+    # shapes with --netem-runtime
+    @memoized
+    def netem_hosts(self) -> FrozenSet[str]:
+        targets = self.netem_targets.values() if self.netem_runtime else [self.netem_targets[t] for t in self.netem]
+        return frozenset(host for hosts in targets for host in hosts)
+
+    # Targets netem.py can change at runtime, every container they shape has NET_ADMIN
+    @memoized
+    def netem_runtime_targets(self) -> dict:
+        return {target: hosts for target, hosts in self.netem_targets.items() if self.netem_hosts.issuperset(hosts)}
+
+    # Link classes shaping only traffic sent from these ports of the container to its peers
+    @memoized
+    def netem_ports(self) -> Dict[str, list]:
+        namenode = self.primary_namenode.ports
+        return {"client-namenode": [namenode["rpc-port"], namenode["http-port"]]}
+
+    # Rack of each datanode(--racks), assigned round robin
+    @memoized
+    def racks(self) -> Dict[str, str]:
+        if not self.num_rack:
+            return {}
+        return {datanode.host: "/rack" + str(i % self.num_rack + 1) for i, datanode in enumerate(self.datanodes)}
+
+    @memoized
+    def journalnodes(self) -> Tuple[Endpoint, ...]:
+        return tuple(Endpoint("journalnode" + str(i), {"port": 8485}) for i in range(1, 4))
+
+    @memoized
+    def zookeepers(self) -> Tuple[Endpoint, ...]:
+        return tuple(Endpoint("zookeeper" + str(i), {"port": 2181}) for i in range(1, 4))
+
+    @memoized
+    def yarn_history(self) -> Endpoint:
+        return Endpoint("yarn-history", {"port": 8188}, self._published([(8188, 8188)]))
+
+    @memoized
+    def resource_manager(self) -> Endpoint:
+        return Endpoint("resource-manager", {"port": 8032, "web-port": 8088, "resource-tracker-port": 8031,
+                                             "scheduler-port": 8030}, self._published([(8088, 8088)]))
+
+    @classmethod
+    def datanode_host_port(cls, i: int) -> int:
+        return 9864 + i - 1 + (cls.DATANODE_PORT_SHIFT if i > cls.NUM_DATANODE_BELOW_NAMENODE else 0)
+
+    @memoized
+    def datanodes(self) -> Tuple[Endpoint, ...]:
+        return tuple(Endpoint("datanode" + str(i), {"rpc-port": 9864, "nodemanager-port": 8042},
+                              self._published([(self.datanode_host_port(i), 9864)]))
+                     for i in range(1, self.num_datanode + 1))
+
+    @memoized
+    def cluster_db(self) -> Endpoint:
+        return Endpoint("cluster-db", {"port": 5432}, self._published([(5432, 5432)]))
+
+    @memoized
+    def hive_server(self) -> Endpoint:
+        return Endpoint("hive-server", {"thrift-port": 10000, "http-port": 10001},
+                        self._published([(10000, 10000), (10001, 10001), (10002, 10002)]))
+
+    @memoized
+    def hive_metastore(self) -> Endpoint:
+        return Endpoint("hive-metastore", {"thrift-port": 9083}, self._published([(9083, 9083)]))
+
+    @memoized
+    def spark_history_server(self) -> Endpoint:
+        return Endpoint("spark-history", {"port": 18080}, self._published([(18080, 18080)]))
+
+    @memoized
+    def spark_thrift_server(self) -> Endpoint:
+        return Endpoint("spark-thrift", {"thrift-port": 10010, "http-port": 10011},
+                        self._published([(10010, 10010), (10011, 10011)]))
+
+    @memoized
+    def presto_server(self) -> Endpoint:
+        return Endpoint("presto-server", {"port": 8081}, self._published([(8081, 8081)]))
+
+    @memoized
+    def presto_workers(self) -> Tuple[Endpoint, ...]:
+        return tuple(Endpoint("presto-worker" + str(i)) for i in range(1, self.num_presto_worker + 1))
+
+    @memoized
+    def hue_server(self) -> Endpoint:
+        return Endpoint("hue", {"port": 8888}, self._published([(8888, 8888)]))
+
+    @memoized
+    def cluster_starter(self) -> Endpoint:
+        return Endpoint("cluster-starter")
+
+    @memoized
+    def tuning(self) -> Tuning:
+        reserved_mb = self.presto_tuning.reserved_mb if self.presto else 0
+        return Tuning(Tuning.PROFILES[self.tuning_profile], self.host, self.num_datanode, reserved_mb)
+
+    @memoized
+    def presto_tuning(self) -> PrestoTuning:
+        return PrestoTuning(Tuning.PROFILES[self.tuning_profile], self.host, self.num_presto_worker,
+                            self.num_datanode, self.presto_memory_mb)
+
+    # Template data sections, each one is rendered by the component owning it
+    @memoized
+    def cluster_starter_data(self) -> dict:
+        return {
+            "additional": {
+                "image": {"cluster-starter": self.cluster_starter_image},
+                "network": self.network, "container-prefix": self.container_prefix
+            }
+        }
+
+    @memoized
+    def hadoop_data(self) -> dict:
+        return {
+            "primary_namenode": self.primary_namenode.data(),
+            "secondary_namenode": self.secondary_namenode.data(),
+            "nameservice": [nameservice.data() for nameservice in self.nameservices],
+            "journalnode": {"host": [j.host for j in self.journalnodes], "port": "8485"},
+            "zookeeper": {"host": [z.host for z in self.zookeepers], "port": "2181"},
+            "yarn_history": self.yarn_history.data(),
+            "resource_manager": self.resource_manager.data(),
+            "datanode": dict(self.datanodes[0].data(), host=[d.host for d in self.datanodes]),
+            "tuning": self.tuning.data(),
+            # Resolved by topology.sh, nodes not in it are in /default-rack
+            "rack": {"hosts": self.racks},
+            "mapreduce": {
+                # Staged by initialize.sh once per hadoop version
+                "framework-path": "hdfs://{}/apps/mapreduce/{}/mr-framework.tar".format(self.cluster_name,
+                                                                                      self.versions["hadoop"])
+            },
+            "additional": {
+                "users": self.PREDEF_USERS, "groups": self.PREDEF_GROUPS,
+                "dependency-versions": {
+                    "hadoop": self.versions["hadoop"], "java": self.versions["java"]
+                },
+                "agent": {
+                    "port": str(self.agent_port)
+                },
+                "image": {
+                    "hadoop": self.hadoop_image
+                }
+            }
+        }
+
+    @memoized
+    def short_circuit_data(self) -> dict:
+        return {"short_circuit": {"socket-path": self.DOMAIN_SOCKET_DIR + "/dn_socket"}}
+
+    @memoized
+    def federation_data(self) -> dict:
+        return {"federation": {
+            "router-nameservice": self.ROUTER_NAMESERVICE,
+            "router": [router.data() for router in self.routers],
+            "mount-table": [{"path": path, "nameservice": nameservice, "target": target}
+                            for path, nameservice, target in self.mount_table],
+            # Namenodes of every nameservice are formatted with it, so datanodes can serve all of them
+            "cluster-id": self.cluster_name
+        }}
+
+    @memoized
+    def observer_data(self) -> dict:
+        return {"observer_namenode": {"count": str(self.num_observer)}}
+
+    @memoized
+    def netem_data(self) -> dict:
+        rules = []
+        for target, profile in self.netem.items():
+            rules += [dict(self.NETEM_PROFILES[profile], target=target, profile=profile, host=host, peers=peers,
+                           ports=self.netem_ports.get(target))
+                      for host, peers in self.netem_targets[target].items()]
+        return {"netem": {"profiles": self.NETEM_PROFILES, "targets": self.netem_runtime_targets,
+                          "ports": self.netem_ports, "rules": rules}}
+
+    @memoized
+    def erasure_coding_data(self) -> dict:
+        data_units, parity_units = self.EC_POLICIES[self.ec_policy]
+        return {"erasure_coding": {
+            "policy": self.ec_policy, "dirs": list(self.ec_dirs), "data-units": str(data_units),
+            "parity-units": str(parity_units)
+        }}
+
+    @memoized
+    def hive_data(self) -> dict:
+        return {
+            "hive_server": self.hive_server.data(),
+            "hive_metastore": self.hive_metastore.data(**{
+                "metastore-db-host": self.cluster_db.host, "metastore-db-port": str(self.cluster_db.ports["port"]),
+                "metastore-db-name": "metastore", "metastore-db-user": "hive", "metastore-db-password": "hive"
+            }),
+            "additional": {
+                "dependency-versions": {
+                    "hive": self.versions["hive"]
+                }
+            }
+        }
+
+    @memoized
+    def spark_data(self) -> dict:
+        return {
+            "spark": {
+                "event-log-dir": "hdfs://{}/spark-logs".format(self.cluster_name),
+                # Staged by initialize.sh once per spark version
+                "yarn-archive": "hdfs://{}/apps/spark/{}-{}/spark-jars.tar".format(
+                    self.cluster_name, self.versions["spark"], self.versions["scala"]),
+                "shuffle-service-port": "7337"
+            }
+        }
+
+    @memoized
+    def spark_history_data(self) -> dict:
+        return {"spark_history": self.spark_history_server.data()}
+
+    @memoized
+    def spark_thrift_data(self) -> dict:
+        return {"spark_thrift": self.spark_thrift_server.data()}
+
+    @memoized
+    def presto_data(self) -> dict:
+        return {
+            "presto_server": self.presto_server.data(),
+            "presto_worker": [{"host": w.host} for w in self.presto_workers],
+            "presto_tuning": self.presto_tuning.data()
+        }
+
+    @memoized
+    def hue_data(self) -> dict:
+        return {
+            "hue": {
+                "db-user": "hue", "db-password": "hue", "db-name": "hue", "db-host": self.cluster_db.host,
+                "db-port": str(self.cluster_db.ports["port"])
+            }
+        }
+
+    # What the cluster is made of, written as target/topology.json for tools run against the cluster(benchmarks)
+    @memoized
+    def topology(self) -> dict:
+        endpoints = {
+            "primary_namenode": self.primary_namenode, "secondary_namenode": self.secondary_namenode,
+            "resource_manager": self.resource_manager, "yarn_history": self.yarn_history
+        }
+        if self.hive:
+            endpoints.update(hive_server=self.hive_server, hive_metastore=self.hive_metastore)
+        if self.spark_history:
+            endpoints["spark_history"] = self.spark_history_server
+        if self.spark_thrift:
+            endpoints["spark_thrift"] = self.spark_thrift_server
+        if self.presto:
+            endpoints["presto_server"] = self.presto_server
+        if self.hue:
+            endpoints["hue"] = self.hue_server
+        for nameservice in self.nameservices:
+            namenodes = list(nameservice.observers)
+            if nameservice is not self.nameservices[0]:
+                namenodes += [nameservice.active, nameservice.standby]
+            endpoints.update({namenode.host.replace("-", "_"): namenode for namenode in namenodes})
+        if self.federated:
+            endpoints.update({router.host: router for router in self.routers})
+        return {
+            "cluster_name": self.cluster_name, "cluster_id": self.cluster_id, "network": self.network,
+            "num_datanode": self.num_datanode, "num_observer": self.num_observer,
+            "num_presto_worker": self.num_presto_worker if self.presto else 0,
+            "components": {
+                "hive": self.hive, "spark": self.spark, "spark_history": self.spark_history,
+                "spark_thrift": self.spark_thrift, "presto": self.presto, "hue": self.hue
+            },
+            "short_circuit": self.short_circuit, "tuning_profile": self.tuning_profile,
+            "erasure_coding": {"policy": self.ec_policy, "dirs": list(self.ec_dirs)} if self.ec_policy else None,
+            "netem": dict(self.netem), "racks": self.racks or None,
+            "federation": {
+                "nameservices": [nameservice.name for nameservice in self.nameservices],
+                "router_nameservice": self.ROUTER_NAMESERVICE,
+                "mount_table": [{"path": path, "nameservice": nameservice, "target": target}
+                                for path, nameservice, target in self.mount_table]
+            } if self.federated else None,
+            "tuning": self.tuning.data(), "versions": dict(self.versions),
+            "host": {"memory_mb": self.host.memory_mb, "cpus": self.host.cpus}, "agent_port": self.agent_port,
+            "endpoints": {name: endpoint.describe() for name, endpoint in endpoints.items()},
+            "datanodes": [datanode.describe() for datanode in self.datanodes]
+        }
+
+    # Data of every enabled component merged, what templates are rendered with
+    @memoized
+    def template_data(self) -> dict:
+        sections = [self.cluster_starter_data, self.hadoop_data, self.netem_data]
+        if self.short_circuit:
+            sections.append(self.short_circuit_data)
+        if self.ec_policy:
+            sections.append(self.erasure_coding_data)
+        if self.federated:
+            sections.append(self.federation_data)
+        if self.num_observer:
+            sections.append(self.observer_data)
+        if self.hive:
+            sections.append(self.hive_data)
+        if self.spark:
+            sections.append(self.spark_data)
+        if self.spark_history:
+            sections.append(self.spark_history_data)
+        if self.spark_thrift:
+            sections.append(self.spark_thrift_data)
+        if self.presto:
+            sections.append(self.presto_data)
+        if self.hue:
+            sections.append(self.hue_data)
+        data = {"clusterName": self.cluster_name}
+        for section in sections:
+            data = merged(data, section)
+        return data
@@ -1,15 +1,19 @@
 from __future__ import annotations
+import errno
+import fnmatch
+import hashlib
 import os
 from pathlib import Path
 import shutil
-from urllib.request import urlretrieve
-import tarfile
-from typing import Tuple
+from typing import Optional, Tuple
 from argparse import Namespace
 import threading
 from abc import ABC
 import re
+from cluster import ClusterSpec
 from constants import HasConstants
+from profiler import Profiler
+from store import BinaryStore
 
 
 class HasComponentBaseDirectory:
@@ -18,6 +22,13 @@ class HasComponentBaseDirectory:
         raise NotImplementedError("Base class not implement base_dir")
 
 
+# Release of the binaries in BinaryStore(--dedup-binaries), None when they are extracted as is
+class HasStoreRelease:
+    @property
+    def store_release(self) -> Optional[str]:
+        return None
+
+
 class HasData:
     @property
     def data(self) -> dict:
@@ -49,15 +60,26 @@ class TemplateRequired(HasComponentBaseDirectory, FileDiscoverable, DestinationF
         pattern = ".*\\.{EXTENSION}$".format(EXTENSION=self.TEMPLATE_EXTENSION)
         return self.discover(dir_to_traverse, pattern)
 
-    def do_template(self, engine, data) -> None:
+    def render_templates(self, engine, data) -> list[Tuple[Path, str]]:
+        rendered = []
         for to_template in self.template_files:
             content = engine.render(to_template, data)
-            dest = Path(os.path.splitext(self.get_dest(str(to_template)))[0])
+            rendered.append((Path(os.path.splitext(self.get_dest(str(to_template)))[0]), content))
+        return rendered
+
+    @staticmethod
+    def write_rendered(rendered: list[Tuple[Path, str]]) -> None:
+        for dest, content in rendered:
             dest.parent.mkdir(parents=True, exist_ok=True)
+            FilesCopyRequired.unlink(dest)
             with open(str(dest), "w") as f:
                 f.write(content)
             if str(dest.suffix) in [".sh", ".py"]:
                 os.chmod(dest, 0o755)
+            Profiler.current().count("files_written")
+
+    def do_template(self, engine, data) -> None:
+        self.write_rendered(self.render_templates(engine, data))
 
 
 class FilesCopyRequired(ABC, HasComponentBaseDirectory, FileDiscoverable, DestinationFigurable):
@@ -68,30 +90,68 @@ class FilesCopyRequired(ABC, HasComponentBaseDirectory, FileDiscoverable, Destin
         return self.discover(dir_to_traverse, pattern)
 
     def copy(self) -> None:
-        for to_copy in self.files_to_copy:
+        self.copy_files(self.files_to_copy)
+
+    def copy_files(self, files: list[Path]) -> None:
+        for to_copy in files:
             dest = self.get_dest(str(to_copy))
             dest.parent.mkdir(parents=True, exist_ok=True)
+            self.unlink(dest)
             shutil.copy2(to_copy, dest)
             if str(dest.suffix) in [".sh", ".py"]:
                 os.chmod(dest, 0o755)
+            Profiler.current().count("files_written")
+
+    # Files of extracted trees may be hardlinks into the binary store, they are replaced rather than written through
+    @staticmethod
+    def unlink(dest: Path) -> None:
+        try:
+            os.unlink(dest)
+        except FileNotFoundError:
+            pass
+
+
+# Background stage of a component(download, decompress). Its error is kept, join_all re-raises it once every stage of
+# the batch is done, so a failed download or extraction fails the generator
+class Stage(threading.Thread):
+    def __init__(self, func, *args):
+        super().__init__()
+        self.func = func
+        self.args = args
+        self.error = None
+
+    def run(self) -> None:
+        try:
+            self.func(*self.args)
+        except Exception as e:
+            self.error = e
 
+    @staticmethod
+    def join_all(stages: list[Stage]) -> None:
+        for stage in stages:
+            stage.join()
+        errors = [stage.error for stage in stages if stage.error]
+        if errors:
+            raise errors[0]
 
-class DownloadRequired(HasComponentBaseDirectory, HasConstants):
+
+class DownloadRequired(HasComponentBaseDirectory, HasStoreRelease, HasConstants):
     def __init__(self, force_download: bool):
         self.force_download = force_download
 
-    def download_async(self) -> list[threading.Thread]:
-        Path(self.component_base_dir).mkdir(parents=True, exist_ok=True)
+    def download_async(self) -> list[Stage]:
         links = self.links_to_download
         awaitables = []
         for i in range(0, len(links)):
             link, output_file = links[i]
+            Path(output_file).parent.mkdir(parents=True, exist_ok=True)
             download_func = self._download
             if not self.force_download and Path(output_file).exists():
                 download_func = self._dummy_download
+            elif not self.force_download and self.store_release and BinaryStore().has(self.store_release):
+                download_func = self._stored_download
 
-            awaitables.append(threading.Thread(target=download_func,
-                                               args=(link, output_file)))
+            awaitables.append(Stage(Profiler.current().bind(download_func), link, output_file))
         return awaitables
 
     @staticmethod
@@ -99,25 +159,52 @@ class DownloadRequired(HasComponentBaseDirectory, HasConstants):
         print("Download from {URL} is ignored as {PATH} already exists".format(URL=url, PATH=str(output_file)))
         return
 
+    def _stored_download(self, url: str, output_file: Path) -> None:
+        print("Download from {URL} is ignored as {RELEASE} is in the binary store".format(
+            URL=url, RELEASE=self.store_release))
+
     @staticmethod
     def _download(url: str, output_file: Path) -> None:
+        from urllib.request import urlretrieve  # Deferred, it is slow to import
         print("Downloading from {SOURCE} to {DESTINATION}".format(SOURCE=url, DESTINATION=output_file))
-        urlretrieve(url, filename=output_file)
+        # Renamed once complete, generators of other clusters may look for the same shared tarball meanwhile
+        partial = "{}.part-{}-{}".format(output_file, os.getpid(), threading.get_ident())
+        try:
+            urlretrieve(url, filename=partial)
+            os.replace(partial, output_file)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        Profiler.current().count("bytes_transferred", os.path.getsize(output_file))
 
     @property
     def links_to_download(self) -> list[Tuple[str, Path]]:
         raise NotImplementedError("Base class not implement links_to_download")
 
 
-class DecompressRequired:
-    def decompress_async(self) -> list[threading.Thread]:
+class DecompressRequired(HasStoreRelease):
+    # Written last into an extracted tree. A tree without it is incomplete, e.g. only holds configs rendered into it
+    EXTRACTED_MARKER = ".extracted"
+
+    @classmethod
+    def is_extracted(cls, dest: Path) -> bool:
+        return (dest / cls.EXTRACTED_MARKER).is_file()
+
+    def decompress_async(self) -> list[Stage]:
         awaitables = []
         for compressed, dest in self.files_to_decompress:
             decompress_func = self._decompress
-            if dest.exists():
+            if self.store_release:
+                # A tarball is left only when it is newly downloaded
+                decompress_func = self._materialize
+                if (not compressed.exists() and BinaryStore().is_materialized(dest, self.store_release)
+                        and self.is_extracted(dest)):
+                    decompress_func = self._dummy_decompress
+            elif self.is_extracted(dest):
                 decompress_func = self._dummy_decompress
 
-            awaitables.append(threading.Thread(target=decompress_func, args=(compressed, dest)))
+            awaitables.append(Stage(Profiler.current().bind(decompress_func), compressed, dest))
         return awaitables
 
     @staticmethod
@@ -126,19 +213,150 @@ class DecompressRequired:
             COMPRESSED=str(compressed), PATH=str(dest_path)))
         return
 
-    @staticmethod
-    def _decompress(compressed: Path, dest_path: Path) -> None:
-        dest_path.mkdir(parents=True, exist_ok=True)
-        with tarfile.open(Path(compressed)) as f:
-            f.extractall(dest_path)
+    @classmethod
+    def _decompress(cls, compressed: Path, dest_path: Path) -> None:
+        import tarfile
+        # Extracted aside and renamed, so a partially extracted tree is never taken as extracted
+        partial = dest_path.with_name(".{}.partial-{}-{}".format(dest_path.name, os.getpid(), threading.get_ident()))
+        partial.mkdir(parents=True)
+        try:
+            with tarfile.open(Path(compressed)) as f:
+                f.extractall(partial)
+                members = f.getmembers()
+            (partial / cls.EXTRACTED_MARKER).touch()
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+        if dest_path.exists() and not cls.is_extracted(dest_path):
+            # Left incomplete, replaced by the complete tree
+            stale = dest_path.with_name(".{}.stale-{}-{}".format(dest_path.name, os.getpid(), threading.get_ident()))
+            os.rename(dest_path, stale)
+            shutil.rmtree(stale)
+        try:
+            os.rename(partial, dest_path)
+        except OSError as e:
+            shutil.rmtree(partial)
+            # Extracted by another generator meanwhile, anything else is a failure
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY) or not cls.is_extracted(dest_path):
+                raise
+        Profiler.current().count("bytes_extracted", sum(m.size for m in members if m.isfile()))
+        Profiler.current().count("files_written", len(list(filter(lambda m: m.isfile(), members))))
+
+    def _materialize(self, compressed: Path, dest_path: Path) -> None:
+        store = BinaryStore()
+        if compressed.exists():
+            store.ingest(compressed, self.store_release)
+            # Every file of it is in the store now
+            compressed.unlink()
+        store.materialize(self.store_release, dest_path)
+        (dest_path / self.EXTRACTED_MARKER).touch()
 
     @property
     def files_to_decompress(self) -> list[Tuple[Path, Path]]:
         raise NotImplementedError("Base class not implement decompress")
 
+    # (extracted, cluster's own) config dirs copied after extraction, when the extracted tree is shared by clusters
+    @property
+    def config_dirs(self) -> list[Tuple[Path, Path]]:
+        return []
+
+    def copy_config_dirs(self) -> None:
+        for source, dest in self.config_dirs:
+            shutil.copytree(source, dest, dirs_exist_ok=True)
+
+    @property
+    def decompressed_dirs(self) -> list[Path]:
+        return [dest for _, dest in self.files_to_decompress] + [dest for _, dest in self.config_dirs]
+
+
+# Component whose target directory is a docker build context. The image is tagged with a hash of the context(rendered
+# Dockerfile plus every file not excluded by .dockerignore), so unchanged images are not built again
+class ImageBuildRequired(HasComponentBaseDirectory):
+    HASH_LENGTH = 12
+
+    @property
+    def image_name(self) -> str:
+        raise NotImplementedError("Base class not implement image_name")
+
+    @property
+    def build_context(self) -> Path:
+        return Path(self.component_base_dir)
+
+    def _ignore_patterns(self) -> list[Tuple[bool, str]]:
+        dockerignore = self.build_context / ".dockerignore"
+        if not dockerignore.exists():
+            return []
+        patterns = []
+        for line in dockerignore.read_text().splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            patterns.append((negated, os.path.normpath(line.lstrip("!").strip("/"))))
+        return patterns
+
+    @staticmethod
+    def _is_ignored(relative: str, patterns: list[Tuple[bool, str]]) -> bool:
+        # Same as docker, the last matching pattern wins
+        ignored = False
+        for negated, pattern in patterns:
+            if fnmatch.fnmatchcase(relative, pattern) or relative.startswith(pattern + "/"):
+                ignored = not negated
+        return ignored
+
+    @property
+    def context_files(self) -> list[Path]:
+        patterns = self._ignore_patterns()
+        negations = [pattern for negated, pattern in patterns if negated]
+        files = []
+        for root, dirs, names in os.walk(self.build_context):
+            relative_root = os.path.relpath(root, self.build_context)
+            prefix = "" if relative_root == "." else relative_root + "/"
+            # Don't descend into ignored directories unless an exception may re-include something in there.
+            # Extracted binaries are large and usually ignored
+            dirs[:] = sorted(d for d in dirs if not self._is_ignored(prefix + d, patterns)
+                             or any(n.startswith(prefix + d + "/") or "*" in n for n in negations))
+            files += [Path(root, name) for name in sorted(names) if not self._is_ignored(prefix + name, patterns)]
+        return files
+
+    @property
+    def content_hash(self) -> str:
+        digest = hashlib.sha256()
+        for path in self.context_files:
+            digest.update(str(path.relative_to(self.build_context)).encode("UTF-8"))
+            digest.update(b"\0x" if os.access(path, os.X_OK) else b"\0-")
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        return digest.hexdigest()[:self.HASH_LENGTH]
+
 
 class Component(ABC):
-    pass
+    def __init__(self, spec: ClusterSpec):
+        self.spec = spec
+
+    # Where binaries are downloaded and extracted, clusters with an id share them
+    def binary_base_dir(self, component: str) -> str:
+        if self.spec.shared_binaries:
+            return os.path.join(HasConstants.SHARED_BINARY_PATH, self.spec.binary_releases[component])
+        return self.component_base_dir
+
+    def config_dirs_of(self, component: str) -> list[Tuple[Path, Path]]:
+        if not self.spec.shared_binaries:
+            return []
+        binary_dir = ClusterSpec.BINARY_DIRS[component]
+        return [(Path(self.binary_base_dir(component), binary_dir, config_dir),
+                 Path(self.component_base_dir, binary_dir, config_dir))
+                for config_dir in ClusterSpec.CONFIG_DIRS[component]]
+
+    # Named by release in the store layout, so a tarball of another release is never taken for this one
+    def tarball_of(self, component: str, tar_file_name: str) -> Path:
+        if self.spec.dedup_binaries:
+            tar_file_name = self.spec.binary_releases[component] + ".tar.gz"
+        return Path(self.binary_base_dir(component), tar_file_name)
+
+    def release_in_store(self, component: str) -> Optional[str]:
+        return self.spec.binary_releases[component] if self.spec.dedup_binaries else None
 
 
 class Scripts(Component, TemplateRequired):
@@ -151,21 +369,19 @@ class Scripts(Component, TemplateRequired):
         return {}
 
 
-class ClusterStarter(Component, FilesCopyRequired, TemplateRequired, HasData, HasConstants):
+class ClusterStarter(Component, FilesCopyRequired, TemplateRequired, ImageBuildRequired, HasData, HasConstants):
 
     @property
     def component_base_dir(self) -> str:
         return os.path.join(self.TARGET_BASE_PATH, "cluster-starter")
 
+    @property
+    def image_name(self) -> str:
+        return self.spec.cluster_starter_image
+
     @property
     def data(self) -> dict:
-        return {
-            "additional": {
-                "image": {
-                    "cluster-starter": self.CLUSTER_STARTER_IMAGE_NAME
-                }
-            }
-        }
+        return self.spec.cluster_starter_data
 
 
 class Hue(Component, FilesCopyRequired, TemplateRequired, HasData):
@@ -175,100 +391,63 @@ class Hue(Component, FilesCopyRequired, TemplateRequired, HasData):
 
     @property
     def data(self) -> dict:
-        return {
-            "hue": {
-                "db-user": "hue", "db-password": "hue", "db-name": "hue", "db-host": "cluster-db", "db-port": "5432"
-            }
-        }
+        return self.spec.hue_data
 
 
-class Hadoop(Component, FilesCopyRequired, TemplateRequired, DownloadRequired, DecompressRequired, HasData, HasConstants):
+class Hadoop(Component, FilesCopyRequired, TemplateRequired, DownloadRequired, DecompressRequired, ImageBuildRequired,
+             HasData, HasConstants):
+    NAME = "hadoop"
     TAR_FILE_NAME = "hadoop.tar.gz"
-    PREDEF_GROUPS = {
-        "admin": 150, "hadoop": 151, "hadoopsvc": 152, "usersvc": 154, "dataplatform_user": 155, "hadoopUser":156,
-        "bi_user_group": 157, "ml_user_group": 158, "de_user_group": 159
-    }
-
-    PREDEF_USERS = {
-        "hdfs": {"uid": 180, "groups": ["admin"], "isSvc": True, "proxyGroup": "*"},
-        "webhdfs": {"uid": 181, "groups": ["admin"], "isSvc": True, "proxyGroup": "*"},
-        "hive": {"uid": 182, "groups": ["hadoopsvc", "hadoopUser"], "isSvc": True, "proxyGroup": "hadoopUser"},
-        "hue": {"uid": 183, "groups": ["hadoopsvc", "hadoopUser"], "isSvc": True, "proxyGroup": "hadoopUser"},
-        "spark": {"uid": 184, "groups": ["hadoopsvc", "hadoopUser"], "isSvc": True, "proxyGroup": "hadoopUser"},
-        "bi_user": {"uid": 185, "groups": ["dataplatform_user", "hadoopUser", "bi_user_group"], "isSvc": False},
-        "bi_svc": {"uid": 186, "groups": ["usersvc", "hadoopUser"], "isSvc": True, "proxyGroup": "bi_user_group"},
-        "ml_user": {"uid": 187, "groups": ["dataplatform_user", "hadoopUser", "ml_user_group"], "isSvc": False},
-        "ml_svc": {"uid": 188, "groups": ["usersvc", "hadoopUser"], "isSvc": True, "proxyGroup": "ml_user_group"},
-        "de_user": {"uid": 189, "groups": ["dataplatform_user", "hadoopUser", "de_user_group"], "isSvc": False},
-        "de_svc": {"uid": 190, "groups": ["usersvc", "hadoopUser"], "isSvc": True, "proxyGroup": "de_user_group"}
-    }
-
-    def __init__(self, args: Namespace):
-        DownloadRequired.__init__(self, force_download=args.force_download_hadoop)
-        self.hadoop_version = args.hadoop_version
-        self.java_version = args.java_version
-        self.num_datanode = args.num_datanode
+
+    def __init__(self, spec: ClusterSpec, force_download: bool):
+        Component.__init__(self, spec)
+        DownloadRequired.__init__(self, force_download=force_download)
+        self.hadoop_version = spec.versions["hadoop"]
 
     @property
     def component_base_dir(self) -> str:
         return os.path.join(self.TARGET_BASE_PATH, "hadoop")
 
+    @property
+    def image_name(self) -> str:
+        return self.spec.hadoop_image
+
     @property
     def links_to_download(self) -> list[Tuple[str, Path]]:
         return [
             ("https://github.com/dev-moonduck/hadoop/releases/download/v{HADOOP_VERSION}/hadoop-{HADOOP_VERSION}.tar.gz"
              .format(HADOOP_VERSION=self.hadoop_version),
-             Path(os.path.join(self.component_base_dir, self.TAR_FILE_NAME)))
+             self.tarball_of(self.NAME, self.TAR_FILE_NAME))
         ]
 
     @property
     def files_to_decompress(self) -> list[Tuple[Path, Path]]:
         return [
-            (Path(os.path.join(self.component_base_dir, self.TAR_FILE_NAME)),
-             Path(os.path.join(self.component_base_dir, "hadoop-bin")))
+            (self.tarball_of(self.NAME, self.TAR_FILE_NAME),
+             Path(os.path.join(self.binary_base_dir(self.NAME), "hadoop-bin")))
         ]
 
+    @property
+    def config_dirs(self) -> list[Tuple[Path, Path]]:
+        return self.config_dirs_of(self.NAME)
+
+    @property
+    def store_release(self) -> Optional[str]:
+        return self.release_in_store(self.NAME)
+
     @property
     def data(self) -> dict:
-        return {
-            "primary_namenode": {
-                "host": "primary-namenode", "rpc-port": "9000", "http-port": "9870"
-            },
-            "secondary_namenode": {
-                "host": "secondary-namenode", "rpc-port": "9000", "http-port": "9870"
-            },
-            "journalnode": {"host": ["journalnode1", "journalnode2", "journalnode3"], "port": "8485"},
-            "zookeeper": {"host": ["zookeeper1", "zookeeper2", "zookeeper3"], "port": "2181"},
-            "yarn_history": {"host": "yarn-history", "port": "8188"},
-            "resource_manager": {
-                "host": "resource-manager", "port": "8032", "web-port": "8088", "resource-tracker-port": "8031",
-                "scheduler-port": "8030"
-            },
-            "datanode": {
-                "host": list(map(lambda i: "datanode" + str(i), range(1, self.num_datanode + 1))),
-                "rpc-port": "9864", "nodemanager-port": "8042"
-            },
-            "additional": {
-                "users": self.PREDEF_USERS, "groups": self.PREDEF_GROUPS,
-                "dependency-versions": {
-                    "hadoop": self.hadoop_version, "java": self.java_version
-                },
-                "agent": {
-                    "port": "3333"
-                },
-                "image": {
-                    "hadoop": self.HADOOP_IMAGE_NAME
-                }
-            }
-        }
+        return self.spec.hadoop_data
 
 
 class Hive(Component, FilesCopyRequired, TemplateRequired, DownloadRequired, DecompressRequired, HasData):
+    NAME = "hive"
     TAR_FILE_NAME = "hive.tar.gz"
 
-    def __init__(self, args: Namespace):
-        DownloadRequired.__init__(self, force_download=args.force_download_hive)
-        self.hive_version = args.hive_version
+    def __init__(self, spec: ClusterSpec, force_download: bool):
+        Component.__init__(self, spec)
+        DownloadRequired.__init__(self, force_download=force_download)
+        self.hive_version = spec.versions["hive"]
 
     @property
     def component_base_dir(self) -> str:
@@ -279,39 +458,39 @@ class Hive(Component, FilesCopyRequired, TemplateRequired, DownloadRequired, Dec
         return [
             (("https://github.com/dev-moonduck/hive/releases/download/v{HIVE_VERSION}"
              + "/apache-hive-{HIVE_VERSION}.tar.gz").format(HIVE_VERSION=self.hive_version),
-             Path(os.path.join(self.component_base_dir, self.TAR_FILE_NAME)))
+             self.tarball_of(self.NAME, self.TAR_FILE_NAME))
         ]
 
     @property
     def files_to_decompress(self) -> list[Tuple[Path, Path]]:
         return [
-            (Path(os.path.join(self.component_base_dir, self.TAR_FILE_NAME)),
-             Path(os.path.join(self.component_base_dir, "hive-bin")))
+            (self.tarball_of(self.NAME, self.TAR_FILE_NAME),
+             Path(os.path.join(self.binary_base_dir(self.NAME), "hive-bin")))
         ]
 
+    @property
+    def config_dirs(self) -> list[Tuple[Path, Path]]:
+        return self.config_dirs_of(self.NAME)
+
+    @property
+    def store_release(self) -> Optional[str]:
+        return self.release_in_store(self.NAME)
+
     @property
     def data(self) -> dict:
-        return {
-            "hive_server": {"host": "hive-server", "thrift-port": "10000", "http-port": "10001"},
-            "hive_metastore": {"host": "hive-metastore", "thrift-port": "9083", "metastore-db-host": "cluster-db",
-                               "metastore-db-port": "5432", "metastore-db-name": "metastore",
-                               "metastore-db-user": "hive", "metastore-db-password": "hive"},
-            "additional": {
-                "dependency-versions": {
-                    "hive": self.hive_version
-                }
-            }
-        }
+        return self.spec.hive_data
 
 
 class Spark(Component, FilesCopyRequired, TemplateRequired, DownloadRequired, DecompressRequired, HasData):
+    NAME = "spark"
     TAR_FILE_NAME = "spark.tar.gz"
 
-    def __init__(self, args: Namespace):
-        DownloadRequired.__init__(self, force_download=args.force_download_spark)
-        self.spark_version = args.spark_version
-        self.scala_version = args.scala_version
-        self.hadoop_version = args.hadoop_version
+    def __init__(self, spec: ClusterSpec, force_download: bool):
+        Component.__init__(self, spec)
+        DownloadRequired.__init__(self, force_download=force_download)
+        self.spark_version = spec.versions["spark"]
+        self.scala_version = spec.versions["scala"]
+        self.hadoop_version = spec.versions["hadoop"]
 
     @property
     def component_base_dir(self) -> str:
@@ -323,19 +502,27 @@ class Spark(Component, FilesCopyRequired, TemplateRequired, DownloadRequired, De
             ("https://github.com/dev-moonduck/spark/releases/download/v{SPARK_VERSION}-{SCALA_VERSION}-{HADOOP_VERSION}"
              + "/spark-{SPARK_VERSION}-{SCALA_VERSION}-{HADOOP_VERSION}.tar.gz").format(
                 SPARK_VERSION=self.spark_version, SCALA_VERSION=self.scala_version, HADOOP_VERSION=self.hadoop_version),
-            Path(os.path.join(self.component_base_dir, self.TAR_FILE_NAME)))
+            self.tarball_of(self.NAME, self.TAR_FILE_NAME))
         ]
 
     @property
     def files_to_decompress(self) -> list[Tuple[Path, Path]]:
         return [
-            (Path(os.path.join(self.component_base_dir, self.TAR_FILE_NAME)),
-             Path(os.path.join(self.component_base_dir, "spark-bin")))
+            (self.tarball_of(self.NAME, self.TAR_FILE_NAME),
+             Path(os.path.join(self.binary_base_dir(self.NAME), "spark-bin")))
         ]
 
+    @property
+    def config_dirs(self) -> list[Tuple[Path, Path]]:
+        return self.config_dirs_of(self.NAME)
+
+    @property
+    def store_release(self) -> Optional[str]:
+        return self.release_in_store(self.NAME)
+
     @property
     def data(self) -> dict:
-        return {}
+        return self.spec.spark_data
 
 
 class SparkHistory(Component, TemplateRequired, FilesCopyRequired, HasData):
@@ -345,9 +532,7 @@ class SparkHistory(Component, TemplateRequired, FilesCopyRequired, HasData):
 
     @property
     def data(self) -> dict:
-        return {
-            "spark_history": {"host": "spark-history", "port": "18080"}
-        }
+        return self.spec.spark_history_data
 
 
 class SparkThrift(Component, TemplateRequired, FilesCopyRequired, HasData):
@@ -357,18 +542,17 @@ class SparkThrift(Component, TemplateRequired, FilesCopyRequired, HasData):
 
     @property
     def data(self) -> dict:
-        return {
-            "spark_thrift": {"host": "spark-thrift", "thrift-port": "10010", "http-port": "10011"}
-        }
+        return self.spec.spark_thrift_data
 
 
 class Presto(Component, FilesCopyRequired, TemplateRequired, DownloadRequired, DecompressRequired, HasData):
+    NAME = "presto"
     TAR_FILE_NAME = "presto.tar.gz"
 
-    def __init__(self, args: Namespace):
-        DownloadRequired.__init__(self, force_download=args.force_download_presto)
-        self.presto_version = args.presto_version
-        self.num_worker = args.num_presto_worker
+    def __init__(self, spec: ClusterSpec, force_download: bool):
+        Component.__init__(self, spec)
+        DownloadRequired.__init__(self, force_download=force_download)
+        self.presto_version = spec.versions["presto"]
 
     @property
     def component_base_dir(self) -> str:
@@ -379,39 +563,44 @@ class Presto(Component, FilesCopyRequired, TemplateRequired, DownloadRequired, D
         return [
             (("https://github.com/dev-moonduck/presto/releases/download/v{PRESTO_VERSION}"
              + "/presto-server-{PRESTO_VERSION}.tar.gz").format(PRESTO_VERSION=self.presto_version),
-             Path(os.path.join(self.component_base_dir, self.TAR_FILE_NAME)))
+             self.tarball_of(self.NAME, self.TAR_FILE_NAME))
         ]
 
     @property
     def files_to_decompress(self) -> list[Tuple[Path, Path]]:
         return [
-            (Path(os.path.join(self.component_base_dir, self.TAR_FILE_NAME)),
-             Path(os.path.join(self.component_base_dir, "presto-bin")))
+            (self.tarball_of(self.NAME, self.TAR_FILE_NAME),
+             Path(os.path.join(self.binary_base_dir(self.NAME), "presto-bin")))
         ]
 
+    @property
+    def config_dirs(self) -> list[Tuple[Path, Path]]:
+        return self.config_dirs_of(self.NAME)
+
+    @property
+    def store_release(self) -> Optional[str]:
+        return self.release_in_store(self.NAME)
+
     @property
     def data(self) -> dict:
-        workers = [{"host": "presto-worker" + str(i)} for i in range(1, self.num_worker + 1)]
-        return {
-            "presto_server": {"host": "presto-server", "port": "8081"},
-            "presto_worker": workers
-        }
+        return self.spec.presto_data
 
 
 class ComponentFactory:
     @staticmethod
-    def get_components(args: Namespace) -> list[Component]:
-        components = [Scripts(), ClusterStarter(), Hadoop(args)]
-        if args.hive or args.all:
-            components.append(Hive(args))
-        if args.spark_thrift or args.spark_history or args.all:
-            components.append(Spark(args))
-        if args.spark_history or args.all:
-            components.append(SparkHistory())
-        if args.spark_thrift or args.all:
-            components.append(SparkThrift())
-        if args.presto or args.all:
-            components.append(Presto(args))
-        if args.hue or args.all:
-            components.append(Hue())
+    def get_components(args: Namespace, spec: ClusterSpec = None) -> list[Component]:
+        spec = spec or ClusterSpec.from_args(args)
+        components = [Scripts(spec), ClusterStarter(spec), Hadoop(spec, args.force_download_hadoop)]
+        if spec.hive:
+            components.append(Hive(spec, args.force_download_hive))
+        if spec.spark:
+            components.append(Spark(spec, args.force_download_spark))
+        if spec.spark_history:
+            components.append(SparkHistory(spec))
+        if spec.spark_thrift:
+            components.append(SparkThrift(spec))
+        if spec.presto:
+            components.append(Presto(spec, args.force_download_presto))
+        if spec.hue:
+            components.append(Hue(spec))
         return components
@@ -6,7 +6,13 @@ class HasConstants:
     ROOT_PATH = Path(os.path.abspath(__file__)).parent
     BASE_PATH = os.path.join(str(ROOT_PATH), "templates")
     TARGET_BASE_PATH = os.path.join(str(ROOT_PATH), "target")
+    # Targets of clusters generated with --cluster-id, and binaries they share
+    CLUSTERS_PATH = os.path.join(str(ROOT_PATH), "target", "clusters")
+    SHARED_BINARY_PATH = os.path.join(str(ROOT_PATH), "target", "shared")
+    # Content addressed store of extracted binaries, see store.py
+    STORE_PATH = os.path.join(str(ROOT_PATH), "target", "store")
     TEMPLATE_EXTENSION = "template"
     CLUSTER_NAME = "local-nameservice1"
     HADOOP_IMAGE_NAME = "local-hadoop"
     CLUSTER_STARTER_IMAGE_NAME = "cluster-starter"
+    NETWORK_NAME = "hadoop.net"
@@ -1,43 +1,61 @@
-import yaml
-from yaml import dump
-try:
-    from yaml import CDumper as Dumper
-except ImportError:
-    from yaml import Dumper
 import copy
 from collections import OrderedDict
 from instance import DockerComponent, MultipleComponent, PrimaryNamenode, SecondaryNamenode, JournalNode, DataNode, \
     ResourceManager, YarnHistoryServer, ClusterStarter, ClusterDb, ZookeeperNode, HiveServer, HiveMetastore, \
-    SparkHistory, SparkThrift, Hue, PrestoServer, PrestoWorker
-from argparse import Namespace
+    SparkHistory, SparkThrift, Hue, PrestoServer, PrestoWorker, Router, ObserverNamenode
+from cluster import ClusterSpec
+from constants import HasConstants
 from typing import List
+from profiler import Profiler
 
 
 
 DOCKER_COMPOSE_YAML = OrderedDict({
     "version": "3",
-    "services": {},
-    "networks": {
-        "hadoop.net": {
-            "external": True
-        }
-    }
+    "services": {}
 })
 
-yaml.add_representer(type(None), lambda dumper, value: dumper.represent_scalar(u'tag:yaml.org,2002:null', ''),
-                     Dumper=Dumper)
-yaml.add_representer(OrderedDict, lambda self, data:  self.represent_mapping('tag:yaml.org,2002:map', data.items()),
-                     Dumper=Dumper)
+_DUMPER = None
+
+
+# yaml is imported on first use, as it is slow to import and not needed when nothing has to be generated
+def _dumper():
+    global _DUMPER
+    if _DUMPER is None:
+        import yaml
+        try:
+            from yaml import CDumper as Dumper
+        except ImportError:
+            from yaml import Dumper
+        yaml.add_representer(type(None),
+                             lambda dumper, value: dumper.represent_scalar(u'tag:yaml.org,2002:null', ''),
+                             Dumper=Dumper)
+        yaml.add_representer(OrderedDict,
+                             lambda self, data:  self.represent_mapping('tag:yaml.org,2002:map', data.items()),
+                             Dumper=Dumper)
+        _DUMPER = Dumper
+    return _DUMPER
+
 
+# Network alias -> container serving it, co-located services share a container
+def containers_by_host(instances: List[DockerComponent]) -> dict:
+    return {host: instance.name for instance in instances for host in sorted(instance.hosts or [])}
 
-def generate_yaml(instances: List[DockerComponent]):
+
+def generate_yaml(instances: List[DockerComponent], network: str = HasConstants.NETWORK_NAME):
+    with Profiler.current().phase("generate_yaml", "docker-compose"):
+        return _generate_yaml(instances, network)
+
+
+def _generate_yaml(instances: List[DockerComponent], network: str):
     compose_yaml = copy.deepcopy(DOCKER_COMPOSE_YAML)
+    compose_yaml["networks"] = {network: {"external": True}}
     for instance in instances:
         instance_conf = {
             "image": instance.image,
             "container_name": instance.name,
             "networks": {
-                "hadoop.net": None
+                network: None
             },
             "tty": True
         }
@@ -45,7 +63,7 @@ def generate_yaml(instances: List[DockerComponent]):
             instance_conf["ports"] = list(instance.ports)
 
         if getattr(instance, "hosts") and instance.hosts:
-            instance_conf["networks"]["hadoop.net"] = {"aliases": list(instance.hosts)}
+            instance_conf["networks"][network] = {"aliases": list(instance.hosts)}
 
         if getattr(instance, "volumes") and instance.volumes:
             instance_conf["volumes"] = list(instance.volumes)
@@ -58,55 +76,65 @@ def generate_yaml(instances: List[DockerComponent]):
                 instance_conf[k] = v
 
         compose_yaml["services"][instance.name] = instance_conf
-    return dump(compose_yaml, Dumper=Dumper)
+    import yaml
+    return yaml.dump(compose_yaml, Dumper=_dumper())
+
 
+def build_components(spec: ClusterSpec) -> List[DockerComponent]:
+    components = [ClusterStarter(spec)]
 
-def build_components(args: Namespace) -> List[DockerComponent]:
-    components = [ClusterStarter()]
+    if spec.hive or spec.hue:
+        components.append(ClusterDb(spec))
+    primary_nn = [PrimaryNamenode(spec), JournalNode(spec, 1), ZookeeperNode(spec, 1), YarnHistoryServer(spec)]
+    if spec.hive:
+        primary_nn.append(HiveServer(spec))
+        primary_nn.append(HiveMetastore(spec))
 
-    if args.all or args.hive or args.hue:
-        components.append(ClusterDb(args))
-    primary_nn = [PrimaryNamenode(), JournalNode(1), ZookeeperNode(1), YarnHistoryServer()]
-    if args.all or args.hive:
-        primary_nn.append(HiveServer())
-        primary_nn.append(HiveMetastore())
+    if spec.presto:
+        primary_nn.append(PrestoServer(spec))
 
-    if args.all or args.presto:
-        primary_nn.append(PrestoServer())
+    components.append(MultipleComponent(spec.container_name(spec.primary_namenode.host), primary_nn))
 
-    components.append(MultipleComponent("primary-namenode", primary_nn))
+    secondary_nn = [SecondaryNamenode(spec), JournalNode(spec, 2), ZookeeperNode(spec, 2), ResourceManager(spec)]
 
-    secondary_nn = [SecondaryNamenode(), JournalNode(2), ZookeeperNode(2), ResourceManager()]
+    if spec.spark_history:
+        secondary_nn.append(SparkHistory(spec))
 
-    if args.all or args.spark or args.spark_history or args.spark_thrift:
-        secondary_nn.append(SparkHistory())
+    if spec.spark_thrift:
+        secondary_nn.append(SparkThrift(spec))
 
-    if args.all or args.spark_thrift:
-        secondary_nn.append(SparkThrift())
+    components.append(MultipleComponent(spec.container_name(spec.secondary_namenode.host), secondary_nn))
 
-    components.append(MultipleComponent("secondary-namenode", secondary_nn))
+    # Namenodes of other nameservices, observers and routers, each in a container of its own. A namenode finds its
+    # nameservice by the address it is on, so it can't share a container with another namenode or a router
+    for i in range(1, spec.num_nameservice + 1):
+        if i > 1:
+            components += [PrimaryNamenode(spec, i), SecondaryNamenode(spec, i)]
+        components += [ObserverNamenode(spec, i, j) for j in range(1, spec.num_observer + 1)]
+    if spec.federated:
+        components += [Router(spec, i) for i in range(1, len(spec.routers) + 1)]
 
-    datanode1 = [DataNode(1), JournalNode(3), ZookeeperNode(3)]
-    if args.all or args.presto:
-        datanode1.append(PrestoWorker(1))
-    components.append(MultipleComponent("datanode1", datanode1))
+    datanode1 = [DataNode(spec, 1), JournalNode(spec, 3), ZookeeperNode(spec, 3)]
+    if spec.presto:
+        datanode1.append(PrestoWorker(spec, 1))
+    components.append(MultipleComponent(spec.container_name(spec.datanodes[0].host), datanode1))
 
     additional_datanodes = []
-    for i in range(2, args.num_datanode + 1):
-        additional_datanodes.append(DataNode(i))
+    for i in range(2, spec.num_datanode + 1):
+        additional_datanodes.append(DataNode(spec, i))
 
     # Add presto worker in data node, num of presto worker does not exceed num of datanode
-    if (args.all or args.presto) and args.num_presto_worker > 1:
+    if spec.presto and spec.num_presto_worker > 1:
         worker_cnt = 1
-        while worker_cnt < args.num_presto_worker and worker_cnt <= len(additional_datanodes):
+        while worker_cnt < spec.num_presto_worker and worker_cnt <= len(additional_datanodes):
             datanode = additional_datanodes[worker_cnt - 1]
             additional_datanodes[worker_cnt - 1] = MultipleComponent(datanode.name, [datanode,
-                                                                                     PrestoWorker(worker_cnt + 1)])
+                                                                                     PrestoWorker(spec, worker_cnt + 1)])
             worker_cnt += 1
 
     components += additional_datanodes
 
-    if args.hue or args.all:
-        components.append(Hue(args))
+    if spec.hue:
+        components.append(Hue(spec))
 
     return components
@@ -0,0 +1,93 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+from argparse import Namespace
+from pathlib import Path
+from typing import Optional
+from constants import HasConstants
+from tuning import HostResources
+
+
+# Fingerprint of everything the generated target depends on: parsed args(including artifact versions), host resources,
+# templates tree and generator sources. If it matches the one saved in target and outputs are intact, regenerating is a no-op.
+# Keep this module free of heavy imports, it runs before anything else on every invocation.
+class Fingerprint(HasConstants):
+    FILE_NAME = ".fingerprint"
+    # Args which don't change generated files
+    IGNORED_ARGS = {"profile", "cprofile", "force_generate", "gc_store", "matrix", "matrix_manifest",
+                    "matrix_parallelism"}
+
+    def __init__(self, args: Namespace):
+        self.args = args
+        self.path = os.path.join(self.TARGET_BASE_PATH, self.FILE_NAME)
+        self._value = None
+
+    @property
+    def value(self) -> str:
+        if self._value is None:
+            digest = hashlib.sha256()
+            args = {k: v for k, v in vars(self.args).items() if k not in self.IGNORED_ARGS}
+            # Detected host resources change tuning even though args don't
+            host = HostResources.detect(self.args.host_memory_mb, self.args.host_cpus)
+            args.update({"host_memory_mb": host.memory_mb, "host_cpus": host.cpus})
+            digest.update(json.dumps(args, sort_keys=True, default=str).encode("UTF-8"))
+            for path in self._inputs():
+                digest.update(str(path.relative_to(self.ROOT_PATH)).encode("UTF-8"))
+                digest.update(path.read_bytes())
+            self._value = digest.hexdigest()
+        return self._value
+
+    def _inputs(self) -> list[Path]:
+        sources = sorted(self.ROOT_PATH.glob("*.py"))
+        templates = sorted(p for p in Path(self.BASE_PATH).rglob("*") if p.is_file())
+        return sources + templates
+
+    @property
+    def force_download(self) -> bool:
+        return any(v for k, v in vars(self.args).items() if k.startswith("force_download"))
+
+    def is_fresh(self) -> bool:
+        if self.force_download:
+            return False
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if saved.get("fingerprint") != self.value:
+            return False
+        for output in saved["outputs"]:
+            try:
+                stat = os.stat(output["path"])
+            except OSError:
+                return False
+            if "size" in output and (stat.st_size, stat.st_mtime_ns) != (output["size"], output["mtime_ns"]):
+                return False
+        return True
+
+    def save(self, outputs: list[Path]) -> None:
+        recorded = []
+        for output in outputs:
+            stat = os.stat(output)
+            if os.path.isdir(output):
+                recorded.append({"path": str(output)})
+            else:
+                recorded.append({"path": str(output), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+        with open(self.path, "w") as f:
+            json.dump({"fingerprint": self.value, "outputs": recorded, "args": vars(self.args)}, f, indent=1,
+                      default=str)
+
+    # Args the target was last generated with, to rebuild its spec for a running cluster(scale.py)
+    @classmethod
+    def saved_args(cls) -> Optional[Namespace]:
+        try:
+            with open(os.path.join(cls.TARGET_BASE_PATH, cls.FILE_NAME)) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return Namespace(**saved["args"]) if "args" in saved else None
+
+    def invalidate(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
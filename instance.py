@@ -1,6 +1,6 @@
 from abc import ABC
 from typing import List, Dict, Set
-from constants import HasConstants
+from cluster import ClusterSpec, Endpoint
 
 
 class DockerComponent:
@@ -92,10 +92,13 @@ class MultipleComponent(DockerComponent):
         return self._more_options
 
 
-class ClusterStarter(DockerComponent, HasConstants):
+class ClusterStarter(DockerComponent):
+    def __init__(self, spec: ClusterSpec):
+        self.spec = spec
+
     @property
     def image(self) -> str:
-        return self.CLUSTER_STARTER_IMAGE_NAME
+        return self.spec.cluster_starter_image
 
     @property
     def volumes(self) -> Set[str]:
@@ -107,15 +110,15 @@ class ClusterStarter(DockerComponent, HasConstants):
 
     @property
     def ports(self) -> Set[str]:
-        return set()
+        return self.spec.cluster_starter.port_mappings
 
     @property
     def hosts(self) -> Set[str]:
-        return set([self.name])
+        return set([self.spec.cluster_starter.host])
 
     @property
     def name(self) -> str:
-        return "cluster-starter"
+        return self.spec.container_name(self.spec.cluster_starter.host)
 
     @property
     def more_options(self) -> dict:
@@ -123,11 +126,12 @@ class ClusterStarter(DockerComponent, HasConstants):
 
 
 class ClusterDb(DockerComponent):
-    def __init__(self, args):
+    def __init__(self, spec: ClusterSpec):
+        self.spec = spec
         self._volumes = set()
-        if args.hive:
+        if spec.hive:
             self._volumes.add("./hive/sql/create_db.sql:/docker-entrypoint-initdb.d/create_hive_db.sql")
-        if args.hue:
+        if spec.hue:
             self._volumes.add("./hue/sql/create_db.sql:/docker-entrypoint-initdb.d/create_hue_db.sql")
 
     @property
@@ -147,15 +151,15 @@ class ClusterDb(DockerComponent):
 
     @property
     def ports(self) -> Set[str]:
-        return set(["5432:5432"])
+        return self.spec.cluster_db.port_mappings
 
     @property
     def hosts(self) -> Set[str]:
-        return set([self.name])
+        return set([self.spec.cluster_db.host])
 
     @property
     def name(self) -> str:
-        return "cluster-db"
+        return self.spec.container_name(self.spec.cluster_db.host)
 
     @property
     def more_options(self) -> dict:
@@ -163,7 +167,8 @@ class ClusterDb(DockerComponent):
 
 
 class Hue(DockerComponent):
-    def __init__(self, args):
+    def __init__(self, spec: ClusterSpec):
+        self.spec = spec
         _volume = {
             "./hue/conf/hue.ini:/usr/share/hue/desktop/conf/hue.ini",
             "./hue/conf/log.conf:/usr/share/hue/desktop/conf/log.conf"
@@ -171,8 +176,8 @@ class Hue(DockerComponent):
         _env = {
             "HUE_HOME": "/usr/share/hue"
         }
-        if args.hive or args.all:
-            hive = HiveNode()
+        if spec.hive:
+            hive = HiveNode(spec)
             _volume = _volume.union(hive.volumes)
             _env.update(hive.environment)
         self._volume = _volume
@@ -180,7 +185,7 @@ class Hue(DockerComponent):
 
     @property
     def image(self) -> str:
-        return "gethue/hue:4.9.0"
+        return "gethue/hue:" + self.spec.versions["hue"]
 
     @property
     def volumes(self) -> Set[str]:
@@ -192,15 +197,15 @@ class Hue(DockerComponent):
 
     @property
     def ports(self) -> Set[str]:
-        return set(["8888:8888"])
+        return self.spec.hue_server.port_mappings
 
     @property
     def hosts(self) -> Set[str]:
-        return set([self.name])
+        return set([self.spec.hue_server.host])
 
     @property
     def name(self) -> str:
-        return "hue"
+        return self.spec.container_name(self.spec.hue_server.host)
 
     @property
     def more_options(self) -> dict:
@@ -209,93 +214,151 @@ class Hue(DockerComponent):
         }
 
 
-class HadoopNode(ABC, DockerComponent, HasConstants):
+# Name and ports of a node come from its endpoint in ClusterSpec
+class HadoopNode(ABC, DockerComponent):
+    CDS_DIR = "/var/cds"
+
+    def __init__(self, spec: ClusterSpec):
+        self.spec = spec
+
+    @property
+    def endpoint(self) -> Endpoint:
+        raise NotImplementedError()
+
     @property
     def image(self) -> str:
-        return self.HADOOP_IMAGE_NAME
+        return self.spec.hadoop_image
 
     @property
     def volumes(self) -> Set[str]:
-        return {
+        volumes = {
             "./cluster-starter/agent.py:/scripts/agent.py",
-            "./hadoop/hadoop-bin:/opt/hadoop",
             "./hadoop/scripts/entrypoint.sh:/scripts/entrypoint.sh",
-            "./hadoop/scripts/initialize.sh:/scripts/initialize.sh"
-        }
+            "./hadoop/scripts/initialize.sh:/scripts/initialize.sh",
+            "./hadoop/scripts/cds.sh:/scripts/cds.sh"
+        }.union(self.spec.binary_volumes("hadoop", "/opt/hadoop"))
+        if self.spec.app_cds:
+            # Archives of daemons, shared by every container, so a datanode started later maps what the first dumped
+            volumes.add("./hadoop/cds:" + self.CDS_DIR)
+        return volumes
 
     @property
     def environment(self) -> Dict[str, str]:
-        return {}
+        env = {}
+        if self.spec.read_only_binaries:
+            # Default is logs dir of read-only HADOOP_HOME
+            env["HADOOP_LOG_DIR"] = "/var/log/hadoop"
+        if self.spec.app_cds:
+            env["CDS_DIR"] = self.CDS_DIR
+        return env
 
     @property
     def ports(self) -> Set[str]:
-        raise NotImplementedError()
+        return self.endpoint.port_mappings
 
     @property
     def hosts(self) -> Set[str]:
-        raise NotImplementedError()
+        return {self.endpoint.host}
 
     @property
     def name(self) -> str:
-        raise NotImplementedError()
+        return self.spec.container_name(self.endpoint.host)
 
     @property
     def more_options(self) -> dict:
-        raise NotImplementedError()
+        if self.endpoint.host in self.spec.netem_hosts:
+            # Agent shapes traffic of the container with tc netem, at start(--netem) or at runtime(target/bin/netem.py)
+            return {"cap_add": ["NET_ADMIN"]}
+        return {}
 
 
 class PrimaryNamenode(HadoopNode):
+    def __init__(self, spec: ClusterSpec, nameservice: int = 1):
+        super().__init__(spec)
+        self._nameservice = nameservice
+
+    @property
+    def endpoint(self) -> Endpoint:
+        return self.spec.nameservices[self._nameservice - 1].active
+
     @property
     def volumes(self) -> Set[str]:
         return super().volumes.union({
             "./hadoop/scripts/run_active_nn.sh:/scripts/run_active_nn.sh"
         })
 
-    @property
-    def ports(self) -> Set[str]:
-        return {"9870:9870"}
 
-    @property
-    def hosts(self) -> Set[str]:
-        return {self.name}
+class SecondaryNamenode(HadoopNode):
+    def __init__(self, spec: ClusterSpec, nameservice: int = 1):
+        super().__init__(spec)
+        self._nameservice = nameservice
 
     @property
-    def name(self) -> str:
-        return "primary-namenode"
+    def endpoint(self) -> Endpoint:
+        return self.spec.nameservices[self._nameservice - 1].standby
 
     @property
-    def more_options(self) -> dict:
-        return {}
+    def volumes(self) -> Set[str]:
+        volumes = super().volumes.union({
+            "./hadoop/scripts/run_standby_nn.sh:/scripts/run_standby_nn.sh"
+        })
+        if self.spec.spark and self._nameservice == 1:
+            # initialize.sh runs here and stages spark jars in HDFS
+            volumes = volumes.union(self.spec.binary_volumes("spark", "/opt/spark"))
+        return volumes
 
 
-class SecondaryNamenode(HadoopNode):
+# Starts as standby, the starter transitions it to observer. It has no zkfc, so it never takes part in failover
+class ObserverNamenode(HadoopNode):
+    def __init__(self, spec: ClusterSpec, nameservice: int, _id: int):
+        super().__init__(spec)
+        self._nameservice = nameservice
+        self._id = _id
+
+    @property
+    def endpoint(self) -> Endpoint:
+        return self.spec.nameservices[self._nameservice - 1].observers[self._id - 1]
+
     @property
     def volumes(self) -> Set[str]:
         return super().volumes.union({
-            "./hadoop/scripts/run_standby_nn.sh:/scripts/run_standby_nn.sh"
+            "./hadoop/scripts/run_observer_nn.sh:/scripts/run_observer_nn.sh",
+            "./hadoop/scripts/transition_to_observer.sh:/scripts/transition_to_observer.sh"
         })
 
     @property
-    def ports(self) -> Set[str]:
-        return {"9871:9870"}
+    def environment(self) -> Dict[str, str]:
+        env = super().environment
+        nameservice = self.spec.nameservices[self._nameservice - 1]
+        env.update({"NAMESERVICE": nameservice.name, "NAMENODE_ID": nameservice.observer_id(self._id - 1)})
+        return env
 
-    @property
-    def hosts(self) -> Set[str]:
-        return {self.name}
+
+class Router(HadoopNode):
+    def __init__(self, spec: ClusterSpec, _id: int):
+        super().__init__(spec)
+        self._id = _id
 
     @property
-    def name(self) -> str:
-        return "secondary-namenode"
+    def endpoint(self) -> Endpoint:
+        return self.spec.routers[self._id - 1]
 
     @property
-    def more_options(self) -> dict:
-        return {}
+    def volumes(self) -> Set[str]:
+        return super().volumes.union({
+            "./hadoop/scripts/run_router.sh:/scripts/run_router.sh"
+        })
 
 
 class ZookeeperNode(HadoopNode):
-    def __init__(self, _id):
+    def __init__(self, spec: ClusterSpec, _id: int):
+        super().__init__(spec)
         self._id = _id
 
+    @property
+    def endpoint(self) -> Endpoint:
+        return self.spec.zookeepers[self._id - 1]
+
     @property
     def volumes(self) -> Set[str]:
         return super().volumes.union({
@@ -309,132 +372,81 @@ class ZookeeperNode(HadoopNode):
         env.update({"MY_NODE_NUM": self._id})
         return env
 
-    @property
-    def ports(self) -> Set[str]:
-        return set()
-
-    @property
-    def hosts(self) -> Set[str]:
-        return {self.name}
-
-    @property
-    def name(self) -> str:
-        return "zookeeper" + str(self._id)
-
-    @property
-    def more_options(self) -> dict:
-        return {}
-
 
 class JournalNode(HadoopNode):
-    def __init__(self, _id):
+    def __init__(self, spec: ClusterSpec, _id: int):
+        super().__init__(spec)
         self._id = _id
 
+    @property
+    def endpoint(self) -> Endpoint:
+        return self.spec.journalnodes[self._id - 1]
+
     @property
     def volumes(self) -> Set[str]:
         return super().volumes.union({
             "./hadoop/scripts/run_journal.sh:/scripts/run_journal.sh"
         })
 
-    @property
-    def ports(self) -> Set[str]:
-        return set()
-
-    @property
-    def hosts(self) -> Set[str]:
-        return {self.name}
-
-    @property
-    def name(self) -> str:
-        return "journalnode" + str(self._id)
-
-    @property
-    def more_options(self) -> dict:
-        return {}
-
 
 class DataNode(HadoopNode):
-    def __init__(self, _id):
+    def __init__(self, spec: ClusterSpec, _id: int):
+        super().__init__(spec)
         self._id = _id
 
+    @property
+    def endpoint(self) -> Endpoint:
+        return self.spec.datanodes[self._id - 1]
+
     @property
     def volumes(self) -> Set[str]:
-        return super().volumes.union({
+        volumes = super().volumes.union({
             "./hadoop/scripts/run_datanode.sh:/scripts/run_datanode.sh",
             "./hadoop/scripts/run_nodemanager.sh:/scripts/run_nodemanager.sh"
         })
-
-    @property
-    def ports(self) -> Set[str]:
-        return {str(9864 + self._id - 1) + ":9864"}
-
-    @property
-    def hosts(self) -> Set[str]:
-        return {self.name}
-
-    @property
-    def name(self) -> str:
-        return "datanode" + str(self._id)
+        if self.spec.spark:
+            # NodeManager loads spark_shuffle aux-service from spark/yarn
+            volumes = volumes.union(self.spec.binary_volumes("spark", "/opt/spark"))
+        return volumes
 
     @property
     def more_options(self) -> dict:
-        return {}
+        options = super().more_options
+        if not self.spec.short_circuit:
+            return options
+        # Datanode creates its domain socket here, clients in the same container read blocks through it.
+        # tmpfs drops stale socket on restart, and is not world-writable as datanode requires
+        return dict(options, tmpfs=["{}:mode=755".format(ClusterSpec.DOMAIN_SOCKET_DIR)])
 
 
 class ResourceManager(HadoopNode):
+    @property
+    def endpoint(self) -> Endpoint:
+        return self.spec.resource_manager
+
     @property
     def volumes(self) -> Set[str]:
         return super().volumes.union({
            "./hadoop/scripts/run_rm.sh:/scripts/run_rm.sh"
         })
 
-    @property
-    def ports(self) -> Set[str]:
-        return {"8088:8088"}
-
-    @property
-    def hosts(self) -> Set[str]:
-        return {self.name}
-
-    @property
-    def name(self) -> str:
-        return "resource-manager"
 
+class YarnHistoryServer(HadoopNode):
     @property
-    def more_options(self) -> dict:
-        return {}
+    def endpoint(self) -> Endpoint:
+        return self.spec.yarn_history
 
-
-class YarnHistoryServer(HadoopNode):
     @property
     def volumes(self) -> Set[str]:
         return super().volumes.union({
             "./hadoop/scripts/run_yarn_hs.sh:/scripts/run_yarn_hs.sh"
         })
 
-    @property
-    def ports(self) -> Set[str]:
-        return {"8188:8188"}
-
-    @property
-    def hosts(self) -> Set[str]:
-        return {self.name}
-
-    @property
-    def name(self) -> str:
-        return "yarn-history"
-
-    @property
-    def more_options(self) -> dict:
-        return {}
-
 
 class HiveNode(HadoopNode):
     @property
     def volumes(self) -> Set[str]:
-        return super().volumes.union({
-            "./hive/hive-bin:/opt/hive"
-        })
+        return super().volumes.union(self.spec.binary_volumes("hive", "/opt/hive"))
 
     @property
     def environment(self) -> Dict[str, str]:
@@ -446,132 +458,92 @@ class HiveNode(HadoopNode):
         })
         return env
 
-    @property
-    def ports(self) -> Set[str]:
-        raise NotImplementedError()
-
-    @property
-    def hosts(self) -> Set[str]:
-        raise NotImplementedError()
 
+class HiveMetastore(HiveNode):
     @property
-    def name(self) -> str:
-        raise NotImplementedError()
+    def endpoint(self) -> Endpoint:
+        return self.spec.hive_metastore
 
-    @property
-    def more_options(self) -> dict:
-        return {}
-
-
-class HiveMetastore(HiveNode):
     @property
     def volumes(self) -> Set[str]:
         return super().volumes.union({
             "./hive/scripts/run_hive_metastore.sh:/scripts/run_hive_metastore.sh"
         })
 
-    @property
-    def ports(self) -> Set[str]:
-        return {"9083:9083"}
-
-    @property
-    def hosts(self) -> Set[str]:
-        return {self.name}
 
+class HiveServer(HiveNode):
     @property
-    def name(self) -> str:
-        return "hive-metastore"
-
+    def endpoint(self) -> Endpoint:
+        return self.spec.hive_server
 
-class HiveServer(HiveNode):
     @property
     def volumes(self) -> Set[str]:
         return super().volumes.union({
             "./hive/scripts/run_hive_server.sh:/scripts/run_hive_server.sh"
         })
 
-    @property
-    def ports(self) -> Set[str]:
-        return {"10000:10000", "10001:10001", "10002:10002"}
-
-    @property
-    def hosts(self) -> Set[str]:
-        return {self.name}
-
-    @property
-    def name(self) -> str:
-        return "hive-server"
-
 
 class SparkNode(HadoopNode):
     @property
     def volumes(self) -> Set[str]:
-        return super().volumes.union({"./spark/spark-bin:/opt/spark"})
+        return super().volumes.union(self.spec.binary_volumes("spark", "/opt/spark"))
 
     @property
     def environment(self) -> Dict[str, str]:
         env = super().environment
         env.update({"SPARK_HOME": "/opt/spark"})
+        if self.spec.read_only_binaries:
+            env.update({"SPARK_LOG_DIR": "/var/log/spark"})
         return env
 
-    @property
-    def more_options(self) -> dict:
-        return {}
-
 
 class SparkHistory(SparkNode):
+    @property
+    def endpoint(self) -> Endpoint:
+        return self.spec.spark_history_server
+
     @property
     def volumes(self) -> Set[str]:
         return super().volumes.union({
             "./spark-history/scripts/run_history_server.sh:/scripts/run_history_server.sh"
         })
 
-    @property
-    def ports(self) -> Set[str]:
-        return {"18080:18080"}
-
-    @property
-    def hosts(self) -> Set[str]:
-        return {self.name}
 
+class SparkThrift(SparkNode, HiveNode):
     @property
-    def name(self) -> str:
-        return "spark-history"
-
+    def endpoint(self) -> Endpoint:
+        return self.spec.spark_thrift_server
 
-class SparkThrift(SparkNode, HiveNode):
     @property
     def volumes(self) -> Set[str]:
         return super(SparkNode, self).volumes.union(super(HiveNode, self).volumes).union({
             "./spark-thrift/scripts/run_thrift_server.sh:/scripts/run_thrift_server.sh"
         })
 
-    @property
-    def ports(self) -> Set[str]:
-        return {"10010:10000", "10011:10001"}
 
-    @property
-    def hosts(self) -> Set[str]:
-        return {self.name}
+class PrestoNode(DockerComponent):
+    def __init__(self, spec: ClusterSpec):
+        self.spec = spec
 
     @property
-    def name(self) -> str:
-        return "spark-thrift"
-
+    def endpoint(self) -> Endpoint:
+        raise NotImplementedError()
 
-class PrestoNode(DockerComponent):
     @property
     def image(self) -> str:
         return "openjdk:8-jre-slim"
 
     @property
     def volumes(self) -> Set[str]:
-        return {
-            "./presto/presto-bin/bin:/opt/presto/bin",
-            "./presto/presto-bin/lib:/opt/presto/lib",
-            "./presto/presto-bin/plugin:/opt/presto/plugin",
-            "./presto/scripts/run.sh:/scripts/run_presto.sh"
+        volumes = {
+            "./presto/scripts/run.sh:/scripts/run_presto.sh",
+            "./hadoop/hadoop-bin/etc/hadoop:/etc/hadoop/conf:ro"
         }
+        for sub_dir in ["bin", "lib", "plugin"]:
+            volumes = volumes.union(self.spec.binary_volumes("presto", "/opt/presto/" + sub_dir, sub_dir))
+        if self.spec.hive:
+            volumes.add("./presto/conf/catalog:/opt/presto/etc/catalog")
+        return volumes
 
     @property
     def environment(self) -> Dict[str, str]:
@@ -579,23 +551,27 @@ class PrestoNode(DockerComponent):
             "PRESTO_HOME": "/opt/presto"
         }
 
-    @property
-    def more_options(self) -> dict:
-        return {}
-
-
-class PrestoServer(PrestoNode):
     @property
     def ports(self) -> Set[str]:
-        return set(["8080:8080"])
+        return self.endpoint.port_mappings
 
     @property
     def hosts(self) -> Set[str]:
-        return set([self.name])
+        return set([self.endpoint.host])
 
     @property
     def name(self) -> str:
-        return "presto-server"
+        return self.spec.container_name(self.endpoint.host)
+
+    @property
+    def more_options(self) -> dict:
+        return {}
+
+
+class PrestoServer(PrestoNode):
+    @property
+    def endpoint(self) -> Endpoint:
+        return self.spec.presto_server
 
     @property
     def volumes(self) -> Set[str]:
@@ -614,20 +590,13 @@ class PrestoServer(PrestoNode):
 
 
 class PrestoWorker(PrestoNode):
-    def __init__(self, _id):
+    def __init__(self, spec: ClusterSpec, _id: int):
+        super().__init__(spec)
         self._id = _id
 
     @property
-    def ports(self) -> Set[str]:
-        return set()
-
-    @property
-    def hosts(self) -> Set[str]:
-        return set([self.name])
-
-    @property
-    def name(self) -> str:
-        return f"presto-worker{self._id}"
+    def endpoint(self) -> Endpoint:
+        return self.spec.presto_workers[self._id - 1]
 
     @property
     def volumes(self) -> Set[str]:
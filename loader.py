@@ -0,0 +1,370 @@
+from __future__ import annotations
+import csv
+import datetime
+import http.client
+import io
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from argparse import ArgumentParser, Namespace
+from typing import Iterator, List
+from constants import HasConstants
+
+# Generates synthetic datasets and writes them into HDFS through WebHDFS of the datanodes with concurrent writers.
+# Run from repository root once cluster is up
+#   python loader.py --format csv --files 32 --file-size-mb 64 --writers 8 --partitions 4
+#   python loader.py --webhdfs-url http://127.0.0.1:9864 ...   # any WebHDFS, e.g. a stand-in server
+
+
+class LoaderError(Exception):
+    pass
+
+
+# Rows of a sales-like table. Every file has its own seed, so a dataset is reproducible with the same args
+class RowGenerator:
+    COLUMNS = ["id", "ts", "user_id", "category", "amount", "comment"]
+    CATEGORIES = ["books", "games", "music", "sports", "garden", "toys", "food", "tools"]
+    WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "hadoop", "hive", "spark", "presto", "local", "cluster"]
+
+    def __init__(self, seed: int, day: datetime.date):
+        self.random = random.Random(seed)
+        self.start = datetime.datetime.combine(day, datetime.time())
+        self.next_id = seed << 32
+
+    def rows(self) -> Iterator[list]:
+        r = self.random
+        while True:
+            self.next_id += 1
+            yield [self.next_id, (self.start + datetime.timedelta(seconds=r.randrange(86400))).isoformat(),
+                   r.randrange(1000000), r.choice(self.CATEGORIES), round(r.uniform(0.5, 500), 2),
+                   " ".join(r.choice(self.WORDS) for _ in range(r.randrange(3, 12)))]
+
+
+# Serializes rows into chunks of about CHUNK_BYTES until a file reaches its size
+class DataFormat:
+    name = ""
+    extension = ""
+    CHUNK_BYTES = 1024 * 1024
+
+    # Fails before any request is sent when the format can't be written
+    def check(self) -> None:
+        pass
+
+    def stream(self, rows: Iterator[list], size: int, stats: dict) -> Iterator[bytes]:
+        raise NotImplementedError
+
+
+class CsvFormat(DataFormat):
+    name = "csv"
+    extension = "csv"
+
+    def stream(self, rows: Iterator[list], size: int, stats: dict) -> Iterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(RowGenerator.COLUMNS)
+        written = 0
+        while written < size:
+            writer.writerows(next(rows) for _ in range(1000))
+            stats["rows"] += 1000
+            if buffer.tell() >= self.CHUNK_BYTES:
+                chunk = buffer.getvalue().encode("UTF-8")
+                buffer.seek(0)
+                buffer.truncate()
+                written += len(chunk)
+                yield chunk
+        if buffer.tell():
+            yield buffer.getvalue().encode("UTF-8")
+
+
+class JsonFormat(DataFormat):
+    name = "json"
+    extension = "json"
+
+    def stream(self, rows: Iterator[list], size: int, stats: dict) -> Iterator[bytes]:
+        written = 0
+        while written < size:
+            lines = [json.dumps(dict(zip(RowGenerator.COLUMNS, next(rows)))) for _ in range(1000)]
+            stats["rows"] += len(lines)
+            chunk = ("\n".join(lines) + "\n").encode("UTF-8")
+            written += len(chunk)
+            yield chunk
+
+
+# Needs pyarrow, which isn't a requirement of the generator, so it is imported only when chosen
+class ParquetFormat(DataFormat):
+    name = "parquet"
+    extension = "parquet"
+    ROW_GROUP = 100000
+
+    class ChunkSink:
+        # File object pyarrow writes to, written bytes are taken out as chunks instead of kept
+        def __init__(self):
+            self.chunks = []
+            self.position = 0
+            self.closed = False
+
+        def write(self, data) -> int:
+            self.chunks.append(bytes(data))
+            self.position += len(data)
+            return len(data)
+
+        def tell(self) -> int:
+            return self.position
+
+        def flush(self) -> None:
+            pass
+
+        def close(self) -> None:
+            self.closed = True
+
+        def take(self) -> bytes:
+            chunk = b"".join(self.chunks)
+            self.chunks = []
+            return chunk
+
+    def check(self) -> None:
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise LoaderError("--format parquet requires pyarrow, pip install pyarrow")
+
+    @staticmethod
+    def table(group: List[list]):
+        import pyarrow
+        return pyarrow.table({c: [row[i] for row in group] for i, c in enumerate(RowGenerator.COLUMNS)})
+
+    def stream(self, rows: Iterator[list], size: int, stats: dict) -> Iterator[bytes]:
+        import pyarrow.parquet
+        sink = self.ChunkSink()
+        writer = None
+        while sink.tell() < size:
+            group = [next(rows) for _ in range(self.ROW_GROUP)]
+            table = self.table(group)
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(sink, table.schema, compression="snappy")
+            writer.write_table(table)
+            stats["rows"] += len(group)
+            yield sink.take()
+        if writer is None:
+            # Empty file(size 0) still has the schema, taken from a row that isn't written
+            writer = pyarrow.parquet.ParquetWriter(sink, self.table([next(rows)]).schema, compression="snappy")
+        writer.close()
+        yield sink.take()
+
+
+FORMATS = {f.name: f for f in [CsvFormat(), JsonFormat(), ParquetFormat()]}
+
+
+class FileTask:
+    def __init__(self, path: str, seed: int, day: datetime.date, size: int):
+        self.path = path
+        self.seed = seed
+        self.day = day
+        self.size = size
+
+
+# Client of datanode WebHDFS. Creating through the namenode redirects to a datanode address(container IP) which isn't
+# reachable from docker host, so files are created on a datanode directly and it asks namenode(nameservice) itself
+class WebHdfsClient:
+    def __init__(self, url: str, nameservice: str, user: str, timeout: float):
+        parsed = urllib.parse.urlparse(url)
+        self.url = url
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.nameservice = nameservice
+        self.user = user
+        self.timeout = timeout
+
+    def create(self, path: str, chunks: Iterator[bytes], replication: int = None) -> int:
+        params = {"op": "CREATE", "namenoderpcaddress": self.nameservice, "user.name": self.user, "overwrite": "true"}
+        if replication:
+            params["replication"] = str(replication)
+        stats = {"bytes": 0}
+
+        def counted():
+            for chunk in chunks:
+                stats["bytes"] += len(chunk)
+                yield chunk
+
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            # Chunked, a file is never held in memory
+            connection.request("PUT", "/webhdfs/v1{}?{}".format(urllib.parse.quote(path),
+                                                                urllib.parse.urlencode(params)),
+                               body=counted(), headers={"Content-Type": "application/octet-stream"},
+                               encode_chunked=True)
+            response = connection.getresponse()
+            body = response.read()
+        except OSError as e:
+            raise LoaderError("Failed to write {} through {}: {}".format(path, self.url, e))
+        finally:
+            connection.close()
+        if response.status != 201:
+            raise LoaderError("Failed to write {} through {}: {} {}".format(path, self.url, response.status,
+                                                                            body.decode("UTF-8", "replace")[:500]))
+        return stats["bytes"]
+
+
+class Writer(threading.Thread):
+    def __init__(self, client: WebHdfsClient, tasks: queue.Queue, data_format: DataFormat, replication: int = None):
+        super().__init__(daemon=True)
+        self.client = client
+        self.tasks = tasks
+        self.data_format = data_format
+        self.replication = replication
+        self.results = []
+        self.error = None
+
+    def run(self) -> None:
+        while True:
+            try:
+                task = self.tasks.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                stats = {"rows": 0}
+                start = time.monotonic()
+                chunks = self.data_format.stream(RowGenerator(task.seed, task.day).rows(), task.size, stats)
+                written = self.client.create(task.path, chunks, self.replication)
+                self.results.append({"path": task.path, "datanode": self.client.url, "bytes": written,
+                                     "rows": stats["rows"], "elapsed_s": time.monotonic() - start})
+            except Exception as e:
+                self.error = e
+                return
+
+
+class DataLoader:
+    def __init__(self, urls: List[str], nameservice: str, user: str, data_format: DataFormat, writers: int,
+                 timeout: float, replication: int = None):
+        self.urls = urls
+        self.nameservice = nameservice
+        self.user = user
+        self.data_format = data_format
+        self.writers = writers
+        self.timeout = timeout
+        self.replication = replication
+
+    def plan(self, directory: str, files: int, size: int, partitions: int, seed: int,
+             first_day: datetime.date) -> List[FileTask]:
+        tasks = []
+        for i in range(files):
+            # Hive style partition directories, files are spread evenly over them
+            day = first_day + datetime.timedelta(days=i % partitions)
+            partition = "dt={}/".format(day.isoformat()) if partitions > 1 else ""
+            path = "{}/{}part-{:05d}.{}".format(directory.rstrip("/"), partition, i, self.data_format.extension)
+            tasks.append(FileTask(path, seed + i, day, size))
+        return tasks
+
+    def load(self, tasks: List[FileTask]) -> dict:
+        self.data_format.check()
+        pending = queue.Queue()
+        for task in tasks:
+            pending.put(task)
+        # Writers are spread round robin over datanodes, the first replica of each block lands on its datanode
+        writers = [Writer(WebHdfsClient(self.urls[i % len(self.urls)], self.nameservice, self.user, self.timeout),
+                          pending, self.data_format, self.replication) for i in range(self.writers)]
+        start = time.monotonic()
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        elapsed = time.monotonic() - start
+        errors = [str(w.error) for w in writers if w.error]
+        return self.report([r for w in writers for r in w.results], elapsed, errors)
+
+    def report(self, results: List[dict], elapsed: float, errors: List[str]) -> dict:
+        total = sum(r["bytes"] for r in results)
+        per_datanode = {}
+        for result in results:
+            node = per_datanode.setdefault(result["datanode"], {"files": 0, "bytes": 0})
+            node["files"] += 1
+            node["bytes"] += result["bytes"]
+        mb = 1024 * 1024
+        return {
+            "format": self.data_format.name, "writers": self.writers, "files": len(results),
+            "bytes": total, "rows": sum(r["rows"] for r in results), "elapsed_s": elapsed,
+            "throughput_mb_s": total / mb / elapsed if elapsed else 0.0,
+            "file_throughput_mb_s": [r["bytes"] / mb / r["elapsed_s"] for r in results if r["elapsed_s"]],
+            "datanodes": per_datanode, "results": sorted(results, key=lambda r: r["path"]), "errors": errors
+        }
+
+
+def datanode_urls(topology: dict, address: str) -> List[str]:
+    urls = []
+    for datanode in topology["datanodes"]:
+        port = datanode["ports"]["rpc-port"]
+        if address == "internal":
+            urls.append("http://{}:{}".format(datanode["host"], port))
+        else:
+            # Each datanode publishes its http port on its own host port
+            published = [h for h, c in datanode["published"] if c == port]
+            if not published:
+                raise LoaderError("{} doesn't publish its WebHDFS port {} to host, use --address internal or "
+                                  "--webhdfs-url".format(datanode["host"], port))
+            urls.append("http://localhost:{}".format(published[0]))
+    return urls
+
+
+def parse_loader_arg(argv: list[str] = None) -> Namespace:
+    parser = ArgumentParser(description="Write synthetic datasets into HDFS through WebHDFS with concurrent writers")
+    parser.add_argument("--format", default="csv", choices=sorted(FORMATS.keys()),
+                        help="File format, parquet requires pyarrow. Default csv")
+    parser.add_argument("--directory", default="/user/webhdfs/loader", help="HDFS directory to write to")
+    parser.add_argument("--files", default=16, type=int, help="Number of files. Default 16")
+    parser.add_argument("--file-size-mb", default=64, type=int, help="Approximate size of each file. Default 64")
+    parser.add_argument("--partitions", default=1, type=int,
+                        help="Spread files over this many dt=YYYY-MM-DD partition directories. Default 1(none)")
+    parser.add_argument("--writers", default=8, type=int, help="Concurrent writers. Default 8")
+    parser.add_argument("--replication", type=int, help="Replication of written files. Default dfs.replication")
+    parser.add_argument("--seed", default=0, type=int, help="Seed of generated rows")
+    parser.add_argument("--user", default="webhdfs", help="HDFS user to write as. Default webhdfs")
+    parser.add_argument("--topology", default=os.path.join(HasConstants.TARGET_BASE_PATH, "topology.json"),
+                        help="Topology written by main.py. Default target/topology.json")
+    parser.add_argument("--address", default="published", choices=["published", "internal"],
+                        help="published: datanodes through their host ports(from docker host), internal: through "
+                             + "their aliases(from a container in hadoop.net). Default published")
+    parser.add_argument("--webhdfs-url", action="append",
+                        help="WebHDFS base URL to write through instead of datanodes of topology, can be repeated")
+    parser.add_argument("--nameservice", help="Namenode RPC address datanodes resolve. Default cluster name")
+    parser.add_argument("--timeout", default=600, type=float, help="Socket timeout of each request in seconds")
+    parser.add_argument("--output", help="Write throughput report as JSON to this path. Default stdout")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_loader_arg()
+    topology = {}
+    if not args.webhdfs_url or not args.nameservice:
+        with open(args.topology) as f:
+            topology = json.load(f)
+    try:
+        loader = DataLoader(args.webhdfs_url or datanode_urls(topology, args.address),
+                            args.nameservice or topology["cluster_name"], args.user, FORMATS[args.format],
+                            args.writers, args.timeout, args.replication)
+        tasks = loader.plan(args.directory, args.files, args.file_size_mb * 1024 * 1024, args.partitions,
+                            args.seed, datetime.date(2021, 1, 1))
+        report = loader.load(tasks)
+    except LoaderError as e:
+        print(e, file=sys.stderr)
+        exit(1)
+    print("{} files, {:.1f}MB in {:.1f}s, {:.1f}MB/s".format(report["files"], report["bytes"] / 1024 / 1024,
+                                                          report["elapsed_s"], report["throughput_mb_s"]),
+          file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if report["errors"]:
+        print("\n".join(report["errors"]), file=sys.stderr)
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
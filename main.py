@@ -1,11 +1,57 @@
-from argparse import ArgumentParser, Namespace
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+import json
+import os
+import re
 import traceback
-from component import ComponentFactory, DownloadRequired, FilesCopyRequired, TemplateRequired, DecompressRequired
-from utils import DownloadUtil, TemplateUtil, CopyUtil, DecompressUtil, FileUtil
-from docker_compose import build_components, generate_yaml
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Tuple
+from constants import HasConstants
+from fingerprint import Fingerprint
+from profiler import Profiler
+from tuning import Tuning
 
+# Stands for the target directory in default paths until it is chosen(use_target_of), --cluster-id moves it
+TARGET_PLACEHOLDER = "<target>"
 
-def parse_arg() -> Namespace:
+
+def cluster_id(value: str) -> str:
+    # Used in container, network and compose project names
+    if not re.fullmatch("[a-z0-9][a-z0-9-]*", value):
+        raise ArgumentTypeError("cluster id must consist of lowercase letters, digits and '-': " + value)
+    return value
+
+
+def ec_policy(value: str) -> str:
+    from cluster import ClusterSpec
+    # Cell size is optional, e.g. RS-6-3 is RS-6-3-1024k
+    policy = value.upper()
+    if not re.search("-[0-9]+K$", policy):
+        policy += "-1024K"
+    policy = policy[:-1] + "k"
+    if policy not in ClusterSpec.EC_POLICIES:
+        raise ArgumentTypeError("unknown erasure coding policy {}, choose from {}".format(
+            value, ", ".join(ClusterSpec.EC_POLICIES)))
+    return policy
+
+
+def ec_dirs(value: str) -> list[str]:
+    dirs = [d.strip() for d in value.split(",") if d.strip()]
+    if not dirs or not all(d.startswith("/") for d in dirs):
+        raise ArgumentTypeError("erasure coding directories must be absolute HDFS paths: " + value)
+    return dirs
+
+
+def netem_rule(value: str) -> Tuple[str, str]:
+    from cluster import ClusterSpec
+    target, _, profile = value.partition("=")
+    if profile not in ClusterSpec.NETEM_PROFILES:
+        raise ArgumentTypeError("network profile must be one of {}: {}".format(
+            ", ".join(ClusterSpec.NETEM_PROFILES), value))
+    return target, profile
+
+
+def parse_arg(argv: list[str] = None) -> Namespace:
     # Todo: Target clean up option
     parser = ArgumentParser(description="Docker hadoop compose yaml generator")
     parser.add_argument("--num-datanode", default=1, type=int, help="number of datanode. Default 1")
@@ -18,6 +64,9 @@ def parse_arg() -> Namespace:
     parser.add_argument("--hue", action='store_true', help="build hue")
     parser.add_argument("--presto", action='store_true', help="build presto server")
     parser.add_argument("--num-presto-worker", default=1, type=int, help="number of presto worker")
+    parser.add_argument("--presto-memory-mb", type=int,
+                        help="JVM heap of each presto server/worker in MB, query memory limits are derived from it. "
+                             + "Default derived from host memory, tuning profile and number of presto worker")
     parser.add_argument("--presto-spark", action='store_true', help="build presto on spark")
     parser.add_argument("--all", action='store_true', help="Equivalent to --hive --spark --spark-thrift --hue --presto")
 
@@ -42,23 +91,226 @@ def parse_arg() -> Namespace:
 
     # Docker image name
     parser.add_argument("--image-name-hadoop", default="local-hadoop", help="hadoop docker image name")
-    return parser.parse_args()
+
+    parser.add_argument("--short-circuit", action='store_true',
+                        help="Enable HDFS short-circuit local reads through a domain socket, so presto workers read "
+                             + "blocks of the co-located datanode without going through TCP")
+
+    parser.add_argument("--nameservices", default=1, type=int,
+                        help="Number of HA nameservices. With more than 1, HDFS is federated: namenodes of the other "
+                             + "nameservices run in their own containers, datanodes serve every nameservice and "
+                             + "clients see them as one file system through routers. Default 1")
+
+    parser.add_argument("--observers", default=0, type=int,
+                        help="Number of observer namenodes of each nameservice. Clients read from observers "
+                             + "(ObserverReadProxyProvider) and write to active namenode. Default 0")
+
+    parser.add_argument("--racks", type=int, default=0,
+                        help="Number of racks datanodes are assigned to round robin(datanode1 to /rack1, datanode2 "
+                             + "to /rack2...), HDFS and YARN resolve them with a topology script. Default no racks, "
+                             + "every node is in /default-rack")
+    parser.add_argument("--netem", type=netem_rule, action="append",
+                        help="TARGET=PROFILE, shape egress traffic of TARGET with tc netem profile(lan, rack, "
+                             + "cross-rack, wan, lossy). TARGET is a link class, datanode-datanode, client-namenode or "
+                             + "cross-rack(between datanodes of different --racks), or a service(e.g. datanode2, "
+                             + "resource-manager) whose whole container is shaped. "
+                             + "Repeatable. Profiles can be changed at runtime with target/bin/netem.py")
+    parser.add_argument("--netem-runtime", action='store_true',
+                        help="Give NET_ADMIN to every hadoop container, so target/bin/netem.py can shape any target "
+                             + "at runtime. Default only containers of --netem targets are given NET_ADMIN")
+
+    parser.add_argument("--ec-policy", type=ec_policy,
+                        help="Erasure code new files under --ec-dirs with this policy(RS-3-2, RS-6-3, RS-10-4, "
+                             + "RS-LEGACY-6-3, XOR-2-1) instead of replicating them. Needs as many datanodes as data "
+                             + "and parity units of the policy")
+    parser.add_argument("--ec-dirs", type=ec_dirs,
+                        help="Comma separated HDFS directories --ec-policy is set on. Default /user,/bench,/benchmarks")
+
+    # Capacity tuning
+    parser.add_argument("--tuning-profile", default=Tuning.DEFAULT_PROFILE, choices=sorted(Tuning.PROFILES.keys()),
+                        help="YARN/HDFS capacity profile, memory/vcores of NodeManagers are derived from host "
+                             + "resources and number of datanode. Default " + Tuning.DEFAULT_PROFILE)
+    parser.add_argument("--host-memory-mb", type=int,
+                        help="Memory available to docker in MB. Default detected, set it on Docker Desktop")
+    parser.add_argument("--host-cpus", type=int, help="Cpus available to docker. Default detected")
+
+    parser.add_argument("--cluster-id", type=cluster_id,
+                        help="Generate an isolated cluster under target/clusters/{id}, its containers and network are "
+                             + "prefixed with the id and host ports are shifted to a free range. Clusters with an id "
+                             + "mount binaries extracted once under target/shared read-only")
+
+    parser.add_argument("--dedup-binaries", action='store_true',
+                        help="Keep extracted binaries in a content addressed store(target/store) and hardlink them "
+                             + "into hadoop-bin, spark-bin..., files shared between versions are stored once")
+    parser.add_argument("--gc-store", action='store_true',
+                        help="After generating, remove releases and files of the binary store no extracted tree uses")
+
+    parser.add_argument("--matrix",
+                        help="YAML spec of version combos to generate at once, each into target/clusters/{name}. "
+                             + "Downloads and extractions are shared between combos. See matrix.py")
+    parser.add_argument("--matrix-manifest", default=os.path.join(TARGET_PLACEHOLDER, "matrix.json"),
+                        help="Where --matrix writes compose file, builder script and status of each target. "
+                             + "Default target/matrix.json")
+    parser.add_argument("--matrix-parallelism", type=int, default=os.cpu_count(),
+                        help="Number of targets of --matrix generated in parallel. Default number of cpus")
+
+    parser.add_argument("--force-generate", action='store_true',
+                        help="Regenerate target even though args, templates and versions are unchanged since last run")
+
+    # Profiling
+    parser.add_argument("--profile", nargs="?", const=os.path.join(TARGET_PLACEHOLDER, "profile.json"),
+                        help="Write wall/cpu time, bytes and files of each phase and component as JSON. "
+                             + "Default target/profile.json(of the cluster with --cluster-id)")
+    parser.add_argument("--cprofile", nargs="?", const=os.path.join(TARGET_PLACEHOLDER, "profile.prof"),
+                        help="Write cProfile stats of generator. Default target/profile.prof(of the cluster with "
+                             + "--cluster-id)")
+    args = parser.parse_args(argv)
+    from cluster import ClusterSpec
+    if args.num_datanode < 1:
+        parser.error("--num-datanode must be at least 1")
+    if args.nameservices < 1:
+        parser.error("--nameservices must be at least 1")
+    if not 0 <= args.observers <= ClusterSpec.MAX_OBSERVER:
+        parser.error("--observers must be between 0 and {}".format(ClusterSpec.MAX_OBSERVER))
+    if not 0 <= args.racks <= args.num_datanode:
+        parser.error("--racks must be between 0 and --num-datanode, {}".format(args.num_datanode))
+    if args.netem:
+        targets = ClusterSpec.from_args(args).netem_targets
+        unknown = [target for target, _ in args.netem if target not in targets]
+        if unknown:
+            parser.error("unknown --netem target {}, choose from {}".format(", ".join(unknown), ", ".join(targets)))
+    if args.ec_policy:
+        width = sum(ClusterSpec.EC_POLICIES[args.ec_policy])
+        if args.num_datanode < width:
+            parser.error("--ec-policy {} spreads each block group over {} datanodes, but --num-datanode is {}".format(
+                args.ec_policy, width, args.num_datanode))
+    return args
+
+
+def use_target_of(args: Namespace) -> None:
+    if args.cluster_id:
+        HasConstants.TARGET_BASE_PATH = os.path.join(HasConstants.CLUSTERS_PATH, args.cluster_id)
+        os.makedirs(HasConstants.TARGET_BASE_PATH, exist_ok=True)
+    for name in ["profile", "cprofile", "matrix_manifest"]:
+        path = getattr(args, name, None)
+        if path and path.startswith(TARGET_PLACEHOLDER + os.sep):
+            setattr(args, name, os.path.join(HasConstants.TARGET_BASE_PATH, path[len(TARGET_PLACEHOLDER + os.sep):]))
+
+
+def generate(args: Namespace) -> list[Path]:
+    # Imported here to keep the no-op path fast
+    from collections import Counter
+    from cluster import ClusterSpec
+    from component import ComponentFactory
+    from utils import PipelineUtil, FileUtil, ImageUtil
+    from docker_compose import build_components, containers_by_host, generate_yaml
+
+    use_target_of(args)
+    # Template data and compose services are both derived from this one spec
+    spec = ClusterSpec.from_args(args)
+    published = Counter(int(port.split(":")[0]) for instance in build_components(spec) for port in instance.ports)
+    # Blocks of host ports are disjoint, but enough nameservices reach ports of other components
+    duplicated = sorted(port for port, count in published.items() if count > 1)
+    if duplicated:
+        raise ValueError("Host ports {} would be published by more than one container".format(
+            ", ".join(map(str, duplicated))))
+    if spec.cluster_id:
+        from ports import PortRegistry
+        spec = ClusterSpec.from_args(args, PortRegistry().allocate(spec.cluster_id, set(published)))
+    components = ComponentFactory.get_components(args, spec)
+
+    def write_compose():
+        instances = build_components(spec)
+        FileUtil.write_to_target("docker-compose.yml", generate_yaml(instances, spec.network))
+        topology = dict(spec.topology, containers=containers_by_host(instances))
+        FileUtil.write_to_target("topology.json", json.dumps(topology, indent=2) + "\n")
+
+    # Binaries are downloaded/decompressed per component in background, everything else doesn't need them
+    PipelineUtil.run_all(components, spec.template_data, write_compose)
+    # Build contexts are complete only once everything is written
+    build_plan = ImageUtil.write_build_plan(components)
+    return FileUtil.outputs_of(components) + [Path(HasConstants.TARGET_BASE_PATH, name)
+                                              for name in ["docker-compose.yml", "topology.json"]] + [build_plan]
+
+
+# Generates target of args unless it is up to date, returns whether it is generated
+def build_target(args: Namespace) -> bool:
+    use_target_of(args)
+    profiling = args.profile or args.cprofile
+    fingerprint = Fingerprint(args)
+    if not (args.force_generate or profiling) and fingerprint.is_fresh():
+        print("Nothing has changed since last run, {} is up to date".format(HasConstants.TARGET_BASE_PATH))
+        return False
+    fingerprint.invalidate()
+
+    profiler = Profiler()
+    with profiler.activate(cprofile=bool(args.cprofile)) if profiling else nullcontext():
+        outputs = generate(args)
+    fingerprint.save(outputs)
+    if args.profile:
+        profiler.dump_report(args.profile)
+        print("Profile report is written to {}".format(args.profile))
+    if args.cprofile:
+        profiler.dump_cprofile(args.cprofile)
+        print("cProfile stats are written to {}".format(args.cprofile))
+    return True
+
+
+# Runs in a worker process of --matrix, failure of a combo doesn't stop the others
+def build_matrix_target(name: str, args: Namespace) -> dict:
+    from matrix import Matrix
+    try:
+        return Matrix.target_entry(name, "generated" if build_target(args) else "up to date")
+    except Exception as e:
+        traceback.print_exc()
+        return Matrix.target_entry(name, "failed", "{}: {}".format(type(e).__name__, e))
+
+
+def run_matrix(args: Namespace) -> None:
+    from concurrent.futures import ProcessPoolExecutor
+    from component import ComponentFactory
+    from matrix import Matrix
+    from utils import PrefetchUtil
+
+    # Manifest goes into the target of the generator, targets of combos are chosen below
+    use_target_of(args)
+    matrix = Matrix.load(args.matrix)
+    targets = matrix.targets(parse_arg, args)
+    components = []
+    for _, target_args in targets:
+        use_target_of(target_args)
+        components += ComponentFactory.get_components(target_args)
+    PrefetchUtil.prefetch_all(components)
+    for _, target_args in targets:
+        # Forced downloads are done above, once
+        if Fingerprint(target_args).force_download:
+            for key in vars(target_args):
+                if key.startswith("force_download"):
+                    setattr(target_args, key, False)
+            target_args.force_generate = True
+
+    # Rendering is cpu bound, every target is generated in a process of its own
+    with ProcessPoolExecutor(max_workers=args.matrix_parallelism) as pool:
+        entries = list(pool.map(build_matrix_target, *zip(*targets)))
+    matrix.write_manifest(args.matrix_manifest, entries)
+    print("Matrix manifest is written to {}".format(args.matrix_manifest))
+    failed = [entry["name"] for entry in entries if entry["status"] == "failed"]
+    if failed:
+        raise RuntimeError("Failed to generate {} of {} targets: {}".format(len(failed), len(entries),
+                                                                            ", ".join(failed)))
 
 
-def run():
-    args = parse_arg()
+def run(args: Namespace = None):
+    args = args or parse_arg()
     try:
-        components = ComponentFactory.get_components(args)
-        to_download = list(filter(lambda c: isinstance(c, DownloadRequired), components))
-        DownloadUtil().download_all(to_download)
-        to_decompress = list(filter(lambda c: isinstance(c, DecompressRequired), components))
-        DecompressUtil().decompress_all(to_decompress)
-        to_copy = list(filter(lambda c: isinstance(c, FilesCopyRequired), components))
-        CopyUtil().copy_all(to_copy)
-
-        to_template = list(filter(lambda c: isinstance(c, TemplateRequired), components))
-        TemplateUtil().do_template(to_template)
-        FileUtil.write_to_target("docker-compose.yml", generate_yaml(build_components(args)))
+        if args.matrix:
+            run_matrix(args)
+        else:
+            build_target(args)
+        # Releases are unreferenced only once trees of this run replaced them
+        if args.gc_store:
+            from store import BinaryStore
+            BinaryStore().gc()
 
         # template_data = config_builder.build_config_from_args(args)
         # downloader.download(args)
@@ -68,7 +320,7 @@ def run():
         # file_handler.write_all_templates(images_to_build, template, template_data)
         # file_handler.write_docker_compose(docker_compose.generate_yaml(template_data))
     except Exception as e:
-        traceback.print_exception()
+        traceback.print_exc()
         # print("Template data: {}".format(template_data))
         exit(-1)
 
@@ -0,0 +1,99 @@
+from __future__ import annotations
+import json
+import os
+import re
+from argparse import Namespace
+from typing import Callable, Tuple
+from constants import HasConstants
+
+
+# Targets of several version combos generated in one run(--matrix). Spec is YAML, options are named as main.py
+# options without leading "--"
+#   defaults:                 # options of every combo
+#     num-datanode: 2
+#     hive: true
+#   combos:
+#     - hadoop-version: 3.3.0
+#       spark-version: 3.1.1
+#     - name: legacy          # cluster id of the target. Default derived from options, e.g. hadoop322-java11
+#       hadoop-version: 3.2.2
+#       java-version: "11"
+# Every combo is generated as a cluster with an id(target/clusters/{name}), so combos with the same release of a
+# component share its download and extracted tree under target/shared
+class Matrix(HasConstants):
+    # Options of the command line applied to every combo
+    FORWARDED_ARGS = ["dedup_binaries", "force_generate"]
+    RESERVED_OPTIONS = ["cluster-id", "matrix", "matrix-manifest", "matrix-parallelism"]
+
+    def __init__(self, path: str, combos: list[Tuple[str, list[str]]]):
+        self.path = path
+        self.combos = combos
+
+    @classmethod
+    def load(cls, path: str) -> Matrix:
+        import yaml  # Deferred, it is slow to import
+        with open(path) as f:
+            spec = yaml.safe_load(f) or {}
+        defaults = spec.get("defaults") or {}
+        if not spec.get("combos"):
+            raise ValueError("Matrix {} has no combos".format(path))
+        combos = []
+        for combo in spec["combos"]:
+            options = dict(defaults, **combo)
+            reserved = [key for key in cls.RESERVED_OPTIONS if key in options]
+            if reserved:
+                raise ValueError("{} can't be set in matrix {}".format(", ".join(reserved), path))
+            name = str(options.pop("name", None) or cls.name_of(combo))
+            combos.append((name, cls.to_argv(options)))
+        names = [name for name, _ in combos]
+        duplicated = sorted({name for name in names if names.count(name) > 1})
+        if duplicated:
+            raise ValueError("Combos of matrix {} have the same name: {}".format(path, ", ".join(duplicated)))
+        return cls(path, combos)
+
+    @staticmethod
+    def name_of(combo: dict) -> str:
+        name = "-".join(key.replace("-version", "") + re.sub("[^a-z0-9]", "", str(value).lower())
+                        for key, value in combo.items())
+        return name or "default"
+
+    @staticmethod
+    def to_argv(options: dict) -> list[str]:
+        argv = []
+        for key, value in options.items():
+            if value is True:
+                argv.append("--" + key)
+            elif isinstance(value, list):  # Repeatable option, e.g. netem
+                for item in value:
+                    argv += ["--" + key, str(item)]
+            elif value is not False and value is not None:
+                argv += ["--" + key, str(value)]
+        return argv
+
+    # Parsed args of each combo, as if main.py is run with them
+    def targets(self, parse_arg: Callable[[list[str]], Namespace], args: Namespace) -> list[Tuple[str, Namespace]]:
+        forwarded = ["--" + key.replace("_", "-") for key in self.FORWARDED_ARGS if getattr(args, key)]
+        return [(name, parse_arg(["--cluster-id", name] + argv + forwarded)) for name, argv in self.combos]
+
+    @classmethod
+    def target_entry(cls, name: str, status: str, error: str = None) -> dict:
+        target = os.path.join(cls.CLUSTERS_PATH, name)
+        entry = {
+            "name": name, "status": status, "target": target,
+            "compose": os.path.join(target, "docker-compose.yml"),
+            "builder": os.path.join(target, "bin", "builder.sh"),
+            "topology": os.path.join(target, "topology.json")
+        }
+        if error:
+            entry["error"] = error
+            return entry
+        with open(entry["topology"]) as f:
+            topology = json.load(f)
+        entry.update(versions=topology["versions"], components=topology["components"])
+        return entry
+
+    def write_manifest(self, path: str, entries: list[dict]) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"matrix": os.path.abspath(self.path), "targets": entries}, f, indent=2)
+            f.write("\n")
@@ -0,0 +1,93 @@
+from __future__ import annotations
+import fcntl
+import json
+import os
+import socket
+from contextlib import contextmanager
+from constants import HasConstants
+
+
+# Host ports of clusters generated with --cluster-id. Every cluster publishes default ports shifted by an offset, which
+# is picked so that none of its ports is registered by another cluster or bound on the host. The registry is shared by
+# generators running in parallel, so it is only read and written under a file lock
+class PortRegistry(HasConstants):
+    FILE_NAME = "ports.json"
+    OFFSET_STEP = 1000
+    MAX_PORT = 65535
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(self.CLUSTERS_PATH, self.FILE_NAME)
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                registry = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Clusters whose target was removed don't hold their ports anymore
+        return {cluster_id: entry for cluster_id, entry in registry.items()
+                if os.path.isdir(os.path.join(self.CLUSTERS_PATH, cluster_id))}
+
+    def _save(self, registry: dict) -> None:
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(registry, f, indent=2, sort_keys=True)
+        os.replace(temp, self.path)
+
+    @staticmethod
+    def is_free(port: int) -> bool:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            try:
+                s.bind(("0.0.0.0", port))
+            except OSError:
+                return False
+        return True
+
+    # Offset to add to default host ports of the cluster, the same one as last time if it is still usable
+    def allocate(self, cluster_id: str, ports: set[int]) -> int:
+        with self._locked():
+            registry = self._load()
+            previous = registry.pop(cluster_id, None)
+            taken = {port for entry in registry.values() for port in entry["ports"]}
+            candidates = [k * self.OFFSET_STEP for k in range(1, (self.MAX_PORT - max(ports)) // self.OFFSET_STEP + 1)]
+            if previous:
+                candidates.insert(0, previous["offset"])
+            for offset in candidates:
+                shifted = {port + offset for port in ports}
+                # Ports held last time may be bound by this very cluster running
+                held = set(previous["ports"]) if previous and previous["offset"] == offset else set()
+                if shifted & taken or not all(self.is_free(port) for port in shifted - held):
+                    continue
+                registry[cluster_id] = {"offset": offset, "ports": sorted(shifted)}
+                self._save(registry)
+                return offset
+        raise RuntimeError("No free host port range for cluster {}".format(cluster_id))
+
+    # Ports of a running cluster are added or removed(scale.py). It keeps its offset, so published ports of running
+    # containers don't change, and fails if any added port is taken
+    def resize(self, cluster_id: str, ports: set[int]) -> int:
+        with self._locked():
+            registry = self._load()
+            previous = registry.pop(cluster_id, None)
+            if previous is None:
+                raise RuntimeError("Cluster {} has no host ports registered".format(cluster_id))
+            taken = {port for entry in registry.values() for port in entry["ports"]}
+            shifted = {port + previous["offset"] for port in ports}
+            added = shifted - set(previous["ports"])
+            unavailable = sorted((shifted & taken) | {port for port in added if not self.is_free(port)})
+            if unavailable:
+                raise RuntimeError("Host ports {} of cluster {} are taken".format(
+                    ", ".join(map(str, unavailable)), cluster_id))
+            registry[cluster_id] = {"offset": previous["offset"], "ports": sorted(shifted)}
+            self._save(registry)
+            return previous["offset"]
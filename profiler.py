@@ -0,0 +1,170 @@
+from __future__ import annotations
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+
+class PhaseRecord:
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.start = None
+        self.end = None
+        self.counters = {}
+
+    def add(self, start: float, end: float, cpu: float) -> None:
+        self.calls += 1
+        self.wall += end - start
+        self.cpu += cpu
+        self.start = start if self.start is None else min(self.start, start)
+        self.end = end if self.end is None else max(self.end, end)
+
+    def as_dict(self) -> dict:
+        return dict({"calls": self.calls, "wall_s": round(self.wall, 6), "cpu_s": round(self.cpu, 6)}, **self.counters)
+
+
+# Records wall/CPU time and counters(bytes transferred, files written...) per (phase, component).
+# Phases run in several threads at once, so CPU is measured per thread and a phase's wall time is reported as the
+# span from its first start to its last end.
+#   with Profiler().activate() as profiler:
+#       main.generate(args)
+#   profiler.report()
+class Profiler:
+    _active = None
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._records = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cprofile = None
+        self._wall = None
+        self._cpu = None
+
+    @classmethod
+    def current(cls) -> Profiler:
+        return cls._active or _DISABLED
+
+    @contextmanager
+    def activate(self, cprofile: bool = False):
+        previous = Profiler._active
+        Profiler._active = self
+        if cprofile:
+            import cProfile
+            # cProfile only sees the calling thread, download/decompress threads are covered by phase records
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield self
+        finally:
+            self._wall, self._cpu = time.perf_counter() - wall, time.process_time() - cpu
+            if self._cprofile:
+                self._cprofile.disable()
+            Profiler._active = previous
+
+    def _stack(self) -> list[Tuple[str, str]]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _record(self, phase: str, component: str) -> PhaseRecord:
+        key = (phase, component)
+        if key not in self._records:
+            with self._lock:
+                self._records.setdefault(key, PhaseRecord())
+        return self._records[key]
+
+    @contextmanager
+    def phase(self, phase: str, component: str = "-"):
+        if not self.enabled:
+            yield
+            return
+        stack = self._stack()
+        stack.append((phase, component))
+        start, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            stack.pop()
+            end = time.perf_counter()
+            record = self._record(phase, component)
+            with self._lock:
+                record.add(start, end, time.thread_time() - cpu)
+
+    # Labels work done in threads started from here, without timing the calling thread itself
+    @contextmanager
+    def scope(self, phase: str, component: str = "-"):
+        if not self.enabled:
+            yield
+            return
+        stack = self._stack()
+        stack.append((phase, component))
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    # Wraps a thread target so that it runs in the phase of the thread that created it
+    def bind(self, func: Callable) -> Callable:
+        stack = self._stack() if self.enabled else None
+        if not stack:
+            return func
+        phase, component = stack[-1]
+
+        def bound(*args, **kwargs):
+            with self.phase(phase, component):
+                return func(*args, **kwargs)
+        return bound
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        if not self.enabled:
+            return
+        stack = self._stack()
+        if not stack:
+            return
+        record = self._record(*stack[-1])
+        with self._lock:
+            record.counters[counter] = record.counters.get(counter, 0) + amount
+
+    def report(self) -> dict:
+        phases = {}
+        components = {}
+        for (phase, component), record in sorted(self._records.items()):
+            components.setdefault(component, {})[phase] = record.as_dict()
+            summary = phases.setdefault(phase, {"calls": 0, "wall_s": 0.0, "busy_s": 0.0, "cpu_s": 0.0,
+                                                "start": None, "end": None})
+            summary["calls"] += record.calls
+            summary["busy_s"] += record.wall
+            summary["cpu_s"] += record.cpu
+            if record.start is not None:
+                summary["start"] = min(t for t in (summary["start"], record.start) if t is not None)
+                summary["end"] = max(t for t in (summary["end"], record.end) if t is not None)
+            for counter, amount in record.counters.items():
+                summary[counter] = summary.get(counter, 0) + amount
+        for summary in phases.values():
+            start, end = summary.pop("start"), summary.pop("end")
+            summary["wall_s"] = round(end - start, 6) if start is not None else 0.0
+            summary["busy_s"] = round(summary["busy_s"], 6)
+            summary["cpu_s"] = round(summary["cpu_s"], 6)
+        total = {"wall_s": round(self._wall, 6), "cpu_s": round(self._cpu, 6)} if self._wall is not None else {}
+        return {"total": total, "phases": phases, "components": components}
+
+    def dump_report(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def dump_cprofile(self, path: str) -> Optional[str]:
+        if not self._cprofile:
+            return None
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._cprofile.dump_stats(path)
+        return path
+
+
+_DISABLED = Profiler(enabled=False)
@@ -0,0 +1,296 @@
+from __future__ import annotations
+import json
+import os
+import subprocess
+import time
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from constants import HasConstants
+from fingerprint import Fingerprint
+from main import cluster_id, use_target_of
+from benchmarks.workload import DockerClient, WorkloadError, run_checked
+
+# Adds or removes datanodes of a running cluster generated by main.py, namenodes and resourcemanager keep running.
+# Run from repository root once cluster is up
+#   python scale.py --datanodes 5              # adds datanode4, datanode5 and starts them through their agents
+#   python scale.py --datanodes 2 --balance    # decommissions datanode3.. before removing them, then balances HDFS
+# docker-compose.yml and topology.json of the target are rewritten for the new size. Configs are not rendered again, so
+# added nodes run with tuning of the generated size. Running main.py again regenerates the target as its args say
+
+
+class ScaleError(Exception):
+    pass
+
+
+class Scaler(HasConstants):
+    # Excluded hosts of both HDFS(dfs.hosts.exclude) and YARN(yarn.resourcemanager.nodes.exclude-path)
+    EXCLUDE_FILE = "hosts.exclude"
+    POLL_SECONDS = 5
+
+    def __init__(self, spec, topology: dict, timeout: float):
+        self.spec = spec
+        self.topology = topology
+        self.timeout = timeout
+        self.client = DockerClient(topology)
+        # Admin commands run where the standby namenode and resourcemanager are
+        self.admin_host = spec.secondary_namenode.host
+
+    @property
+    def config_dir(self) -> Path:
+        return Path(self.TARGET_BASE_PATH, "hadoop", self.spec.BINARY_DIRS["hadoop"], "etc", "hadoop")
+
+    def run(self, command: str, timeout: float = 600) -> dict:
+        return run_checked(self.client, self.admin_host, command, timeout)
+
+    def compose(self, *command: str) -> None:
+        if subprocess.run(["docker-compose"] + list(command), cwd=self.TARGET_BASE_PATH).returncode != 0:
+            raise ScaleError("docker-compose {} failed".format(" ".join(command)))
+
+    def docker_exec(self, container: str, *command: str, data: str = None) -> subprocess.CompletedProcess:
+        return subprocess.run(["docker", "exec", "-i", container] + list(command), input=data,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+    def wait_port(self, container: str, port: int) -> None:
+        deadline = time.monotonic() + self.timeout
+        while self.docker_exec(container, "nc", "-z", "localhost", str(port)).returncode != 0:
+            if time.monotonic() > deadline:
+                raise ScaleError("Port {} of {} is not available in {}s".format(port, container, self.timeout))
+            time.sleep(self.POLL_SECONDS)
+
+    # Network alias, container hostname(how nodemanagers register) and address of each datanode, all are matched
+    # against the exclude file. Unresolvable entries are ignored by namenodes
+    def addresses_of(self, hosts: list[str], containers: dict) -> dict[str, list[str]]:
+        addresses = {}
+        for host in hosts:
+            template = "{{.Config.Hostname}} {{range .NetworkSettings.Networks}}{{.IPAddress}} {{end}}"
+            result = subprocess.run(["docker", "inspect", "-f", template, containers[host]], stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, universal_newlines=True)
+            if result.returncode != 0:
+                raise ScaleError("Failed to inspect {}: {}".format(containers[host], result.stderr.strip()))
+            addresses[host] = [host] + result.stdout.split()
+        return addresses
+
+    # Lines are "<entry> # <datanode>", so entries of a datanode are found again when it is added back
+    def update_excluded(self, added: dict[str, list[str]] = None, removed: list[str] = ()) -> bool:
+        path = self.config_dir / self.EXCLUDE_FILE
+        lines = path.read_text().splitlines() if path.exists() else []
+        hosts = set(removed) | set(added or {})
+        kept = [line for line in lines if line.partition("#")[2].strip() not in hosts]
+        for host, entries in (added or {}).items():
+            kept += ["{} # {}".format(entry, host) for entry in entries]
+        if kept == lines:
+            return False
+        path.write_text("\n".join(kept) + "\n")
+        return True
+
+    # Namenodes of every nameservice and the resourcemanager read the exclude file again. Nodemanagers are
+    # decommissioned gracefully, running containers may finish within the timeout
+    def refresh_nodes(self) -> None:
+        for nameservice in self.spec.nameservices:
+            self.run("hdfs dfsadmin -fs hdfs://{} -refreshNodes".format(nameservice.name))
+        self.run("yarn rmadmin -refreshNodes -g {} -server".format(int(self.timeout)))
+
+    @staticmethod
+    def decommission_statuses(report: str) -> dict[str, str]:
+        statuses, address = {}, None
+        for line in report.splitlines():
+            if line.startswith("Name: "):
+                address = line[len("Name: "):].split(":")[0]
+            elif line.startswith("Decommission Status :") and address:
+                statuses[address] = line.split(":", 1)[1].strip()
+        return statuses
+
+    # Blocks of the datanodes are replicated to the others before they are removed. Datanodes a nameservice doesn't
+    # know of have nothing to replicate
+    def wait_decommissioned(self, addresses: dict[str, list[str]]) -> None:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            pending = {}
+            for nameservice in self.spec.nameservices:
+                report = self.run("hdfs dfsadmin -fs hdfs://{} -report".format(nameservice.name))["stdout"]
+                statuses = self.decommission_statuses(report)
+                for host, entries in addresses.items():
+                    status = next((statuses[entry] for entry in entries if entry in statuses), "Decommissioned")
+                    if status != "Decommissioned":
+                        pending[host] = "{} in {}".format(status, nameservice.name)
+            if not pending:
+                return
+            progress = ", ".join("{}({})".format(host, status) for host, status in sorted(pending.items()))
+            if time.monotonic() > deadline:
+                raise ScaleError("Datanodes are not decommissioned in {}s: {}".format(self.timeout, progress))
+            print("Waiting for decommission of {}".format(progress))
+            time.sleep(self.POLL_SECONDS)
+
+    def decommission(self, hosts: list[str], containers: dict) -> None:
+        addresses = self.addresses_of(hosts, containers)
+        self.update_excluded(added=addresses)
+        print("Decommissioning {}...".format(", ".join(hosts)))
+        self.refresh_nodes()
+        self.wait_decommissioned(addresses)
+        print("{} have been decommissioned".format(", ".join(hosts)))
+
+    # Same scripts as the starter runs, through the agent of each added container
+    def start(self, services: list[str]) -> None:
+        agent_port = self.topology["agent_port"]
+        workers = {worker.host for worker in self.spec.presto_workers} if self.spec.presto else set()
+        datanode = self.spec.datanodes[0]
+        for service in services:
+            hosts = {host for host, container in self.topology["containers"].items() if container == service}
+            scripts = ["/scripts/run_datanode.sh", "/scripts/run_nodemanager.sh"]
+            if hosts & workers:
+                scripts.append("/scripts/run_presto.sh")
+            self.wait_port(service, agent_port)
+            for script in scripts:
+                print("Running {} in {}...".format(script, service))
+                result = self.docker_exec(service, "curl", "-XPOST", "-sf",
+                                          "http://localhost:{}{}".format(agent_port, script))
+                if result.returncode != 0:
+                    raise ScaleError("Failed to run {} in {}: {}".format(script, service, result.stderr.strip()))
+        for service in services:
+            self.wait_port(service, datanode.ports["rpc-port"])
+            self.wait_port(service, datanode.ports["nodemanager-port"])
+            print("Datanode/nodemanager of {} have been up!".format(service))
+
+    # Peers of datanode links changed, every rule is applied again as the starter does
+    def apply_netem(self) -> None:
+        for rule in self.spec.netem_data["netem"]["rules"]:
+            container = self.topology["containers"][rule["host"]]
+            result = self.docker_exec(container, "curl", "-XPOST", "-sf", "--data-binary", "@-",
+                               "http://localhost:{}/netem".format(self.topology["agent_port"]), data=json.dumps(rule))
+            if result.returncode != 0:
+                print("Failed to apply network profile to {}, see GET /netem of its agent".format(rule["host"]))
+
+    def balance(self, threshold: float) -> None:
+        print("Running HDFS balancer(threshold {}%)...".format(threshold))
+        result = self.run("hdfs balancer -threshold {}".format(threshold), timeout=self.timeout)
+        print("\n".join(result["stdout"].strip().splitlines()[-5:]))
+
+
+# Lists of compose services come from sets(volumes, ports, aliases), their order differs between runs
+def normalized(service):
+    if isinstance(service, dict):
+        return {key: normalized(value) for key, value in service.items()}
+    if isinstance(service, list):
+        return sorted((normalized(value) for value in service), key=str)
+    return service
+
+
+def check_scalable(args: Namespace, topology: dict) -> None:
+    from cluster import ClusterSpec
+    replication = int(topology["tuning"]["replication"])
+    if args.num_datanode < replication:
+        raise ScaleError("HDFS keeps {} replicas of each block, --datanodes must be at least {}".format(
+            replication, replication))
+    if args.ec_policy and args.num_datanode < sum(ClusterSpec.EC_POLICIES[args.ec_policy]):
+        raise ScaleError("--ec-policy {} spreads each block group over {} datanodes".format(
+            args.ec_policy, sum(ClusterSpec.EC_POLICIES[args.ec_policy])))
+    if args.racks > args.num_datanode:
+        raise ScaleError("Datanodes are spread over {} racks, --datanodes must be at least {}".format(
+            args.racks, args.racks))
+
+
+def scale(args: Namespace) -> None:
+    import yaml  # Deferred, it is slow to import
+    from cluster import ClusterSpec
+    from docker_compose import build_components, containers_by_host, generate_yaml
+    from utils import TemplateUtil
+
+    use_target_of(args)
+    generated = Fingerprint.saved_args()
+    if generated is None:
+        raise ScaleError("{} has no args it was generated with, run main.py first".format(
+            HasConstants.TARGET_BASE_PATH))
+    with open(os.path.join(HasConstants.TARGET_BASE_PATH, "topology.json")) as f:
+        current = json.load(f)
+    with open(os.path.join(HasConstants.TARGET_BASE_PATH, "docker-compose.yml")) as f:
+        running = yaml.safe_load(f)["services"]
+
+    scaled_args = Namespace(**dict(vars(generated), num_datanode=args.datanodes,
+                                   num_presto_worker=args.presto_workers or generated.num_presto_worker))
+    check_scalable(scaled_args, current)
+    spec = ClusterSpec.from_args(scaled_args)
+    if spec.cluster_id:
+        from ports import PortRegistry
+        ports = {int(port.split(":")[0]) for instance in build_components(spec) for port in instance.ports}
+        spec = ClusterSpec.from_args(scaled_args, PortRegistry().resize(spec.cluster_id, ports))
+    instances = build_components(spec)
+    compose = generate_yaml(instances, spec.network)
+    services = yaml.safe_load(compose)["services"]
+    # Running containers are never recreated, e.g. a presto worker can't be added to a datanode already running
+    changed = sorted(name for name in services.keys() & running.keys()
+                     if normalized(services[name]) != normalized(running[name]))
+    if changed:
+        raise ScaleError("{} would have to be recreated, choose --presto-workers that keeps them".format(
+            ", ".join(changed)))
+    added = [name for name in services if name not in running]
+    removed = [name for name in running if name not in services]
+    if not added and not removed:
+        print("Cluster already has {} datanodes".format(spec.num_datanode))
+        return
+
+    # Tuning of running configs stays the one of the generated size
+    topology = dict(spec.topology, tuning=current["tuning"], containers=containers_by_host(instances))
+    scaler = Scaler(spec, topology, args.timeout)
+    if removed:
+        datanodes = [datanode["host"] for datanode in current["datanodes"]]
+        scaler.decommission([host for host in datanodes if current["containers"][host] in removed],
+                            current["containers"])
+        scaler.compose("rm", "-s", "-f", *removed)
+
+    with open(os.path.join(HasConstants.TARGET_BASE_PATH, "docker-compose.yml"), "w") as f:
+        f.write(compose)
+    with open(os.path.join(HasConstants.TARGET_BASE_PATH, "topology.json"), "w") as f:
+        f.write(json.dumps(topology, indent=2) + "\n")
+    if spec.num_rack:
+        # Added datanodes are resolved to their racks once they register
+        template = Path(HasConstants.BASE_PATH, "hadoop", "hadoop-bin", "etc", "hadoop", "topology.sh.template")
+        (scaler.config_dir / "topology.sh").write_text(TemplateUtil.render(template, spec.template_data))
+
+    if added:
+        # Datanodes decommissioned before are allowed to register again
+        if scaler.update_excluded(removed=[host for host, container in topology["containers"].items()
+                                           if container in added]):
+            scaler.refresh_nodes()
+        scaler.compose("up", "-d", "--no-recreate", *added)
+        scaler.start(added)
+    if spec.netem:
+        scaler.apply_netem()
+    print("Cluster has {} datanodes now".format(spec.num_datanode))
+    if args.balance:
+        scaler.balance(args.balance_threshold)
+
+
+def parse_scale_arg(argv: list[str] = None) -> Namespace:
+    parser = ArgumentParser(description="Add or remove datanodes of a running cluster")
+    parser.add_argument("--datanodes", required=True, type=int,
+                        help="Number of datanodes the cluster should have. Added ones run a datanode and a "
+                             + "nodemanager, removed ones are decommissioned from HDFS and YARN first")
+    parser.add_argument("--presto-workers", type=int,
+                        help="Number of presto workers, added with datanodes as main.py places them. Default the "
+                             + "generated --num-presto-worker")
+    parser.add_argument("--cluster-id", type=cluster_id, help="Scale target/clusters/{cluster-id}. Default target")
+    parser.add_argument("--balance", action="store_true", help="Run HDFS balancer once datanodes are scaled")
+    parser.add_argument("--balance-threshold", default=10.0, type=float,
+                        help="Percentage of capacity a datanode may differ from the cluster average after "
+                             + "balancing. Default 10")
+    parser.add_argument("--timeout", default=1800, type=float,
+                        help="Seconds to wait for added nodes, decommission and the balancer each. Default 1800")
+    args = parser.parse_args(argv)
+    if args.datanodes < 1:
+        parser.error("--datanodes must be at least 1")
+    if args.presto_workers is not None and args.presto_workers < 1:
+        parser.error("--presto-workers must be at least 1")
+    return args
+
+
+def main():
+    args = parse_scale_arg()
+    try:
+        scale(args)
+    except (ScaleError, WorkloadError, RuntimeError) as e:
+        print("Failed to scale: {}".format(e))
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
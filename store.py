@@ -0,0 +1,193 @@
+from __future__ import annotations
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO
+from constants import HasConstants
+from profiler import Profiler
+
+
+# Content addressed store of extracted binaries(--dedup-binaries). Every regular file of a tarball is stored once under
+# objects/ by hash and mode, a manifest per release lists which object goes to which path, and extracted trees are
+# materialized with hardlinks to the objects. Most jars are the same between versions, so keeping several releases
+# side by side costs little more than one.
+# Materialized trees are referenced from refs.json, gc() drops releases none of them uses anymore and their objects.
+# Writers(ingest/materialize) hold the store lock shared, gc holds it exclusively. Generators hold it shared from
+# finding a release in the store through materializing it(shared()), so gc can't drop the release in between
+class BinaryStore(HasConstants):
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, path: str = None):
+        self.path = Path(path or self.STORE_PATH)
+        self.objects = self.path / "objects"
+        self.manifests = self.path / "manifests"
+        self.refs = self.path / "refs.json"
+
+    @contextmanager
+    def _locked(self, name: str, exclusive: bool):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / name, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @contextmanager
+    def shared(self):
+        with self._locked("store.lock", exclusive=False):
+            yield
+
+    @staticmethod
+    def _temp_name(path: Path) -> Path:
+        return path.with_name(".{}.partial-{}-{}".format(path.name, os.getpid(), threading.get_ident()))
+
+    def _write_json(self, path: Path, content: dict) -> None:
+        temp = self._temp_name(path)
+        temp.write_text(json.dumps(content, indent=1, sort_keys=True))
+        os.replace(temp, path)
+
+    def _object(self, key: str) -> Path:
+        return self.objects / key[:2] / key[2:]
+
+    def _manifest_path(self, release: str) -> Path:
+        return self.manifests / (release + ".json")
+
+    def has(self, release: str) -> bool:
+        return self._manifest_path(release).exists()
+
+    def _put(self, stream: IO[bytes], mode: int) -> str:
+        # Hardlinks share the inode, so files differing only by mode are different objects
+        self.objects.mkdir(parents=True, exist_ok=True)
+        temp = self._temp_name(self.objects / "object")
+        digest = hashlib.sha256()
+        with open(temp, "wb") as f:
+            for chunk in iter(lambda: stream.read(self.CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        key = "{}-{:o}".format(digest.hexdigest(), mode & 0o7777)
+        path = self._object(key)
+        if path.exists():
+            temp.unlink()
+            return key
+        os.chmod(temp, mode & 0o7777)
+        path.parent.mkdir(exist_ok=True)
+        os.replace(temp, path)
+        Profiler.current().count("files_written")
+        return key
+
+    # Stores every member of the tarball and writes the manifest of the release
+    def ingest(self, tarball: Path, release: str) -> None:
+        import tarfile  # Deferred, it is slow to import
+        print("Storing {} as {}".format(tarball, release))
+        manifest = {"release": release, "dirs": [], "files": {}, "symlinks": {}}
+        with self._locked("store.lock", exclusive=False), tarfile.open(tarball) as tar:
+            for member in tar:
+                name = os.path.normpath(member.name)
+                if name == "." or name.startswith("..") or os.path.isabs(name):
+                    continue
+                if member.isdir():
+                    manifest["dirs"].append(name)
+                elif member.issym():
+                    manifest["symlinks"][name] = member.linkname
+                elif member.islnk():
+                    # Hardlink in the archive is the same content as its target
+                    manifest["files"][name] = manifest["files"][os.path.normpath(member.linkname)]
+                elif member.isfile():
+                    manifest["files"][name] = self._put(tar.extractfile(member), member.mode)
+                    Profiler.current().count("bytes_extracted", member.size)
+            self.manifests.mkdir(parents=True, exist_ok=True)
+            self._write_json(self._manifest_path(release), manifest)
+
+    @staticmethod
+    def _link(source: Path, dest: Path) -> None:
+        try:
+            os.link(source, dest)
+        except OSError as e:
+            # Store and target on different filesystems, files are copied without deduplication
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.copy2(source, dest)
+
+    # Builds the tree of the release aside and swaps it in place of dest, whatever dest held before
+    def materialize(self, release: str, dest: Path) -> None:
+        print("Materializing {} into {}".format(release, dest))
+        with self._locked("store.lock", exclusive=False):
+            manifest = json.loads(self._manifest_path(release).read_text())
+            partial = self._temp_name(dest)
+            partial.mkdir(parents=True)
+            for name in manifest["dirs"]:
+                (partial / name).mkdir(parents=True, exist_ok=True)
+            for name, key in manifest["files"].items():
+                (partial / name).parent.mkdir(parents=True, exist_ok=True)
+                self._link(self._object(key), partial / name)
+            for name, target in manifest["symlinks"].items():
+                (partial / name).parent.mkdir(parents=True, exist_ok=True)
+                os.symlink(target, partial / name)
+            with self._locked("refs.lock", exclusive=True):
+                if self.is_materialized(dest, release):
+                    # Materialized by another generator meanwhile
+                    shutil.rmtree(partial)
+                    return
+                if dest.exists():
+                    replaced = self._temp_name(dest.with_name(dest.name + "-replaced"))
+                    os.rename(dest, replaced)
+                    shutil.rmtree(replaced)
+                os.rename(partial, dest)
+                refs = self._load_refs()
+                refs[str(dest)] = {"release": release, "inode": dest.stat().st_ino}
+                self._write_json(self.refs, refs)
+        Profiler.current().count("files_linked", len(manifest["files"]))
+
+    def _load_refs(self) -> dict:
+        try:
+            return json.loads(self.refs.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _is_live(dest: str, ref: dict) -> bool:
+        # Removed or replaced by something else than the store
+        try:
+            return os.stat(dest).st_ino == ref["inode"]
+        except OSError:
+            return False
+
+    def is_materialized(self, dest: Path, release: str) -> bool:
+        ref = self._load_refs().get(str(dest))
+        return ref is not None and ref["release"] == release and self._is_live(str(dest), ref)
+
+    # Drops manifests of releases no live tree references, then objects no remaining manifest lists
+    def gc(self) -> dict:
+        stats = {"releases": [], "objects": 0, "bytes": 0}
+        if not self.path.exists():
+            return stats
+        with self._locked("store.lock", exclusive=True), self._locked("refs.lock", exclusive=True):
+            refs = {dest: ref for dest, ref in self._load_refs().items() if self._is_live(dest, ref)}
+            self._write_json(self.refs, refs)
+            referenced = {ref["release"] for ref in refs.values()}
+            keys = set()
+            for manifest_path in sorted(self.manifests.glob("*.json")):
+                release = manifest_path.name[:-len(".json")]
+                if release in referenced:
+                    keys.update(json.loads(manifest_path.read_text())["files"].values())
+                else:
+                    manifest_path.unlink()
+                    stats["releases"].append(release)
+            for path in self.objects.glob("*/*"):
+                if path.parent.name + path.name not in keys:
+                    stats["bytes"] += path.stat().st_size
+                    stats["objects"] += 1
+                    path.unlink()
+            # Left by interrupted ingests
+            for path in self.objects.glob(".object.partial-*"):
+                path.unlink()
+        print("Store gc removed releases {}, {} objects, {} bytes".format(
+            ", ".join(stats["releases"]) or "-", stats["objects"], stats["bytes"]))
+        return stats
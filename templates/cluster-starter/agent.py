@@ -1,21 +1,245 @@
-from http.server import HTTPServer, CGIHTTPRequestHandler
+from http.server import ThreadingHTTPServer, CGIHTTPRequestHandler
 from http import HTTPStatus
+import json
+import socket
+import subprocess
 import sys
 import threading
+import time
 import os
 
 # This application is docker-hadoop agent which runs script when it receives request.
 # It is written to run script remotely, hence there is a security leak
-# The reason that why it doesn't concern this security leak is because, 
+# The reason that why it doesn't concern this security leak is because,
 # docker hadoop is NOT for production environment but for test on local, study purpose
 
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+# Main class (or a unique token of the command line) -> daemon label shown in /metrics
+DAEMONS = {
+    "org.apache.hadoop.hdfs.server.namenode.NameNode": "namenode",
+    "org.apache.hadoop.hdfs.server.datanode.DataNode": "datanode",
+    "org.apache.hadoop.hdfs.qjournal.server.JournalNode": "journalnode",
+    "org.apache.hadoop.hdfs.tools.DFSZKFailoverController": "zkfc",
+    "org.apache.zookeeper.server.quorum.QuorumPeerMain": "zookeeper",
+    "org.apache.hadoop.yarn.server.resourcemanager.ResourceManager": "resourcemanager",
+    "org.apache.hadoop.yarn.server.nodemanager.NodeManager": "nodemanager",
+    "org.apache.hadoop.yarn.server.applicationhistoryservice.ApplicationHistoryServer": "yarn-history",
+    "org.apache.hadoop.hive.metastore.HiveMetaStore": "hive-metastore",
+    "org.apache.hive.service.server.HiveServer2": "hive-server",
+    "org.apache.spark.deploy.history.HistoryServer": "spark-history",
+    "org.apache.spark.sql.hive.thriftserver.HiveThriftServer2": "spark-thrift",
+    "com.facebook.presto.server.PrestoServer": "presto",
+    "/scripts/agent.py": "agent"
+}
+
+
+def read_file(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+
+def daemon_name(pid: str):
+    cmdline = read_file("/proc/{}/cmdline".format(pid)).split("\0")
+    if cmdline == [""]:
+        return None  # Kernel thread
+    for token in cmdline:
+        if token in DAEMONS:
+            return DAEMONS[token]
+    return read_file("/proc/{}/comm".format(pid)).strip()
+
+
+def process_stats() -> list:
+    stats = []
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            # Fields after "(comm)" start at field 3 (state), see proc(5)
+            fields = read_file("/proc/{}/stat".format(pid)).rsplit(")", 1)[1].split()
+            name = daemon_name(pid)
+        except (OSError, IndexError):
+            continue  # Process exited while being read
+        if name is None:
+            continue
+        stats.append({
+            "pid": pid, "daemon": name,
+            "rss": int(fields[21]) * PAGE_SIZE,
+            "cpu": (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+            "threads": int(fields[17])
+        })
+    return stats
+
+
+def read_first(*paths: str):
+    for path in paths:
+        try:
+            return read_file(path).strip()
+        except OSError:
+            continue
+    return None
+
+
+def container_stats() -> dict:
+    stats = {}
+    # cgroup v2 files first, then cgroup v1
+    memory = read_first("/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory/memory.usage_in_bytes")
+    if memory is not None:
+        stats["memory_usage_bytes"] = int(memory)
+    limit = read_first("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    if limit is not None and limit != "max":
+        stats["memory_limit_bytes"] = int(limit)
+    cpu_stat = read_first("/sys/fs/cgroup/cpu.stat")
+    if cpu_stat is not None:
+        usage = dict(line.split() for line in cpu_stat.splitlines())
+        stats["cpu_seconds_total"] = int(usage["usage_usec"]) / 1000000
+    else:
+        # cgroup v1 reports nanoseconds
+        usage = read_first("/sys/fs/cgroup/cpuacct/cpuacct.usage", "/sys/fs/cgroup/cpu,cpuacct/cpuacct.usage")
+        if usage is not None:
+            stats["cpu_seconds_total"] = int(usage) / 1000000000
+    return stats
+
+
+# Label values of the text exposition format escape backslash, double quote and line feed
+def label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_metrics() -> str:
+    lines = []
+    processes = process_stats()
+    for metric, key, metric_type, help_text in [
+        ("spawningpool_process_resident_memory_bytes", "rss", "gauge", "Resident set size of the process"),
+        ("spawningpool_process_cpu_seconds_total", "cpu", "counter", "User and system CPU time of the process"),
+        ("spawningpool_process_threads", "threads", "gauge", "Number of threads of the process")
+    ]:
+        lines.append("# HELP {} {}".format(metric, help_text))
+        lines.append("# TYPE {} {}".format(metric, metric_type))
+        for process in processes:
+            lines.append('{}{{pid="{}",daemon="{}"}} {}'.format(metric, process["pid"], label_value(process["daemon"]),
+                                                                 process[key]))
+    for key, value in container_stats().items():
+        metric = "spawningpool_container_" + key
+        lines.append("# TYPE {} {}".format(metric, "counter" if key.endswith("_total") else "gauge"))
+        lines.append("{} {}".format(metric, value))
+    return "\n".join(lines) + "\n"
+
+
+def run_command(command: str, timeout: float = None) -> dict:
+    # Synchronous, so the caller gets output and time spent in the container, without transport overhead
+    start = time.monotonic()
+    try:
+        result = subprocess.run(["/bin/bash", "-c", command], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                timeout=timeout)
+        returncode, stdout, stderr = result.returncode, result.stdout, result.stderr
+    except subprocess.TimeoutExpired as e:
+        returncode, stdout, stderr = -1, e.stdout or b"", (e.stderr or b"") + b"\nTimed out"
+    return {
+        "returncode": returncode, "elapsed_s": time.monotonic() - start,
+        "stdout": stdout.decode("UTF-8", "replace"), "stderr": stderr.decode("UTF-8", "replace")
+    }
+
+
+NETEM_DEVICE = "eth0"
+# Band of the prio qdisc traffic to peers is steered to, default priomap only sends traffic to the first 3 bands
+NETEM_BAND = 4
+NETEM_PRIOMAP = "1 2 2 2 1 2 0 0 1 1 1 1 1 1 1 1"
+# Last applied rule, tc output alone doesn't tell which peers it is for
+netem_rule = {}
+
+
+def netem_options(rule: dict) -> str:
+    options = []
+    if rule.get("delay"):
+        options += ["delay", rule["delay"]] + ([rule["jitter"]] if rule.get("jitter") else [])
+    if rule.get("loss"):
+        options += ["loss", rule["loss"]]
+    if rule.get("rate"):
+        options += ["rate", rule["rate"]]
+    return " ".join(options)
+
+
+def netem_status() -> dict:
+    return {
+        "rule": netem_rule,
+        "qdisc": run_command("tc qdisc show dev " + NETEM_DEVICE)["stdout"],
+        "filter": run_command("tc filter show dev " + NETEM_DEVICE)["stdout"]
+    }
+
+
+# Replaces netem of the container with the rule(delay, jitter, loss, rate). Traffic to peers only if it has peers,
+# and only what is sent from ports if it has ports, all egress traffic if peers is null. A rule without any option
+# clears it
+def apply_netem(rule: dict) -> dict:
+    global netem_rule
+    options = netem_options(rule)
+    peers = rule.get("peers")
+    sport_matches = [" match ip sport {} 0xffff".format(port) for port in rule.get("ports") or []] or [""]
+    commands = []
+    if options and peers is None:
+        commands.append("tc qdisc add dev {} root netem {}".format(NETEM_DEVICE, options))
+    elif options and peers:
+        commands += [
+            "tc qdisc add dev {} root handle 1: prio bands {} priomap {}".format(NETEM_DEVICE, NETEM_BAND,
+                                                                                 NETEM_PRIOMAP),
+            "tc qdisc add dev {} parent 1:{} handle {}0: netem {}".format(NETEM_DEVICE, NETEM_BAND, NETEM_BAND, options)
+        ]
+        for peer in peers:
+            for sport_match in sport_matches:
+                commands.append("tc filter add dev {} parent 1: protocol ip prio 1 u32 match ip dst {}/32{} flowid 1:{}"
+                                .format(NETEM_DEVICE, socket.gethostbyname(peer), sport_match, NETEM_BAND))
+    # No qdisc to delete is not an error
+    run_command("tc qdisc del dev {} root".format(NETEM_DEVICE))
+    results = []
+    for command in commands:
+        result = dict(run_command(command), command=command)
+        results.append(result)
+        if result["returncode"] != 0:
+            break
+    netem_rule = rule if options else {}
+    return dict(netem_status(), commands=results, ok=all(result["returncode"] == 0 for result in results))
+
+
 class RequestHandler(CGIHTTPRequestHandler):
     def do_GET(self) -> None:
+        if "/metrics" == self.path:
+            body = render_metrics().encode("UTF-8")
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if "/netem" == self.path:
+            self.send_json(HTTPStatus.OK, netem_status())
+            return
         self.send_response(HTTPStatus.OK, "Agent is running")
         self.flush_headers()
 
     def do_POST(self) -> None:
-        if "/exit" == self.path:
+        if "/bench" == self.path:
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            except ValueError as e:
+                self.send_json(HTTPStatus.BAD_REQUEST, {"error": "Malformed JSON: {}".format(e)})
+                return
+            command = request.get("command") if isinstance(request, dict) else None
+            timeout = request.get("timeout") if isinstance(request, dict) else None
+            if not isinstance(command, str) or not isinstance(timeout, (int, float, type(None))):
+                self.send_json(HTTPStatus.BAD_REQUEST,
+                               {"error": "Expected {\"command\": string, \"timeout\": seconds or null}"})
+                return
+            self.send_json(HTTPStatus.OK, run_command(command, timeout))
+        elif "/netem" == self.path:
+            rule = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or "{}")
+            try:
+                result = apply_netem(rule)
+            except OSError as e:  # Peer can't be resolved
+                result = dict(netem_status(), ok=False, error=str(e))
+            self.send_json(HTTPStatus.OK if result["ok"] else HTTPStatus.INTERNAL_SERVER_ERROR, result)
+        elif "/exit" == self.path:
             self.send_response(HTTPStatus.OK, "Agent is terminating")
             self.flush_headers()
             threading.Thread(target=self.server.shutdown).start()
@@ -27,9 +251,22 @@ class RequestHandler(CGIHTTPRequestHandler):
             self.flush_headers()
             # super().do_POST()
 
+    def send_json(self, status: HTTPStatus, response: dict) -> None:
+        body = json.dumps(response).encode("UTF-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def translate_path(self, path) -> str:
         return path
 
+    def log_message(self, format, *args) -> None:
+        # Scrapers hit /metrics every few seconds, don't flood container log with them
+        if "/metrics" != self.path:
+            super().log_message(format, *args)
+
 
 def main():
     argv = sys.argv
@@ -38,7 +275,8 @@ def main():
     server_address = ('', port)
     RequestHandler.cgi_directories = [script_path]
 
-    server = HTTPServer(server_address, RequestHandler)
+    # Threaded, a long running /bench request must not block /metrics or scripts
+    server = ThreadingHTTPServer(server_address, RequestHandler)
     RequestHandler.server = server
 
     try:
@@ -0,0 +1,51 @@
+#!/bin/bash
+# Application class data sharing(AppCDS) archive of a daemon, prints JVM options to append to its *_OPTS.
+#   export HDFS_DATANODE_OPTS="$HDFS_DATANODE_OPTS $(/scripts/cds.sh datanode)"
+# Only when CDS_DIR is set(java 11, a volume shared by the containers of the cluster). The first start of a daemon
+# records the classes it loads, and once the daemon is up and the list stopped growing the archive is dumped in
+# background with the classpath the daemon runs with. Later starts of the daemon, in this container or another one,
+# map the archive. If dumping fails its log is kept and the daemon keeps running on the JDK archive of the image
+
+daemon=$1
+if [ -z "$CDS_DIR" ] || [ -z "$daemon" ]; then
+  exit 0
+fi
+
+archive=$CDS_DIR/$daemon.jsa
+if [ -f $archive ]; then
+  echo "-XX:SharedArchiveFile=$archive -Xshare:auto"
+  exit 0
+fi
+if [ -f $CDS_DIR/$daemon.failed ]; then
+  exit 0
+fi
+
+mkdir -p $CDS_DIR
+# Per container, datanodes of the cluster may record at the same time
+list=$CDS_DIR/$daemon.$HOSTNAME.classlist
+(
+  sleep 30
+  size=-1
+  while [ "$(stat -c %s $list 2> /dev/null)" != "$size" ]; do
+    size=$(stat -c %s $list 2> /dev/null)
+    sleep 30
+  done
+  pid=$(pgrep -n -f -- "-Dproc_$daemon")
+  if [ -z "$pid" ]; then
+    exit 0
+  fi
+  classpath=$(tr '\0' '\n' < /proc/$pid/environ | sed -n 's/^CLASSPATH=//p')
+  log=$CDS_DIR/$daemon.$HOSTNAME.log
+  if java -Xshare:dump -XX:SharedClassListFile=$list -XX:SharedArchiveFile=$archive.$HOSTNAME -cp "$classpath" \
+      > $log 2>&1; then
+    mv $archive.$HOSTNAME $archive
+    rm -f $log
+  else
+    rm -f $archive.$HOSTNAME
+    mv $log $CDS_DIR/$daemon.failed
+  fi
+  rm -f $list
+) > /dev/null 2>&1 &
+
+# Classes mapped from the JDK archive wouldn't be listed
+echo "-Xshare:off -XX:DumpLoadedClassList=$list"
@@ -6,4 +6,5 @@ if [ ! -d $datadir ]; then
   exit 2
 fi
 
+export HDFS_DATANODE_OPTS="$HDFS_DATANODE_OPTS $(/scripts/cds.sh datanode)"
 $HADOOP_HOME/bin/hdfs --config $HADOOP_CONF_DIR datanode
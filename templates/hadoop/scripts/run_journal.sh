@@ -1,3 +1,4 @@
 #!/bin/bash
 
+export HDFS_JOURNALNODE_OPTS="$HDFS_JOURNALNODE_OPTS $(/scripts/cds.sh journalnode)"
 $HADOOP_HOME/bin/hdfs --config $HADOOP_CONF_DIR --daemon start journalnode
\ No newline at end of file
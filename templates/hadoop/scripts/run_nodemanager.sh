@@ -1,3 +1,4 @@
 #!/bin/bash
 
+export YARN_NODEMANAGER_OPTS="$YARN_NODEMANAGER_OPTS $(/scripts/cds.sh nodemanager)"
 $HADOOP_HOME/bin/yarn --config $HADOOP_CONF_DIR nodemanager &
@@ -0,0 +1,20 @@
+#!/bin/bash
+
+namedir="/hadoop/dfs/name"
+if [ ! -d $namedir ]; then
+  echo "Namenode name directory not found: $namedir"
+  exit 2
+fi
+
+
+echo "remove lost+found from $namedir"
+rm -r $namedir/lost+found
+
+if [ "`ls -A $namedir`" == "" ]; then
+  echo "Formatting observer namenode name directory: $namedir"
+  $HADOOP_HOME/bin/hdfs --config $HADOOP_CONF_DIR namenode -bootstrapStandby
+fi
+
+# No zkfc, observer must not be elected as active
+export HDFS_NAMENODE_OPTS="$HDFS_NAMENODE_OPTS $(/scripts/cds.sh namenode)"
+$HADOOP_HOME/bin/hdfs --config $HADOOP_CONF_DIR namenode &
@@ -1,3 +1,4 @@
 #!/bin/bash
 
+export YARN_RESOURCEMANAGER_OPTS="$YARN_RESOURCEMANAGER_OPTS $(/scripts/cds.sh resourcemanager)"
 $HADOOP_HOME/bin/yarn --config $HADOOP_CONF_DIR resourcemanager &
@@ -0,0 +1,4 @@
+#!/bin/bash
+
+export HDFS_DFSROUTER_OPTS="$HDFS_DFSROUTER_OPTS $(/scripts/cds.sh dfsrouter)"
+$HADOOP_HOME/bin/hdfs --config $HADOOP_CONF_DIR dfsrouter &
@@ -15,6 +15,7 @@ if [ "`ls -A $namedir`" == "" ]; then
   $HADOOP_HOME/bin/hdfs --config $HADOOP_CONF_DIR namenode -bootstrapStandby
 fi
 
+export HDFS_NAMENODE_OPTS="$HDFS_NAMENODE_OPTS $(/scripts/cds.sh namenode)"
 $HADOOP_HOME/bin/hdfs --config $HADOOP_CONF_DIR namenode &
 
 $HADOOP_HOME/bin/hdfs --config $HADOOP_CONF_DIR --daemon start zkfc &
\ No newline at end of file
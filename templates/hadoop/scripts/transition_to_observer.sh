@@ -0,0 +1,23 @@
+#!/bin/bash
+
+# NAMESERVICE and NAMENODE_ID are set on observer container. Automatic failover is enabled for active/standby,
+# so state of the observer is managed by hand
+function service_state()
+{
+    $HADOOP_HOME/bin/hdfs --config $HADOOP_CONF_DIR haadmin -ns $NAMESERVICE -getServiceState $NAMENODE_ID 2> /dev/null
+}
+
+max_try=60
+i=1
+until [ "`service_state`" == "observer" ]; do
+    if (( $i > $max_try )); then
+        echo "$NAMENODE_ID of $NAMESERVICE is still `service_state`; giving up after ${max_try} tries. :/"
+        exit 1
+    fi
+    echo "[$i/$max_try] Transitioning $NAMENODE_ID of $NAMESERVICE to observer"
+    echo 'Y' | $HADOOP_HOME/bin/hdfs --config $HADOOP_CONF_DIR haadmin -ns $NAMESERVICE \
+        -transitionToObserver --forcemanual $NAMENODE_ID
+    let "i++"
+    sleep 1
+done
+echo "$NAMENODE_ID of $NAMESERVICE is now observer"
@@ -0,0 +1,121 @@
+import os
+import subprocess
+from pathlib import Path
+from typing import List, Tuple
+import pytest
+from component import ImageBuildRequired
+from constants import HasConstants
+from utils import ImageUtil, TemplateUtil
+
+
+class Image(ImageBuildRequired):
+    def __init__(self, context: Path, image_name: str = "local/hadoop"):
+        self.context = context
+        self._image_name = image_name
+
+    @property
+    def component_base_dir(self) -> str:
+        return str(self.context)
+
+    @property
+    def image_name(self) -> str:
+        return self._image_name
+
+
+@pytest.fixture
+def context(tmp_path: Path) -> Path:
+    context = tmp_path / "target" / "hadoop"
+    (context / "hadoop-bin" / "share").mkdir(parents=True)
+    (context / "Dockerfile").write_text("FROM openjdk:8-jre-slim\n")
+    (context / ".dockerignore").write_text("*\n!Dockerfile\n")
+    (context / "hadoop-bin" / "share" / "a.jar").write_text("jar")
+    return context
+
+
+def test_hash_covers_only_the_build_context(context: Path):
+    image = Image(context)
+    tag = image.content_hash
+    assert image.context_files == [context / "Dockerfile"]
+    assert len(tag) == ImageBuildRequired.HASH_LENGTH
+
+    # Ignored files don't change the tag
+    (context / "hadoop-bin" / "share" / "a.jar").write_text("another jar")
+    (context / "run.sh").write_text("echo")
+    assert image.content_hash == tag
+
+    (context / "Dockerfile").write_text("FROM openjdk:11-jre-slim\n")
+    assert image.content_hash != tag
+
+
+def test_hash_covers_executable_bit(context: Path):
+    (context / ".dockerignore").write_text("hadoop-bin\n")
+    (context / "entrypoint.sh").write_text("echo")
+    image = Image(context)
+    tag = image.content_hash
+    os.chmod(context / "entrypoint.sh", 0o755)
+    assert image.content_hash != tag
+
+
+def test_build_plan(context: Path, monkeypatch):
+    monkeypatch.setattr(HasConstants, "TARGET_BASE_PATH", str(context.parent))
+    image = Image(context)
+    plan = ImageUtil.write_build_plan([image, object()])
+    assert plan == context.parent / "bin" / "build-plan.txt"
+    assert plan.read_text().splitlines()[1:] == ["hadoop local/hadoop {} hadoop".format(image.content_hash)]
+
+
+# Fake docker on PATH: `image inspect` finds tags listed in $DOCKER_IMAGES, builds of $DOCKER_FAILING images fail,
+# every call is logged to $DOCKER_LOG
+FAKE_DOCKER = """#!/bin/bash
+echo "$DOCKER_BUILDKIT $*" >> "$DOCKER_LOG"
+case "$1 $2" in
+  "image inspect") grep -qx "$3" "$DOCKER_IMAGES" ;;
+  "build -t") [[ "$3" != "$DOCKER_FAILING":* ]] ;;
+esac
+"""
+
+
+def run_builder(tmp_path: Path, plan: List[str], existing: List[str], failing: str = "none") -> Tuple[int, List[str]]:
+    target = tmp_path / "target"
+    (target / "bin").mkdir(parents=True, exist_ok=True)
+    builder = target / "bin" / "builder.sh"
+    builder.write_text(TemplateUtil.render(Path(HasConstants.BASE_PATH, "bin", "builder.sh.template"),
+                                           {"additional": {"network": "test.net"}}))
+    (target / "bin" / "build-plan.txt").write_text("\n".join(["# name image tag context"] + plan) + "\n")
+    fake_bin = tmp_path / "fake-bin"
+    fake_bin.mkdir(exist_ok=True)
+    (fake_bin / "docker").write_text(FAKE_DOCKER)
+    os.chmod(fake_bin / "docker", 0o755)
+    (tmp_path / "images").write_text("".join(image + "\n" for image in existing))
+    log = tmp_path / "docker.log"
+    log.write_text("")
+    env = dict(os.environ, PATH="{}:{}".format(fake_bin, os.environ["PATH"]), DOCKER_LOG=str(log),
+               DOCKER_IMAGES=str(tmp_path / "images"), DOCKER_FAILING=failing)
+    process = subprocess.run(["bash", str(builder), "all"], env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return process.returncode, sorted(log.read_text().strip().splitlines())
+
+
+PLAN = ["hadoop local/hadoop aaa hadoop", "cluster-starter local/cluster-starter bbb cluster-starter"]
+
+
+def test_builder_skips_existing_tags(tmp_path: Path):
+    returncode, calls = run_builder(tmp_path, PLAN, existing=["local/hadoop:aaa"])
+
+    assert returncode == 0
+    builds = [call for call in calls if " build " in call]
+    assert len(builds) == 1
+    assert builds[0].startswith("1 build -t local/cluster-starter:bbb ")
+    assert builds[0].endswith("/cluster-starter")
+    # Both are tagged for docker-compose, built or not
+    assert " tag local/hadoop:aaa local/hadoop" in calls
+    assert " tag local/cluster-starter:bbb local/cluster-starter" in calls
+    assert " network create test.net" in calls
+
+
+def test_builder_fails_when_a_build_fails(tmp_path: Path):
+    returncode, calls = run_builder(tmp_path, PLAN, existing=[], failing="local/hadoop")
+
+    assert returncode == 1
+    # The other image is still built and tagged
+    assert " tag local/cluster-starter:bbb local/cluster-starter" in calls
+    assert " tag local/hadoop:aaa local/hadoop" not in calls
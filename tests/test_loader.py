@@ -0,0 +1,125 @@
+import csv
+import datetime
+import io
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from loader import FORMATS, DataLoader, LoaderError, datanode_urls
+
+
+# In-process stand-in of datanode WebHDFS. Keeps files created with op=CREATE(chunked bodies) in memory
+class WebHdfsStub(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), WebHdfsStubHandler)
+        self.files = {}
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class WebHdfsStubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+    def read_chunked(self) -> bytes:
+        body = b""
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            if size == 0:
+                self.rfile.readline()
+                return body
+            body += self.rfile.read(size)
+            self.rfile.readline()
+
+    def do_PUT(self) -> None:
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        self.server.requests.append(params)
+        body = self.read_chunked() if self.headers.get("Transfer-Encoding") == "chunked" \
+            else self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not url.path.startswith("/webhdfs/v1/") or params.get("op") != "CREATE":
+            self.send_response(400)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.server.files[urllib.parse.unquote(url.path[len("/webhdfs/v1"):])] = body
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def load(data_format: str, files: int, size: int, urls: list) -> dict:
+    loader = DataLoader(urls, "ns", "webhdfs", FORMATS[data_format], writers=2, timeout=10)
+    tasks = loader.plan("/loader", files, size, partitions=2, seed=1, first_day=datetime.date(2021, 1, 1))
+    return loader.load(tasks)
+
+
+def rows_of(data_format: str, content: bytes) -> int:
+    if data_format == "csv":
+        return len(list(csv.reader(io.StringIO(content.decode("UTF-8"))))) - 1
+    if data_format == "json":
+        return len([json.loads(line) for line in content.decode("UTF-8").splitlines()])
+    import pyarrow.parquet
+    return pyarrow.parquet.read_table(io.BytesIO(content)).num_rows
+
+
+@pytest.mark.parametrize("data_format", sorted(FORMATS))
+def test_load_through_webhdfs(data_format):
+    if data_format == "parquet":
+        pytest.importorskip("pyarrow")
+    with WebHdfsStub() as first, WebHdfsStub() as second:
+        report = load(data_format, 4, 64 * 1024, [first.url, second.url])
+        files = dict(first.files, **second.files)
+
+    assert report["errors"] == []
+    assert report["files"] == 4
+    assert sorted(files) == [r["path"] for r in report["results"]]
+    assert sorted(files)[0] == "/loader/dt=2021-01-01/part-00000." + FORMATS[data_format].extension
+    assert report["bytes"] == sum(len(content) for content in files.values())
+    assert report["rows"] == sum(rows_of(data_format, content) for content in files.values())
+    assert set(report["datanodes"]) == {first.url, second.url}
+    assert all(r["namenoderpcaddress"] == "ns" and r["user.name"] == "webhdfs" for r in first.requests)
+
+
+@pytest.mark.parametrize("data_format", sorted(FORMATS))
+def test_load_empty_files(data_format):
+    if data_format == "parquet":
+        pytest.importorskip("pyarrow")
+    with WebHdfsStub() as stub:
+        report = load(data_format, 2, 0, [stub.url])
+
+    assert report["errors"] == []
+    assert report["files"] == 2
+    assert all(rows_of(data_format, content) == 0 for content in stub.files.values())
+
+
+def test_failed_write_is_reported():
+    with WebHdfsStub() as stub:
+        loader = DataLoader([stub.url], "ns", "webhdfs", FORMATS["csv"], writers=1, timeout=10)
+        # Not under /webhdfs/v1/, which the stub rejects
+        report = loader.load(loader.plan("relative", 1, 1024, partitions=1, seed=1,
+                                         first_day=datetime.date(2021, 1, 1)))
+
+    assert report["files"] == 0
+    assert "400" in report["errors"][0]
+
+
+def test_datanode_urls():
+    datanode = {"host": "datanode1", "ports": {"rpc-port": 9864}, "published": [[9864, 9864]]}
+    assert datanode_urls({"datanodes": [datanode]}, "published") == ["http://localhost:9864"]
+    assert datanode_urls({"datanodes": [datanode]}, "internal") == ["http://datanode1:9864"]
+    with pytest.raises(LoaderError, match="datanode1"):
+        datanode_urls({"datanodes": [dict(datanode, published=[])]}, "published")
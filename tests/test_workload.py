@@ -0,0 +1,124 @@
+import re
+from argparse import Namespace
+import pytest
+from benchmarks.workload import ClusterClient, DfsIo, Hive, Presto, TeraSort, TpcdsDataset, WorkloadError, \
+    WorkloadRunner, build_workloads, parse_workload_arg
+
+TOPOLOGY = {
+    "components": {"hive": True, "presto": False},
+    "datanodes": [{"host": "datanode1"}, {"host": "datanode2"}],
+    "endpoints": {
+        "hive_server": {"host": "hive-server", "ports": {"thrift-port": 10000}},
+        "presto_server": {"host": "primary-namenode", "ports": {"port": 8080}}
+    }
+}
+
+DFSIO_OUTPUT = """----- TestDFSIO ----- : write
+            Throughput mb/sec: 52.5
+       Average IO rate mb/sec: 55.1
+        IO rate std deviation: 3.2
+           Test exec time sec: 21.7
+"""
+
+
+# Answers commands by the first matching pattern and records what was run where
+class FakeClient(ClusterClient):
+    def __init__(self, answers: dict = None):
+        self.answers = answers or {}
+        self.commands = []
+        self.queries = []
+
+    def run(self, host: str, command: str, timeout: float) -> dict:
+        self.commands.append((host, command))
+        for pattern, answer in self.answers.items():
+            if re.search(pattern, command):
+                return dict({"returncode": 0, "stdout": "", "stderr": "", "elapsed_s": 1.0}, **answer)
+        return {"returncode": 0, "stdout": "", "stderr": "", "elapsed_s": 1.0}
+
+    def url(self, endpoint: dict, port_name: str) -> str:
+        return "http://{}:{}".format(endpoint["host"], endpoint["ports"][port_name])
+
+    def presto(self, endpoint: dict, sql: str, catalog: str, schema: str, timeout: float) -> dict:
+        self.queries.append((endpoint["host"], sql, catalog, schema))
+        return {"rows": 1, "elapsed_s": 0.5, "stats": {"processedRows": 10, "processedBytes": 100, "cpuTimeMillis": 7}}
+
+
+def run(workloads: list, client: ClusterClient, topology: dict = None) -> list:
+    return WorkloadRunner(topology or TOPOLOGY, client, workloads).run()
+
+
+def test_dfsio_parses_summary_and_cleans_up():
+    client = FakeClient({"TestDFSIO -(write|read)": {"stdout": DFSIO_OUTPUT, "elapsed_s": 30.0}})
+    results = run([DfsIo(4, "128MB", 60)], client)
+
+    assert [r["name"] for r in results] == ["write", "read"]
+    assert results[0] == {"name": "write", "workload": "dfsio", "elapsed_s": 30.0, "files": 4, "size": "128MB",
+                          "throughput_mb_s": 52.5, "average_io_rate_mb_s": 55.1, "io_rate_stddev": 3.2,
+                          "exec_time_s": 21.7}
+    assert all(host == "datanode1" for host, _ in client.commands)
+    assert "TestDFSIO -clean" in client.commands[-1][1]
+
+
+def test_failed_workload_is_reported_and_the_rest_still_run():
+    client = FakeClient({"TestDFSIO -read": {"returncode": 1, "stderr": "read failed"}})
+    results = run([DfsIo(1, "1MB", 60), TeraSort(1000, 60)], client)
+
+    assert results[0]["name"] == "write"
+    assert results[1]["workload"] == "dfsio" and "read failed" in results[1]["error"]
+    # Written files are cleaned even though read failed
+    assert any("TestDFSIO -clean" in command for _, command in client.commands)
+    assert [r["name"] for r in results[2:]] == ["teragen", "terasort", "teravalidate"]
+
+
+def test_terasort_cleans_before_and_after():
+    client = FakeClient({"hadoop jar": {"elapsed_s": 2.0}})
+    results = run([TeraSort(1024 * 1024, 60)], client)
+
+    assert [r["throughput_mb_s"] for r in results] == [50.0, 50.0, 50.0]
+    commands = [command for _, command in client.commands]
+    assert commands[0].startswith("hdfs dfs -rm -r -f -skipTrash /bench/terasort")
+    assert commands[-1] == commands[0]
+
+
+def test_workloads_of_disabled_components_are_skipped():
+    dataset = TpcdsDataset(100, 60)
+    client = FakeClient()
+    results = run([Presto(dataset, 1, 60)], client)
+
+    assert results == [{"workload": "presto", "skipped": "presto not enabled"}]
+    assert client.commands == [] and client.queries == []
+
+
+def test_hive_and_presto_share_the_dataset():
+    topology = dict(TOPOLOGY, components={"hive": True, "presto": True})
+    dataset = TpcdsDataset(100, 60)
+    client = FakeClient({"beeline": {"stderr": "1 row selected (0.25 seconds)", "elapsed_s": 3.0}})
+    results = run([Hive(dataset, 2, 60), Presto(dataset, 2, 60)], client, topology)
+
+    # Loaded once, by the first workload using it
+    assert [r["name"] for r in results if r["name"] == "load"] == ["load"]
+    assert sum("CREATE TABLE bench.store_sales" in command for _, command in client.commands) == 1
+    hive = [r for r in results if r["workload"] == "hive" and r["name"] != "load"]
+    assert [r["name"] for r in hive] == list(TpcdsDataset.QUERIES)
+    assert all(r["median_s"] == 3.0 and r["query_median_s"] == 0.25 for r in hive)
+    presto = [r for r in results if r["workload"] == "presto"]
+    assert [r["name"] for r in presto] == list(TpcdsDataset.QUERIES)
+    assert presto[0]["processed_rows"] == 10 and presto[0]["median_s"] == 0.5
+    assert len(client.queries) == 2 * len(TpcdsDataset.QUERIES)
+    assert all(host == "primary-namenode" and catalog == "hive" for host, _, catalog, _ in client.queries)
+
+
+def test_unknown_workload_is_rejected():
+    args = parse_workload_arg(["--suite", "dfsio,nope"])
+    with pytest.raises(ValueError, match="nope"):
+        build_workloads(args)
+    assert [w.name for w in build_workloads(Namespace(**dict(vars(args), suite="jvm, hive")))] == ["jvm", "hive"]
+
+
+def test_unreachable_agent_fails_the_workload():
+    class Unreachable(FakeClient):
+        def run(self, host: str, command: str, timeout: float) -> dict:
+            raise WorkloadError("Agent of {} is unreachable".format(host))
+
+    results = run([TeraSort(10, 60)], Unreachable())
+    assert results == [{"workload": "terasort", "error": "Agent of datanode1 is unreachable"}]
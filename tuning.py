@@ -0,0 +1,182 @@
+from __future__ import annotations
+import math
+import os
+
+
+class TuningProfile:
+    def __init__(self, name: str, memory_fraction: float, vcore_overcommit: int, min_allocation_mb: int,
+                 map_memory_mb: int, reduce_memory_mb: int, block_size_mb: int):
+        self.name = name
+        # Share of host memory left after daemons that NodeManagers may hand out to containers
+        self.memory_fraction = memory_fraction
+        # Vcores advertised per host cpu, containers of an emulated cluster are rarely cpu bound
+        self.vcore_overcommit = vcore_overcommit
+        self.min_allocation_mb = min_allocation_mb
+        self.map_memory_mb = map_memory_mb
+        self.reduce_memory_mb = reduce_memory_mb
+        self.block_size_mb = block_size_mb
+
+
+class HostResources:
+    # Used when memory or cpus can't be detected, same as the minimum in README
+    FALLBACK_MEMORY_MB = 16384
+    FALLBACK_CPUS = 4
+
+    def __init__(self, memory_mb: int, cpus: int):
+        self.memory_mb = memory_mb
+        self.cpus = cpus
+
+    # Docker Desktop runs containers in a VM which usually has less than the host, override it in that case
+    @classmethod
+    def detect(cls, memory_mb: int = None, cpus: int = None) -> HostResources:
+        return cls(memory_mb or cls._memory_mb(), cpus or cls._cpus())
+
+    @classmethod
+    def _memory_mb(cls) -> int:
+        try:
+            return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+        except (AttributeError, ValueError, OSError):
+            return cls.FALLBACK_MEMORY_MB
+
+    @classmethod
+    def _cpus(cls) -> int:
+        if hasattr(os, "sched_getaffinity"):
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count() or cls.FALLBACK_CPUS
+
+
+# YARN/HDFS capacity settings derived from cluster shape and host resources. Every datanode container runs a
+# NodeManager on the same host, so the host is divided between them after reserving memory for the daemons, and for
+# presto JVMs when presto runs(reserved_mb)
+class Tuning:
+    PROFILES = {
+        "tiny": TuningProfile("tiny", memory_fraction=0.25, vcore_overcommit=1, min_allocation_mb=256,
+                              map_memory_mb=512, reduce_memory_mb=1024, block_size_mb=32),
+        "balanced": TuningProfile("balanced", memory_fraction=0.5, vcore_overcommit=1, min_allocation_mb=512,
+                                  map_memory_mb=1024, reduce_memory_mb=2048, block_size_mb=128),
+        "throughput": TuningProfile("throughput", memory_fraction=0.75, vcore_overcommit=2, min_allocation_mb=1024,
+                                    map_memory_mb=2048, reduce_memory_mb=4096, block_size_mb=256)
+    }
+    DEFAULT_PROFILE = "balanced"
+    # Namenodes, journalnodes, zookeepers, resource manager and history servers
+    MASTER_OVERHEAD_MB = 4096
+    # Datanode and NodeManager JVMs of each datanode container
+    WORKER_OVERHEAD_MB = 512
+    HEAP_RATIO = 0.8
+    # Spark executor heap share of its container, the rest is memoryOverhead
+    SPARK_EXECUTOR_HEAP_RATIO = 0.75
+    # Metastore opens two pools(transactional and not) against cluster-db, which hue shares and postgres allows 100
+    MAX_METASTORE_POOL_SIZE = 20
+
+    def __init__(self, profile: TuningProfile, host: HostResources, num_datanode: int, reserved_mb: int = 0):
+        self.profile = profile
+        self.host = host
+        self.num_datanode = num_datanode
+
+        min_mb = profile.min_allocation_mb
+        per_node_mb = int(max(self.budget_mb(profile, host, num_datanode) - reserved_mb, 0) / num_datanode)
+        # At least one container of minimum allocation per NodeManager, even when the host is overcommitted
+        self.nodemanager_memory_mb = max(per_node_mb // min_mb * min_mb, min_mb)
+        self.nodemanager_vcores = max(host.cpus * profile.vcore_overcommit // num_datanode, 1)
+        self.scheduler_min_mb = min_mb
+        self.scheduler_max_mb = self.nodemanager_memory_mb
+        self.scheduler_max_vcores = self.nodemanager_vcores
+        self.map_memory_mb = self._container_mb(profile.map_memory_mb)
+        self.reduce_memory_mb = self._container_mb(profile.reduce_memory_mb)
+        # Rule of thumb of 20 * ln(number of datanodes)
+        self.namenode_handler_count = max(int(20 * math.log(num_datanode)), 10)
+        self.replication = min(3, num_datanode)
+        self.block_size = profile.block_size_mb * 1024 * 1024
+        # Spark executors take containers of reduce size, so dynamic allocation can't ask for more than the cluster holds
+        self.spark_executor_memory_mb = int(self.reduce_memory_mb * self.SPARK_EXECUTOR_HEAP_RATIO)
+        self.spark_executor_overhead_mb = self.reduce_memory_mb - self.spark_executor_memory_mb
+        self.spark_max_executors = max(self.nodemanager_memory_mb // self.reduce_memory_mb, 1) * num_datanode
+        # Queries HiveServer2 runs at once are bound by map containers the cluster holds, sessions can be more
+        self.hive_async_exec_threads = max(self.nodemanager_memory_mb // self.map_memory_mb * num_datanode, 4)
+        self.hive_thrift_max_worker_threads = max(self.hive_async_exec_threads * 4, 20)
+        self.hive_metastore_pool_size = min(max(self.hive_async_exec_threads, 10), self.MAX_METASTORE_POOL_SIZE)
+
+    # Memory the profile hands out to NodeManagers and presto JVMs together, once daemons are reserved
+    @classmethod
+    def budget_mb(cls, profile: TuningProfile, host: HostResources, num_datanode: int) -> int:
+        available_mb = host.memory_mb - cls.MASTER_OVERHEAD_MB - cls.WORKER_OVERHEAD_MB * num_datanode
+        return int(max(available_mb, 0) * profile.memory_fraction)
+
+    def _container_mb(self, wanted_mb: int) -> int:
+        # Multiple of minimum allocation which still fits in a NodeManager
+        min_mb = self.scheduler_min_mb
+        return max(min(wanted_mb, self.nodemanager_memory_mb) // min_mb * min_mb, min_mb)
+
+    def _heap(self, container_mb: int) -> str:
+        return "-Xmx{}m".format(int(container_mb * self.HEAP_RATIO))
+
+    def data(self) -> dict:
+        return {
+            "profile": self.profile.name,
+            "nodemanager-memory-mb": str(self.nodemanager_memory_mb),
+            "nodemanager-vcores": str(self.nodemanager_vcores),
+            "scheduler-min-mb": str(self.scheduler_min_mb),
+            "scheduler-max-mb": str(self.scheduler_max_mb),
+            "scheduler-max-vcores": str(self.scheduler_max_vcores),
+            "map-memory-mb": str(self.map_memory_mb),
+            "map-java-opts": self._heap(self.map_memory_mb),
+            "reduce-memory-mb": str(self.reduce_memory_mb),
+            "reduce-java-opts": self._heap(self.reduce_memory_mb),
+            "am-memory-mb": str(self.map_memory_mb),
+            "am-java-opts": self._heap(self.map_memory_mb),
+            "namenode-handler-count": str(self.namenode_handler_count),
+            "replication": str(self.replication),
+            "block-size": str(self.block_size),
+            "spark-executor-memory": "{}m".format(self.spark_executor_memory_mb),
+            "spark-executor-memory-overhead": "{}m".format(self.spark_executor_overhead_mb),
+            "spark-max-executors": str(self.spark_max_executors),
+            "hive-async-exec-threads": str(self.hive_async_exec_threads),
+            "hive-thrift-max-worker-threads": str(self.hive_thrift_max_worker_threads),
+            "hive-metastore-pool-size": str(self.hive_metastore_pool_size)
+        }
+
+
+# Presto memory and concurrency from number of workers and memory budget of each presto JVM. Workers share containers
+# and host with datanodes, so by default the coordinator, every worker and every NodeManager get an equal slice of what
+# the profile hands out. Heaps of presto JVMs are taken out of it before NodeManagers are sized(reserved_mb)
+class PrestoTuning:
+    MIN_HEAP_MB = 1024
+    # Fractions of heap, user + system memory(total) plus headroom must stay below heap
+    USER_MEMORY_RATIO = 0.4
+    TOTAL_MEMORY_RATIO = 0.5
+    HEADROOM_RATIO = 0.3
+    SPILL_PER_NODE_MB = 10240
+
+    def __init__(self, profile: TuningProfile, host: HostResources, num_worker: int, num_datanode: int,
+                 heap_mb: int = None):
+        self.profile = profile
+        self.host = host
+        self.num_worker = num_worker
+        budget_mb = Tuning.budget_mb(profile, host, num_datanode)
+        default_heap_mb = int(budget_mb / (num_datanode + num_worker + 1)) // 256 * 256
+        self.heap_mb = heap_mb or max(default_heap_mb, self.MIN_HEAP_MB)
+        # Coordinator gets the same heap as a worker
+        self.reserved_mb = self.heap_mb * (num_worker + 1)
+        self.user_memory_per_node_mb = int(self.heap_mb * self.USER_MEMORY_RATIO)
+        self.total_memory_per_node_mb = int(self.heap_mb * self.TOTAL_MEMORY_RATIO)
+        self.headroom_mb = int(self.heap_mb * self.HEADROOM_RATIO)
+        cpus_per_worker = max(host.cpus // num_worker, 1)
+        # Has to be a power of two
+        self.task_concurrency = 2 ** int(math.log2(cpus_per_worker))
+        # JVM sees every cpu of host, which would start far more threads than a worker gets
+        self.max_worker_threads = max(cpus_per_worker * 2, 4)
+
+    def data(self) -> dict:
+        return {
+            "heap": "{}M".format(self.heap_mb),
+            "query-max-memory": "{}MB".format(self.user_memory_per_node_mb * self.num_worker),
+            "query-max-total-memory": "{}MB".format(self.total_memory_per_node_mb * self.num_worker),
+            "query-max-memory-per-node": "{}MB".format(self.user_memory_per_node_mb),
+            "query-max-total-memory-per-node": "{}MB".format(self.total_memory_per_node_mb),
+            "heap-headroom-per-node": "{}MB".format(self.headroom_mb),
+            "task-concurrency": str(self.task_concurrency),
+            "task-max-worker-threads": str(self.max_worker_threads),
+            "spill-path": "/var/presto/spill",
+            "max-spill-per-node": "{}MB".format(self.SPILL_PER_NODE_MB),
+            "query-max-spill-per-node": "{}MB".format(self.SPILL_PER_NODE_MB // 2)
+        }
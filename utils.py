@@ -3,11 +3,15 @@ import time
 import hashlib
 import uuid
 import random
-import collections
-from component import DownloadRequired, DecompressRequired, FilesCopyRequired, TemplateRequired
+import collections.abc
+from contextlib import nullcontext
+from typing import Callable, Iterable, Tuple
+from component import DownloadRequired, DecompressRequired, FilesCopyRequired, ImageBuildRequired, TemplateRequired, \
+    Stage
 from pathlib import Path
-from jinja2 import Environment, StrictUndefined
 from constants import HasConstants
+from profiler import Profiler
+from store import BinaryStore
 import os
 
 
@@ -23,7 +27,7 @@ class DictUtil:
     def dict_merge(cls, dct, merge_dct):
         for k, v in merge_dct.items():
             if (k in dct and isinstance(dct[k], dict)
-                    and isinstance(merge_dct[k], collections.Mapping)):
+                    and isinstance(merge_dct[k], collections.abc.Mapping)):
                 cls.dict_merge(dct[k], merge_dct[k])
             else:
                 dct[k] = merge_dct[k]
@@ -33,7 +37,8 @@ class CopyUtil:
     @staticmethod
     def copy_all(copiables: list[FilesCopyRequired]):
         for copiable in copiables:
-            copiable.copy()
+            with Profiler.current().phase("copy", type(copiable).__name__):
+                copiable.copy()
 
 
 class DownloadUtil:
@@ -41,44 +46,41 @@ class DownloadUtil:
     def download_all(downloadables: list[DownloadRequired]):
         awaitables = []
         for downloadable in downloadables:
-            new_awaitables = downloadable.download_async()
+            with Profiler.current().scope("download", type(downloadable).__name__):
+                new_awaitables = downloadable.download_async()
             for awaitable in new_awaitables:
                 awaitable.start()
             awaitables += new_awaitables
-        for awaitable in awaitables:
-            awaitable.join()
+        Stage.join_all(awaitables)
 
 
 class DecompressUtil:
     @staticmethod
-    def decompress_all(decompressables: list[DecompressRequired]) -> None:
+    def decompress_all(decompressables: list[DecompressRequired], copy_config_dirs: bool = True) -> None:
         awaitables = []
         for decompressable in decompressables:
-            new_awaitables = decompressable.decompress_async()
+            with Profiler.current().scope("decompress", type(decompressable).__name__):
+                new_awaitables = decompressable.decompress_async()
             for awaitable in new_awaitables:
                 awaitable.start()
             awaitables += new_awaitables
 
-        for awaitable in awaitables:
-            awaitable.join()
+        Stage.join_all(awaitables)
+        for decompressable in decompressables if copy_config_dirs else []:
+            decompressable.copy_config_dirs()
 
 
 class TemplateUtil(HasConstants):
     @classmethod
-    def do_template(cls, hasTemplate: list[TemplateRequired]) -> None:
-        agg_data = {
-            "clusterName": cls.CLUSTER_NAME
-        }
-
-        for c in hasTemplate:
-            DictUtil.dict_merge(agg_data, c.data)
-
+    def do_template(cls, hasTemplate: list[TemplateRequired], data: dict) -> None:
         engine = cls
         for c in hasTemplate:
-            c.do_template(engine, agg_data)
+            with Profiler.current().phase("template", type(c).__name__):
+                c.do_template(engine, data)
 
     @classmethod
     def render(cls, template_path: Path, data: dict) -> str:
+        from jinja2 import Environment, StrictUndefined  # Deferred, it is slow to import
         print("Rendering {}".format(template_path))
         env = Environment(autoescape=False)
         env.undefined = StrictUndefined
@@ -96,8 +98,123 @@ class TemplateUtil(HasConstants):
         return obj.values()
 
 
+# Downloads then decompresses one component, so its extraction starts as soon as its own download is done
+class StageChain(Stage):
+    def __init__(self, component, copy_config_dirs: bool = True):
+        super().__init__(self.chain, component, copy_config_dirs)
+
+    @staticmethod
+    def chain(component, copy_config_dirs: bool) -> None:
+        # Download is skipped for a release in the store, which must stay there until it is materialized
+        with BinaryStore().shared() if component.store_release else nullcontext():
+            if isinstance(component, DownloadRequired):
+                DownloadUtil.download_all([component])
+            if isinstance(component, DecompressRequired):
+                DecompressUtil.decompress_all([component], copy_config_dirs)
+
+
+class PipelineUtil:
+    # Runs download -> decompress of each component in background while copy, template and after_render(compose)
+    # run right away. Files landing inside an extracted directory are written once their component is extracted,
+    # otherwise extraction would be skipped as the directory exists, or the tarball would overwrite them
+    @classmethod
+    def run_all(cls, components: list, data: dict, after_render: Callable[[], None]) -> None:
+        chains = {}
+        for component in components:
+            if isinstance(component, (DownloadRequired, DecompressRequired)):
+                chains[component] = StageChain(component)
+                chains[component].start()
+
+        profiler = Profiler.current()
+        deferred = []
+        for component in components:
+            name = type(component).__name__
+            extracted = component.decompressed_dirs if isinstance(component, DecompressRequired) else []
+            copy_later, rendered_later = [], []
+            if isinstance(component, FilesCopyRequired):
+                with profiler.phase("copy", name):
+                    copy_now, copy_later = cls._split(component.files_to_copy,
+                                                      lambda f: component.get_dest(str(f)), extracted)
+                    component.copy_files(copy_now)
+            if isinstance(component, TemplateRequired):
+                with profiler.phase("template", name):
+                    rendered_now, rendered_later = cls._split(component.render_templates(TemplateUtil, data),
+                                                              lambda r: r[0], extracted)
+                    TemplateRequired.write_rendered(rendered_now)
+            if copy_later or rendered_later:
+                deferred.append((component, copy_later, rendered_later))
+
+        after_render()
+
+        # Files deferred into extracted directories are not written over a failed or partial extraction
+        Stage.join_all(list(chains.values()))
+        for component, copy_later, rendered_later in deferred:
+            name = type(component).__name__
+            if copy_later:
+                with profiler.phase("copy", name):
+                    component.copy_files(copy_later)
+            if rendered_later:
+                with profiler.phase("template", name):
+                    TemplateRequired.write_rendered(rendered_later)
+
+    @staticmethod
+    def _split(items: Iterable, dest_of: Callable, dirs: list[Path]) -> Tuple[list, list]:
+        now, later = [], []
+        for item in items:
+            dest = dest_of(item)
+            (later if any(d == dest or d in dest.parents for d in dirs) else now).append(item)
+        return now, later
+
+
+class PrefetchUtil:
+    # Downloads and decompresses binaries of components of several targets(--matrix) at once, each tarball only once.
+    # Config dirs are copied when each target is generated
+    @staticmethod
+    def prefetch_all(components: list) -> None:
+        unique = {}
+        for component in components:
+            if isinstance(component, DecompressRequired):
+                unique.setdefault(tuple(component.files_to_decompress), component)
+        chains = [StageChain(component, copy_config_dirs=False) for component in unique.values()]
+        for chain in chains:
+            chain.start()
+        Stage.join_all(chains)
+
+
+class ImageUtil(HasConstants):
+    BUILD_PLAN = os.path.join("bin", "build-plan.txt")
+
+    # Writes image, tag and context of every image to build, bin/builder.sh reads it to skip images already built
+    @classmethod
+    def write_build_plan(cls, components: list) -> Path:
+        lines = ["# name image tag context"]
+        for component in filter(lambda c: isinstance(c, ImageBuildRequired), components):
+            name = Path(component.component_base_dir).name
+            with Profiler.current().phase("image_hash", type(component).__name__):
+                lines.append("{} {} {} {}".format(name, component.image_name, component.content_hash,
+                                                  component.build_context.relative_to(cls.TARGET_BASE_PATH)))
+        plan = Path(cls.TARGET_BASE_PATH, cls.BUILD_PLAN)
+        plan.parent.mkdir(parents=True, exist_ok=True)
+        plan.write_text("\n".join(lines) + "\n")
+        return plan
+
+
 class FileUtil(HasConstants):
     @classmethod
     def write_to_target(cls, relative_path, content):
         with open(os.path.join(cls.TARGET_BASE_PATH, relative_path), 'w') as f:
             f.write(content)
+
+    @staticmethod
+    def outputs_of(components: list) -> list[Path]:
+        outputs = []
+        for component in components:
+            if isinstance(component, FilesCopyRequired):
+                outputs += [component.get_dest(str(f)) for f in component.files_to_copy]
+            if isinstance(component, TemplateRequired):
+                outputs += [Path(os.path.splitext(component.get_dest(str(f)))[0]) for f in component.template_files]
+            if isinstance(component, DecompressRequired):
+                # Extracted trees are intact as long as their marker is
+                outputs += [dest / component.EXTRACTED_MARKER for _, dest in component.files_to_decompress]
+                outputs += [dest for _, dest in component.config_dirs]
+        return outputs